@@ -2,6 +2,9 @@
 ASGI config for flaky_fantasy_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests for ``EVENTS_PATH`` go to the Server-Sent Events stream, which runs
+natively on the event loop so idle connections don't each hold a thread;
+everything else is handled by Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -9,8 +12,20 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flaky_fantasy_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from flaky_fantasy_backend_api.events import EventStreamApp  # noqa: E402 (needs apps loaded)
+
+event_stream = EventStreamApp()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == settings.EVENTS_PATH:
+        await event_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
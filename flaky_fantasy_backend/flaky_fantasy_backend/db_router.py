@@ -0,0 +1,86 @@
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+
+# Set per request by ReplicaRoutingMiddleware; reads only go to a replica
+# while this is True, so commands, the admin and writes stay on the primary.
+replica_reads_allowed = ContextVar('replica_reads_allowed', default=False)
+
+_down_until = {}
+_lock = threading.Lock()
+_cycle = None
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def mark_replica_down(alias):
+    retry_after = getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+    with _lock:
+        _down_until[alias] = time.monotonic() + retry_after
+
+
+def _is_up(alias):
+    until = _down_until.get(alias)
+    if until is None:
+        return True
+    if time.monotonic() >= until:
+        with _lock:
+            _down_until.pop(alias, None)
+        return True
+    return False
+
+
+def _next_replicas():
+    """Round-robin order of replicas for this read, starting at the next one."""
+    global _cycle
+    aliases = replica_aliases()
+    with _lock:
+        if _cycle is None or _cycle[0] != aliases:
+            _cycle = (aliases, itertools.cycle(range(len(aliases))))
+        start = next(_cycle[1])
+    return aliases[start:] + aliases[:start]
+
+
+def choose_replica():
+    for alias in _next_replicas():
+        if not _is_up(alias):
+            continue
+        try:
+            # No-op when the persistent connection is already open
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            mark_replica_down(alias)
+            continue
+        return alias
+    return None
+
+
+class ReplicaRouter:
+    """
+    Sends reads to ``settings.DATABASE_REPLICAS`` when the current request
+    allows it, falling back to the primary if no replica is reachable.
+    Writes, migrations and anything inside a transaction use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not replica_reads_allowed.get() or not replica_aliases():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return choose_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
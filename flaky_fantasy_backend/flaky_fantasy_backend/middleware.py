@@ -1,3 +1,13 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .db_router import replica_reads_allowed
+
+
 class CrossOriginResourcePolicyMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -7,4 +17,71 @@ class CrossOriginResourcePolicyMiddleware:
         if request.path.startswith('/media/'):
             response['Cross-Origin-Resource-Policy'] = 'cross-origin'
             response['Access-Control-Allow-Origin'] = 'https://flakyfantasy.com'
-        return response
\ No newline at end of file
+            # Content-addressed blobs never change behind a URL
+            if request.path.startswith('/media/blobs/') and response.status_code == 200:
+                response['Cache-Control'] = 'public, max-age=31536000, immutable'
+            # Catalog snapshot files are named by content; only the manifest changes
+            elif request.path.startswith('/media/catalog/') and response.status_code == 200:
+                if request.path.endswith('/manifest.json'):
+                    response['Cache-Control'] = 'no-cache'
+                else:
+                    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+class ReplicaRoutingMiddleware:
+    # Lets safe API reads use a read replica, except for clients that wrote
+    # within the last REPLICA_STICKY_SECONDS, who stay on the primary so they
+    # always see their own changes despite replication lag
+    cookie_name = 'ff_db_pin'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in self.safe_methods
+        token = replica_reads_allowed.set(safe and self.replica_eligible(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads_allowed.reset(token)
+        # Views that only read despite the method (e.g. an all-GET batch) set
+        # replica_pin_exempt; rejected requests are taken to have written nothing
+        if (
+            not safe and response.status_code < 400 and settings.DATABASE_REPLICAS
+            and not getattr(request, 'replica_pin_exempt', False)
+        ):
+            self.pin(request, response, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+        return response
+
+    @classmethod
+    def replica_eligible(cls, request):
+        return (
+            bool(getattr(settings, 'DATABASE_REPLICAS', None))
+            and request.path.startswith(getattr(settings, 'REPLICA_PATH_PREFIX', '/api/'))
+            and not cls.is_pinned(request)
+        )
+
+    @classmethod
+    def client_key(cls, request):
+        # JWT clients often drop cookies, so also pin by token server-side. Anonymous
+        # clients are pinned by IP, taken from X-Forwarded-For as DRF does for
+        # throttling; REMOTE_ADDR is the proxy's and would pin everyone.
+        ident = request.META.get('HTTP_AUTHORIZATION') or BaseThrottle().get_ident(request) or ''
+        return 'db-pin:' + hashlib.sha1(ident.encode()).hexdigest()
+
+    @classmethod
+    def is_pinned(cls, request):
+        try:
+            if float(request.COOKIES.get(cls.cookie_name, 0)) > time.time():
+                return True
+        except ValueError:
+            pass
+        return caches['replica_pins'].get(cls.client_key(request)) is not None
+
+    def pin(self, request, response, seconds):
+        caches['replica_pins'].set(self.client_key(request), 1, seconds)
+        response.set_cookie(
+            self.cookie_name, str(time.time() + seconds), max_age=seconds,
+            httponly=True, samesite='Lax', secure=request.is_secure(),
+        )
@@ -1,5 +1,6 @@
 import os
 import re
+import tempfile
 from dotenv import load_dotenv
 from datetime import timedelta
 
@@ -29,6 +30,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'flaky_fantasy_backend.middleware.CrossOriginResourcePolicyMiddleware',
+    'flaky_fantasy_backend.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -112,6 +114,50 @@ DATABASES = {
     }
 }
 
+# Local profiling and benchmarks can run against SQLite without a Postgres server
+if os.getenv('USE_SQLITE', 'False') == 'True':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+
+# Read replicas: comma-separated hosts sharing the primary's credentials, or a
+# second SQLite file for local testing. Safe API reads are spread across them.
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('PGREPLICA_HOSTS', '').split(','))):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host.strip()}
+    DATABASE_REPLICAS.append(alias)
+if os.getenv('USE_SQLITE', 'False') == 'True' and os.getenv('SQLITE_REPLICA_PATH'):
+    DATABASES['replica1'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('SQLITE_REPLICA_PATH'),
+    }
+    DATABASE_REPLICAS = ['replica1']
+DATABASE_ROUTERS = ['flaky_fantasy_backend.db_router.ReplicaRouter']
+# After a write, that client's reads stay on the primary for this long
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+# How long a replica that failed to connect is skipped
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+
+# Read-your-writes pins must be seen by every worker, so they are not kept in the
+# per-process default cache. The default directory is shared by the workers on
+# one host; with several app hosts point this at Redis or Memcached instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'replica_pins': {
+        'BACKEND': os.getenv('REPLICA_PIN_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('REPLICA_PIN_CACHE_LOCATION') or os.path.join(
+            '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'flaky-fantasy-replica-pins',
+        ),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('REPLICA_PIN_CACHE_MAX_ENTRIES', '10000'))},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',},
@@ -137,9 +183,36 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 1000
+    'PAGE_SIZE': 1000,
+    # Counters live in shared memory (throttling.SharedBuckets), one limit per
+    # client across all worker processes
+    'DEFAULT_THROTTLE_CLASSES': [
+        'flaky_fantasy_backend_api.throttling.AnonThrottle',
+        'flaky_fantasy_backend_api.throttling.AnonWriteThrottle',
+        'flaky_fantasy_backend_api.throttling.UserThrottle',
+        'flaky_fantasy_backend_api.throttling.RouteThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.getenv('THROTTLE_ANON_RATE', '600/min'),
+        'anon_write': os.getenv('THROTTLE_ANON_WRITE_RATE', '30/min'),
+        'user': os.getenv('THROTTLE_USER_RATE', '3000/min'),
+        # Per-route scopes, set with throttle_scope on the view or action
+        'login': '10/min',
+        'login_username': '5/min',
+        'batch': '120/min',
+        'quote': '300/min',
+        'export': '10/hour',
+    },
+    # Client IPs come from X-Forwarded-For as added by this many proxies in front of us
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '1')),
 }
 
+# Rate limiting: set THROTTLE_ENABLED=False to switch it off (benchmarks do);
+# the shared counter file defaults to /dev/shm/flaky-fantasy-throttle
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'True') == 'True'
+THROTTLE_STATE_PATH = os.getenv('THROTTLE_STATE_PATH')
+THROTTLE_SLOTS = int(os.getenv('THROTTLE_SLOTS', '65536'))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -150,6 +223,81 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Low-stock alerts: fallback threshold when neither product nor category sets one,
+# and how long to suppress repeat alerts for the same product
+LOW_STOCK_THRESHOLD = int(os.getenv('LOW_STOCK_THRESHOLD', '5'))
+LOW_STOCK_ALERT_WINDOW = timedelta(hours=int(os.getenv('LOW_STOCK_ALERT_WINDOW_HOURS', '24')))
+
+# Retention: finished orders older than this move to the archive tables, read
+# notifications older than the TTL are deleted, both in batches of this size
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', '365'))
+NOTIFICATION_TTL_DAYS = int(os.getenv('NOTIFICATION_TTL_DAYS', '90'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+
+# Delta sync (`changes` endpoints): rows per page, how far behind "now" the cursor
+# stops so late-committing writes are not skipped, and how long tombstones are kept
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', '500'))
+SYNC_SETTLE_SECONDS = int(os.getenv('SYNC_SETTLE_SECONDS', '5'))
+TOMBSTONE_TTL_DAYS = int(os.getenv('TOMBSTONE_TTL_DAYS', '30'))
+
+# Order lookup (?search= on /api/orders/): shortest term matched by prefix rather
+# than exactly, and the name similarity cut-off for the SQLite fallback (pg_trgm's default)
+ORDER_LOOKUP_MIN_PREFIX = int(os.getenv('ORDER_LOOKUP_MIN_PREFIX', '3'))
+ORDER_LOOKUP_SIMILARITY = float(os.getenv('ORDER_LOOKUP_SIMILARITY', '0.3'))
+
+# Inventory ledger: movements per POST to /api/stock-movements/, and how old a
+# movement must be before snapshot_stock folds it into a snapshot
+STOCK_MOVEMENT_MAX_BATCH = int(os.getenv('STOCK_MOVEMENT_MAX_BATCH', '1000'))
+INVENTORY_SNAPSHOT_LAG = int(os.getenv('INVENTORY_SNAPSHOT_LAG', '300'))
+
+# build_recommendations: related products kept per product, the fewest shared
+# orders a pair needs to be recommended, and how old an order must be before
+# a run counts it
+RECOMMENDATIONS_TOP_K = int(os.getenv('RECOMMENDATIONS_TOP_K', '10'))
+RECOMMENDATIONS_MIN_ORDERS = int(os.getenv('RECOMMENDATIONS_MIN_ORDERS', '1'))
+RECOMMENDATIONS_LAG = int(os.getenv('RECOMMENDATIONS_LAG', '300'))
+
+# /api/autocomplete/: how often a process checks for catalog changes made
+# elsewhere, how often it rebuilds (refreshing popularity), and the window
+# popularity is counted over
+AUTOCOMPLETE_CHECK_SECONDS = float(os.getenv('AUTOCOMPLETE_CHECK_SECONDS', '5'))
+AUTOCOMPLETE_REBUILD_SECONDS = int(os.getenv('AUTOCOMPLETE_REBUILD_SECONDS', '600'))
+AUTOCOMPLETE_POPULARITY_DAYS = int(os.getenv('AUTOCOMPLETE_POPULARITY_DAYS', '90'))
+
+# /api/batch/: sub-requests per call and threads running a batch's reads concurrently
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '20'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+
+# /api/cart/quote/: lines per cart and how long a quote is reused for the same
+# cart and code (the default cache is per process unless CACHES says otherwise)
+CART_MAX_LINES = int(os.getenv('CART_MAX_LINES', '100'))
+CART_QUOTE_TTL = int(os.getenv('CART_QUOTE_TTL', '30'))
+
+# collect_media: how old an unreferenced file must be before it is quarantined,
+# how long it stays quarantined before deletion, where the quarantine is (on
+# MEDIA_ROOT's filesystem moves are renames) and the directory scanning threads
+MEDIA_GC_GRACE_SECONDS = int(os.getenv('MEDIA_GC_GRACE_SECONDS', '3600'))
+MEDIA_QUARANTINE_SECONDS = int(os.getenv('MEDIA_QUARANTINE_SECONDS', str(7 * 24 * 3600)))
+MEDIA_QUARANTINE_ROOT = os.getenv('MEDIA_QUARANTINE_ROOT', os.path.join(MEDIA_ROOT, '.quarantine'))
+MEDIA_GC_WORKERS = int(os.getenv('MEDIA_GC_WORKERS', '8'))
+
+# Static catalog snapshot (build_catalog): where it is written, how many product
+# shards, and how long files dropped from the manifest stay for in-flight clients
+CATALOG_SNAPSHOT_ROOT = os.getenv('CATALOG_SNAPSHOT_ROOT', os.path.join(MEDIA_ROOT, 'catalog'))
+CATALOG_SHARDS = int(os.getenv('CATALOG_SHARDS', '16'))
+CATALOG_GRACE_SECONDS = int(os.getenv('CATALOG_GRACE_SECONDS', '3600'))
+
+# Server-Sent Events for staff dashboards (served by asgi.py): one shared poll per
+# process, the events kept for Last-Event-ID resumes, per-connection limits, and
+# the longest a gap in a table's ids (a rollback, or an insert still committing)
+# holds back that table's later events
+EVENTS_PATH = '/api/events/'
+EVENTS_POLL_SECONDS = float(os.getenv('EVENTS_POLL_SECONDS', '1'))
+EVENTS_BUFFER_SIZE = int(os.getenv('EVENTS_BUFFER_SIZE', '1000'))
+EVENTS_MAX_QUEUE = int(os.getenv('EVENTS_MAX_QUEUE', '100'))
+EVENTS_KEEPALIVE_SECONDS = int(os.getenv('EVENTS_KEEPALIVE_SECONDS', '15'))
+EVENTS_SETTLE_SECONDS = float(os.getenv('EVENTS_SETTLE_SECONDS', '2'))
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'no-reply@flakyfantasy.com'
 AUTH_USER_MODEL = 'flaky_fantasy_backend_api.AdminUser'
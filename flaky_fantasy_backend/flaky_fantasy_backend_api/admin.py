@@ -1,22 +1,161 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Prefetch
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django import forms
 from django.forms.models import BaseInlineFormSet
 from .models import (
     AdminUser, Category, ProductLabel, Product, ProductImage,
-    DiscountCode, ProductDiscount, Order, OrderItem, Service, Notification
+    DiscountCode, ProductDiscount, Order, OrderItem, Service, Notification,
+    OrderStatusHistory, ArchivedOrder, StockMovement
 )
+from .inventory import OPENING_NOTE, set_stock
+from .order_lookup import lookup_orders
+from .thumbnails import thumbnail_url
 
 from django.contrib.auth.admin import UserAdmin
 admin.site.register(AdminUser, UserAdmin)
-admin.site.register(Category)
-admin.site.register(ProductLabel)
 admin.site.register(DiscountCode)
-admin.site.register(ProductDiscount)
-admin.site.register(Order)
-admin.site.register(OrderItem)
 admin.site.register(Service)
-admin.site.register(Notification)
+
+# Paginator that trusts the planner's row estimate for big unfiltered tables
+# instead of running COUNT(*) over millions of rows on every changelist
+class EstimatedCountPaginator(Paginator):
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            connection = connections[self.object_list.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                        [self.object_list.model._meta.db_table],
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] >= self.estimate_threshold:
+                    return row[0]
+        return super().count
+
+# Shared settings for changelists over tables that grow without bound
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'low_stock_threshold', 'created_at')
+    search_fields = ('name',)
+
+@admin.register(ProductLabel)
+class ProductLabelAdmin(admin.ModelAdmin):
+    list_display = ('name', 'color')
+    search_fields = ('name',)
+
+@admin.register(ProductDiscount)
+class ProductDiscountAdmin(LargeTableAdmin):
+    list_display = ('product_name', 'discount_type', 'value', 'start_date', 'end_date', 'is_active')
+    list_filter = ('is_active', 'discount_type')
+    list_select_related = ('product',)
+    autocomplete_fields = ('product',)
+
+    def product_name(self, obj):
+        return obj.product.name
+    product_name.short_description = 'Product'
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ('product',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('order_number', 'customer_name', 'customer_email', 'status', 'total_amount', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('order_number', 'customer_email', 'customer_phone', 'customer_name')
+    ordering = ('-created_at',)
+    inlines = [OrderItemInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        # Uses the normalized lookup indexes instead of ILIKE scans
+        if not search_term.strip():
+            return queryset, False
+        return lookup_orders(queryset, search_term), False
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'order_number', 'product_name', 'quantity', 'price_at_purchase')
+    list_select_related = ('order', 'product')
+    raw_id_fields = ('order', 'product')
+    search_fields = ('=order__order_number',)
+
+    def order_number(self, obj):
+        return obj.order.order_number
+    order_number.short_description = 'Order'
+
+    def product_name(self, obj):
+        return obj.product.name if obj.product else 'Deleted Product'
+    product_name.short_description = 'Product'
+
+@admin.register(OrderStatusHistory)
+class OrderStatusHistoryAdmin(LargeTableAdmin):
+    list_display = ('order_id', 'from_status', 'to_status', 'changed_by', 'changed_at')
+    list_filter = ('to_status',)
+    list_select_related = ('changed_by',)
+    raw_id_fields = ('order', 'changed_by')
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ('title', 'recipient', 'notification_type', 'is_read', 'created_at')
+    list_filter = ('notification_type', 'is_read')
+    list_select_related = ('recipient',)
+    raw_id_fields = ('recipient', 'related_order', 'related_product')
+    ordering = ('-id',)
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(LargeTableAdmin):
+    list_display = ('order_number', 'customer_name', 'customer_email', 'status', 'total_amount', 'created_at', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('order_number',)
+    ordering = ('-created_at',)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(order_number=term), False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(StockMovement)
+class StockMovementAdmin(LargeTableAdmin):
+    # The ledger is append-only; stock is changed from the product form or the API
+    list_display = ('product_id', 'kind', 'quantity', 'order_id', 'created_by', 'note', 'created_at')
+    list_filter = ('kind',)
+    list_select_related = ('created_by',)
+    raw_id_fields = ('product', 'order', 'created_by')
+    ordering = ('-id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 # Custom formset to validate image count
 class ProductImageFormSet(BaseInlineFormSet):
@@ -47,43 +186,81 @@ class ProductImageInline(admin.TabularInline):
 
     def image_preview(self, obj):
         if obj.id and obj.image:
-            return format_html('<img src="{}" width="100" height="100" />'.format(obj.image.url))
+            # A single product's images; the original will do until the thumbnail exists
+            url = thumbnail_url(obj.image, 100) or obj.image.url
+            return format_html('<img src="{}" width="100" height="100" />', url)
         return "Upload an image"
     image_preview.short_description = 'Preview'
 
+# stock_quantity is read-only here; a new level is recorded in the ledger as an adjustment
+class ProductAdminForm(forms.ModelForm):
+    set_stock_to = forms.IntegerField(
+        min_value=0, required=False, help_text='Recorded in the inventory ledger as an adjustment.'
+    )
+
+    class Meta:
+        model = Product
+        fields = '__all__'
+
 # Custom Product admin with image upload in the same form
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price', 'stock_quantity', 'in_stock', 'created_at')
-    list_filter = ('category', 'in_stock', 'labels')
+class ProductAdmin(LargeTableAdmin):
+    form = ProductAdminForm
+    list_display = ('thumbnail', 'name', 'category', 'price', 'stock_quantity', 'in_stock', 'created_at')
+    list_display_links = ('name',)
+    list_filter = ('in_stock', 'category', 'labels')
+    list_select_related = ('category',)
     search_fields = ('name', 'description')
+    autocomplete_fields = ('category',)
+    ordering = ('-created_at',)
     inlines = [ProductImageInline]
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'description', 'price', 'category')
         }),
         ('Inventory', {
-            'fields': ('stock_quantity', 'labels')
+            'fields': ('stock_quantity', 'set_stock_to', 'low_stock_threshold', 'labels')
         }),
     )
-    
+    readonly_fields = ('stock_quantity',)
+
+    def get_queryset(self, request):
+        # One extra query for the page's primary images instead of one per row
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True), to_attr='primary_images')
+        )
+
+    def thumbnail(self, obj):
+        # Thumbnails are made when images are saved (and by build_thumbnails), never here
+        images = getattr(obj, 'primary_images', None)
+        if not images:
+            return ""
+        url = thumbnail_url(images[0].image, 50)
+        if url is None:
+            return format_html('<span title="{}">No preview</span>', images[0].image.name)
+        return format_html('<img src="{}" width="50" height="50" />', url)
+    thumbnail.short_description = 'Image'
+
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
-        
-        # Ensure at least one image is marked as primary
-        if obj.pk:  # Only if the product is saved
-            images = obj.images.all()
-            if images and not images.filter(is_primary=True).exists():
-                # If no primary image is set, make the first one primary
-                first_image = images.first()
-                if first_image:
-                    first_image.is_primary = True
-                    first_image.save()
-    
+        stock = form.cleaned_data.get('set_stock_to')
+        if stock is not None:
+            set_stock(obj, stock, request.user, note='Admin edit' if change else OPENING_NOTE)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+
+        # Ensure at least one image is marked as primary, once the inline images exist
+        images = form.instance.images.all()
+        if not images.filter(is_primary=True).exists():
+            first_id = images.order_by('pk').values_list('pk', flat=True).first()
+            if first_id:
+                ProductImage.objects.filter(pk=first_id).update(is_primary=True)
+
     def save_formset(self, request, form, formset, change):
         instances = formset.save(commit=False)
         for instance in instances:
             if isinstance(instance, ProductImage) and not instance.pk:
                 instance.product = form.instance  # Set the product for new images
             instance.save()
-        formset.save_m2m()
\ No newline at end of file
+        formset.save_m2m()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FlakyFantasyBackendApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flaky_fantasy_backend_api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
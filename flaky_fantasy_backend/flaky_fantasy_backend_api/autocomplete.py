@@ -0,0 +1,302 @@
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import Category, Order, OrderItem, Product, ProductLabel, Tombstone
+from .normalize import normalize_name
+from .sync import after, tombstone_label
+
+logger = logging.getLogger(__name__)
+
+# Highest code point, so word + PREFIX_END sorts after every token starting with word
+PREFIX_END = '\U0010ffff'
+MAX_LIMIT = 20
+INDEXED_MODELS = (Product, Category, ProductLabel)
+
+
+class PrefixIndex:
+    """
+    Names of one kind of object, searchable by word prefix. Each token keeps
+    its entries in rank order, so the best N for a prefix come from merging
+    the few matching tokens' lists and stopping after N, however many
+    entries match.
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.postings = {}
+        # id -> (rank, tokens, payload); rank sorts best first and ends with the id
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, entry_id, name, rank, payload):
+        self.discard(entry_id)
+        words = normalize_name(name).split()
+        tokens = frozenset(words)
+        rank = (*rank, entry_id)
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = []
+                insort(self.tokens, token)
+            insort(postings, rank)
+        self.entries[entry_id] = (rank, tokens, payload)
+
+    def discard(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        rank, tokens, _ = entry
+        for token in tokens:
+            postings = self.postings[token]
+            del postings[bisect_left(postings, rank)]
+            if not postings:
+                del self.postings[token]
+                del self.tokens[bisect_left(self.tokens, token)]
+
+    def matching_tokens(self, word):
+        start = bisect_left(self.tokens, word)
+        return self.tokens[start:bisect_left(self.tokens, word + PREFIX_END, start)]
+
+    def search(self, words, limit):
+        # The word with the fewest matching tokens drives the merge; every
+        # other word must prefix one of the entry's own tokens
+        tokens_by_word = sorted((self.matching_tokens(word) for word in words), key=len)
+        if not tokens_by_word or not tokens_by_word[0]:
+            return []
+        others = words if len(words) > 1 else ()
+        seen = set()
+        results = []
+        for rank in heapq.merge(*(self.postings[token] for token in tokens_by_word[0])):
+            entry_id = rank[-1]
+            if entry_id in seen:
+                continue
+            seen.add(entry_id)
+            _, tokens, payload = self.entries[entry_id]
+            if all(any(token.startswith(word) for token in tokens) for word in others):
+                results.append(payload)
+                if len(results) >= limit:
+                    break
+        return results
+
+
+def suggestion_rank(in_stock, popularity, name):
+    # In stock first, then most popular, then by name
+    return (0 if in_stock else 1, -popularity, normalize_name(name))
+
+
+class AutocompleteIndex:
+    """
+    In-process suggestions over product, category and label names, ranked
+    by stock status then popularity (units ordered recently). Built once per
+    process (gunicorn builds it before forking), then kept current: model
+    signals mark it stale in the writing process, and every process checks
+    a cheap catalog version at most every AUTOCOMPLETE_CHECK_SECONDS and
+    applies only the rows changed since. Popularity is recomputed by a full
+    rebuild every AUTOCOMPLETE_REBUILD_SECONDS on a background thread, so
+    no request waits for one.
+    """
+
+    def __init__(self):
+        # Held by searches and while the index changes; refresh_lock keeps
+        # refreshes (and their queries) to one thread at a time
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.products = PrefixIndex()
+        self.categories = PrefixIndex()
+        self.labels = PrefixIndex()
+        self.popularity = {}
+        self.version = None
+        self.built_at = None
+        self.checked_at = 0.0
+        self.stale = False
+        self.rebuild_thread = None
+        self.retry_at = 0.0
+        # Where the incremental refresh picks up: (updated_at, id) per model, last tombstone id
+        self.cursors = {}
+        self.last_tombstone = 0
+
+    @staticmethod
+    def catalog_version():
+        labels = [tombstone_label(model) for model in INDEXED_MODELS]
+        return (
+            Product.objects.aggregate(last=Max('updated_at'))['last'],
+            Category.objects.aggregate(last=Max('updated_at'))['last'],
+            ProductLabel.objects.aggregate(last=Max('updated_at'))['last'],
+            Tombstone.objects.filter(model__in=labels).aggregate(last=Max('id'))['last'],
+        )
+
+    def rebuild(self):
+        version = self.catalog_version()
+        now = timezone.now()
+        since = now - timedelta(days=getattr(settings, 'AUTOCOMPLETE_POPULARITY_DAYS', 90))
+        # Starting from the orders' created_at index reads only the window's
+        # items; filtering through the join walks every item by product
+        recent = Order.objects.filter(created_at__gte=since).values('id')
+        popularity = dict(
+            OrderItem.objects.filter(order__in=recent, product__isnull=False)
+            .values('product').annotate(units=Sum('quantity')).values_list('product', 'units')
+        )
+        products, categories, labels = PrefixIndex(), PrefixIndex(), PrefixIndex()
+        category_stats = defaultdict(lambda: [False, 0])
+        product_stats = {}
+        for product_id, name, in_stock, category_id in (
+            Product.objects.order_by().values_list('id', 'name', 'in_stock', 'category_id').iterator(chunk_size=2000)
+        ):
+            units = popularity.get(product_id, 0)
+            products.put(product_id, name, suggestion_rank(in_stock, units, name), {'id': product_id, 'name': name, 'in_stock': in_stock})
+            stats = category_stats[category_id]
+            stats[0] = stats[0] or in_stock
+            stats[1] += units
+            product_stats[product_id] = (in_stock, units)
+        label_stats = defaultdict(lambda: [False, 0])
+        for product_id, label_id in Product.labels.through.objects.values_list('product_id', 'productlabel_id'):
+            in_stock, units = product_stats.get(product_id, (False, 0))
+            stats = label_stats[label_id]
+            stats[0] = stats[0] or in_stock
+            stats[1] += units
+        for index, model, stats in ((categories, Category, category_stats), (labels, ProductLabel, label_stats)):
+            for entry_id, name in model.objects.values_list('id', 'name'):
+                in_stock, units = stats.get(entry_id, (False, 0))
+                index.put(entry_id, name, suggestion_rank(in_stock, units, name), {'id': entry_id, 'name': name})
+
+        with self.lock:
+            self.products, self.categories, self.labels = products, categories, labels
+            self.popularity = popularity
+            self.version = version
+            self.built_at = time.monotonic()
+            self.checked_at = self.built_at
+            self.stale = False
+            self.cursors = {model: (version[i], 0) for i, model in enumerate(INDEXED_MODELS)}
+            self.last_tombstone = version[3] or 0
+
+    def changed_rows(self):
+        # Rows written inside the settle window are read again on the next
+        # refresh, so one committed late with an earlier updated_at isn't missed
+        settle = timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 5))
+        changed = {}
+        for model in INDEXED_MODELS:
+            moment = self.cursors.get(model, (None, 0))[0]
+            queryset = model.objects.all()
+            if moment is not None:
+                queryset = after(queryset, 'updated_at', (moment - settle, 0))
+            fields = ('id', 'name', 'in_stock') if model is Product else ('id', 'name')
+            changed[model] = list(queryset.values_list(*fields))
+        deleted = list(Tombstone.objects.filter(
+            id__gt=self.last_tombstone, model__in=[tombstone_label(model) for model in INDEXED_MODELS]
+        ).values_list('model', 'object_id'))
+        return changed, deleted
+
+    def apply_changes(self, version, changed, deleted):
+        indexes = {Product: self.products, Category: self.categories, ProductLabel: self.labels}
+        for product_id, name, in_stock in changed[Product]:
+            units = self.popularity.get(product_id, 0)
+            self.products.put(product_id, name, suggestion_rank(in_stock, units, name),
+                              {'id': product_id, 'name': name, 'in_stock': in_stock})
+        for model in (Category, ProductLabel):
+            index = indexes[model]
+            for entry_id, name in changed[model]:
+                # Keep the stock and popularity ranking from the last rebuild
+                rank = index.entries[entry_id][0][:2] if entry_id in index.entries else (1, 0)
+                index.put(entry_id, name, (*rank, normalize_name(name)), {'id': entry_id, 'name': name})
+        by_label = {tombstone_label(model): index for model, index in indexes.items()}
+        for label, object_id in deleted:
+            by_label[label].discard(object_id)
+        self.cursors = {model: (version[i], 0) for i, model in enumerate(INDEXED_MODELS)}
+        self.last_tombstone = version[3] or self.last_tombstone
+        self.version = version
+
+    def start_rebuild(self):
+        """Rebuild on a background thread unless a refresh is already running; searches keep the current index."""
+        if time.monotonic() < self.retry_at or not self.refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self.rebuild_thread = threading.Thread(target=self._rebuild_and_release, name='autocomplete-rebuild', daemon=True)
+            self.rebuild_thread.start()
+        except BaseException:
+            self.refresh_lock.release()
+            raise
+
+    def _rebuild_and_release(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Autocomplete index rebuild failed')
+            self.retry_at = time.monotonic() + getattr(settings, 'AUTOCOMPLETE_CHECK_SECONDS', 5)
+        finally:
+            # This thread's connections would otherwise stay open until the process exits
+            connections.close_all()
+            self.refresh_lock.release()
+
+    def ensure_current(self):
+        """
+        Catch up with catalog changes as due. Full builds never run here:
+        they start in the background, and until the first one finishes
+        there are no suggestions.
+        """
+        now = time.monotonic()
+        if self.built_at is None or now - self.built_at > getattr(settings, 'AUTOCOMPLETE_REBUILD_SECONDS', 600):
+            self.start_rebuild()
+            if self.built_at is None:
+                return
+        check = self.stale or now - self.checked_at >= getattr(settings, 'AUTOCOMPLETE_CHECK_SECONDS', 5)
+        if not check or not self.refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self.checked_at = now
+            self.stale = False
+            version = self.catalog_version()
+            if version != self.version:
+                changed, deleted = self.changed_rows()
+                with self.lock:
+                    self.apply_changes(version, changed, deleted)
+        finally:
+            self.refresh_lock.release()
+
+    def suggest(self, query, limit=8):
+        words = normalize_name(query).split()
+        limit = max(1, min(limit, MAX_LIMIT))
+        if not words:
+            return {'products': [], 'categories': [], 'labels': []}
+        with self.lock:
+            return {
+                'products': self.products.search(words, limit),
+                'categories': self.categories.search(words, limit),
+                'labels': self.labels.search(words, limit),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def autocomplete_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = AutocompleteIndex()
+    return _index
+
+
+def restart_rebuild_clock():
+    # For a freshly forked worker: the index it inherited counts as built
+    # now, so workers forked long after boot don't all rebuild at once
+    if _index is not None and _index.built_at is not None:
+        _index.built_at = time.monotonic()
+
+
+def mark_stale():
+    # Called from signals; the next suggestion request checks the version
+    if _index is not None:
+        _index.stale = True
@@ -0,0 +1,163 @@
+import copy
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.db import close_old_connections
+from django.http import HttpResponse, QueryDict
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Sub-requests get their own body and must not inherit the batch call's validators
+DROPPED_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+FORWARDED_HEADERS = ('ETag', 'Last-Modified', 'Location', 'Retry-After')
+
+_executor = None
+_executor_lock = threading.Lock()
+_handler = None
+_handler_lock = threading.Lock()
+
+
+def executor():
+    # Long-lived threads, so their DB connections follow CONN_MAX_AGE like request threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BATCH_MAX_WORKERS', 4), thread_name_prefix='batch'
+            )
+    return _executor
+
+
+def handler():
+    # Sub-requests go through the same middleware as top-level ones (replica
+    # routing and pinning, CSRF, sessions), built once per process
+    global _handler
+    with _handler_lock:
+        if _handler is None:
+            handler = BaseHandler()
+            handler.load_middleware()
+            _handler = handler
+    return _handler
+
+
+def build_subrequest(request, item):
+    """
+    A copy of the batch call's HttpRequest pointed at ``item``'s path. The
+    user authenticated for the batch is forced onto it, so the token is
+    decoded once while each view still applies its own permissions.
+    """
+    outer = request._request
+    parts = urlsplit(item['path'])
+    sub = copy.copy(outer)
+    for cached in ('_body', '_post', '_files', 'resolver_match', 'csrf_processing_done'):
+        sub.__dict__.pop(cached, None)
+
+    body = b''
+    meta = {key: value for key, value in outer.META.items() if key not in DROPPED_META}
+    if item.get('body') is not None:
+        body = json.dumps(item['body']).encode()
+        meta.update(CONTENT_TYPE='application/json', CONTENT_LENGTH=str(len(body)))
+    meta.update(REQUEST_METHOD=item['method'], PATH_INFO=parts.path, QUERY_STRING=parts.query)
+
+    sub.META = meta
+    sub.method = item['method']
+    sub.path = sub.path_info = parts.path
+    sub.GET = QueryDict(parts.query)
+    sub._stream = BytesIO(body)
+    sub._read_started = False
+    if request.user and request.user.is_authenticated:
+        sub._force_auth_user = request.user
+        sub._force_auth_token = request.auth
+    return sub
+
+
+def error_response(status, message):
+    return HttpResponse(json.dumps({'error': message}), status=status, content_type='application/json')
+
+
+def execute(request, item):
+    sub = build_subrequest(request, item)
+    try:
+        resolve(sub.path_info)
+    except Resolver404:
+        return error_response(404, 'Not found')
+    try:
+        response = handler().get_response(sub)
+    except Exception:
+        logger.exception('Batched %s %s failed', item['method'], item['path'])
+        return error_response(500, 'Server error')
+    if response.streaming:
+        return error_response(501, 'Streaming responses cannot be batched')
+    return response
+
+
+def execute_in_worker(request, item):
+    close_old_connections()
+    try:
+        return execute(request, item)
+    finally:
+        close_old_connections()
+
+
+def encode_result(item, response):
+    content = response.content
+    if not content:
+        body = b'null'
+    elif response.get('Content-Type', '').startswith('application/json'):
+        # Already JSON: splice it in instead of parsing and re-encoding it
+        body = content
+    else:
+        body = json.dumps(content.decode(response.charset or 'utf-8', 'replace')).encode()
+    headers = {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)}
+    return b''.join([
+        b'{"id":', json.dumps(item.get('id')).encode(),
+        b',"status":', str(response.status_code).encode(),
+        b',"headers":', json.dumps(headers).encode(),
+        b',"body":', body, b'}',
+    ])
+
+
+def run_batch(request, items):
+    """
+    Run ``items`` in order and return one JSON response with a result per
+    item. Each run of consecutive reads is spread over the worker pool;
+    writes run one at a time in the request thread, so later items see them.
+    The batch call itself only pins the client to the primary (which sets
+    its cookie) when one of its writes succeeded.
+    """
+    results = [None] * len(items)
+    reads = []
+
+    def flush_reads():
+        if len(reads) == 1 or getattr(settings, 'BATCH_MAX_WORKERS', 4) <= 1:
+            for index in reads:
+                results[index] = execute(request, items[index])
+        elif reads:
+            futures = [(index, executor().submit(execute_in_worker, request, items[index])) for index in reads]
+            for index, future in futures:
+                results[index] = future.result()
+        reads.clear()
+
+    for index, item in enumerate(items):
+        if item['method'] in SAFE_METHODS:
+            reads.append(index)
+        else:
+            flush_reads()
+            results[index] = execute(request, item)
+    flush_reads()
+    request._request.replica_pin_exempt = not any(
+        item['method'] not in SAFE_METHODS and response.status_code < 400 for item, response in zip(items, results)
+    )
+
+    payload = b'{"responses":[' + b','.join(
+        encode_result(item, response) for item, response in zip(items, results)
+    ) + b']}'
+    return HttpResponse(payload, content_type='application/json')
@@ -0,0 +1,519 @@
+import json
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field, asdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, connections
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import (
+    AdminUser, Category, ProductLabel, Product, ProductImage,
+    DiscountCode, ProductDiscount, Order, OrderItem, Service, StockMovement
+)
+from .inventory import opening_movements
+
+BENCH_USERNAME = 'bench-admin'
+BENCH_PASSWORD = 'bench-password-123'
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    path: str
+    auth: bool = False
+    data: dict = field(default_factory=dict)
+
+
+@dataclass
+class EndpointResult:
+    name: str
+    requests: int
+    errors: int
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    queries: float
+    peak_memory_kb: float
+
+
+def seed_dataset(categories=10, labels=10, products=200, orders=200, items_per_order=3, services=10, seed=1):
+    """Populate the current database with a small, deterministic dataset."""
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    user = AdminUser.objects.create_user(
+        username=BENCH_USERNAME, password=BENCH_PASSWORD, is_staff=True, role='superadmin'
+    )
+    category_objs = Category.objects.bulk_create(
+        [Category(name=f'Category {i}') for i in range(categories)]
+    )
+    label_objs = ProductLabel.objects.bulk_create(
+        [ProductLabel(name=f'Label {i}') for i in range(labels)]
+    )
+    product_objs = Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}',
+            description='Benchmark product',
+            price=Decimal(rng.randint(100, 10000)) / 100,
+            category=rng.choice(category_objs),
+            stock_quantity=rng.randint(0, 100),
+        )
+        for i in range(products)
+    ])
+    StockMovement.objects.bulk_create(opening_movements(product_objs), batch_size=1000)
+    Through = Product.labels.through
+    Through.objects.bulk_create([
+        Through(product_id=product.pk, productlabel_id=label.pk)
+        for product in product_objs
+        for label in rng.sample(label_objs, min(2, len(label_objs)))
+    ])
+    ProductImage.objects.bulk_create([
+        ProductImage(product=product, image=f'products/{product.pk}.png', is_primary=True)
+        for product in product_objs
+    ])
+    ProductDiscount.objects.bulk_create([
+        ProductDiscount(
+            product=product, discount_type='percentage', value=10,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=7),
+        )
+        for product in product_objs[::5]
+    ])
+    DiscountCode.objects.bulk_create([
+        DiscountCode(code=f'BENCH{i}', discount_type='fixed', value=5, valid_until=now + timedelta(days=30))
+        for i in range(10)
+    ])
+    statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+    order_objs = [
+        Order(
+            order_number=f'BENCH-{i:08d}',
+            customer_name=f'Customer {i}',
+            customer_email=f'customer{i}@example.com',
+            customer_phone='0000000000',
+            shipping_address='1 Benchmark Street',
+            status=rng.choice(statuses),
+            total_amount=Decimal(rng.randint(100, 50000)) / 100,
+        )
+        for i in range(orders)
+    ]
+    for order in order_objs:
+        order.normalize_lookup_fields()
+    order_objs = Order.objects.bulk_create(order_objs)
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=rng.choice(product_objs),
+            quantity=rng.randint(1, 5),
+            price_at_purchase=Decimal(rng.randint(100, 10000)) / 100,
+        )
+        for order in order_objs
+        for _ in range(items_per_order)
+    ])
+    Service.objects.bulk_create([
+        Service(name=f'Service {i}', description='Benchmark service', price=Decimal('25.00'))
+        for i in range(services)
+    ])
+    return user
+
+
+def default_endpoints():
+    product_id = Product.objects.values_list('id', flat=True).first()
+    order_id = Order.objects.values_list('id', flat=True).first()
+    return [
+        Endpoint('health', 'get', '/api/health/'),
+        Endpoint('products-list', 'get', '/api/products/'),
+        Endpoint('products-detail', 'get', f'/api/products/{product_id}/'),
+        Endpoint('categories-list', 'get', '/api/categories/'),
+        Endpoint('labels-list', 'get', '/api/product-labels/'),
+        Endpoint('discount-codes-list', 'get', '/api/discount-codes/'),
+        Endpoint('product-discounts-list', 'get', '/api/product-discounts/', auth=True),
+        Endpoint('orders-list', 'get', '/api/orders/', auth=True),
+        Endpoint('orders-detail', 'get', f'/api/orders/{order_id}/', auth=True),
+        Endpoint('order-items-list', 'get', '/api/order-items/', auth=True),
+        Endpoint('services-list', 'get', '/api/services/'),
+        Endpoint('auth-login', 'post', '/api/auth/login/',
+                 data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}),
+    ]
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class _Worker:
+    """One thread's client; Django gives each thread its own DB connection."""
+
+    def __init__(self, headers):
+        self.client = Client(**headers)
+        self.queries = 0
+
+    def count_queries(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def request(self, endpoint):
+        call = getattr(self.client, endpoint.method)
+        start = time.perf_counter()
+        if endpoint.method == 'get':
+            response = call(endpoint.path)
+        else:
+            response = call(endpoint.path, endpoint.data, content_type='application/json')
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status_code < 400
+
+
+def _run_worker(endpoint, headers, warmup, next_ticket, start_barrier, samples, query_counts):
+    worker = _Worker(headers)
+    try:
+        with connection.execute_wrapper(worker.count_queries):
+            for _ in range(warmup):
+                worker.request(endpoint)
+            worker.queries = 0
+            start_barrier.wait()
+            while next_ticket():
+                samples.append(worker.request(endpoint))
+        query_counts.append(worker.queries)
+    except BaseException:
+        start_barrier.abort()
+        raise
+    finally:
+        connections.close_all()
+
+
+def run_endpoint(endpoint, token, requests=100, concurrency=4, warmup=2):
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if endpoint.auth else {}
+    samples = []
+    query_counts = []
+    tickets = iter(range(requests))
+    lock = threading.Lock()
+
+    def next_ticket():
+        with lock:
+            return next(tickets, None) is not None
+
+    start_barrier = threading.Barrier(concurrency + 1)
+    threads = [
+        threading.Thread(
+            target=_run_worker,
+            args=(endpoint, headers, warmup, next_ticket, start_barrier, samples, query_counts),
+        )
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    # Peak memory is measured on a single request so tracing doesn't skew latency
+    probe = _Worker(headers)
+    tracemalloc.start()
+    probe.request(endpoint)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+    return EndpointResult(
+        name=endpoint.name,
+        requests=len(samples),
+        errors=sum(1 for _, ok in samples if not ok),
+        throughput=round(len(samples) / wall, 1) if wall else 0.0,
+        p50_ms=round(statistics.median(latencies), 2) if latencies else 0.0,
+        p95_ms=round(_percentile(latencies, 95), 2),
+        p99_ms=round(_percentile(latencies, 99), 2),
+        queries=round(sum(query_counts) / len(samples), 2) if samples else 0.0,
+        peak_memory_kb=round(peak / 1024, 1),
+    )
+
+
+def run_benchmarks(endpoints, requests=100, concurrency=4):
+    user = AdminUser.objects.get(username=BENCH_USERNAME)
+    token = str(RefreshToken.for_user(user).access_token)
+    return [run_endpoint(endpoint, token, requests, concurrency) for endpoint in endpoints]
+
+
+def dashboard_requests():
+    """The reads the admin dashboard makes on first load."""
+    return [
+        {'id': 'profile', 'method': 'GET', 'path': '/api/auth/profile/'},
+        {'id': 'categories', 'method': 'GET', 'path': '/api/categories/'},
+        {'id': 'labels', 'method': 'GET', 'path': '/api/product-labels/'},
+        {'id': 'products', 'method': 'GET', 'path': '/api/products/'},
+        {'id': 'orders', 'method': 'GET', 'path': '/api/orders/?status=pending'},
+        {'id': 'discount-codes', 'method': 'GET', 'path': '/api/discount-codes/'},
+        {'id': 'product-discounts', 'method': 'GET', 'path': '/api/product-discounts/'},
+        {'id': 'services', 'method': 'GET', 'path': '/api/services/'},
+        {'id': 'archived-orders', 'method': 'GET', 'path': '/api/archived-orders/'},
+        {'id': 'health', 'method': 'GET', 'path': '/api/health/'},
+    ]
+
+
+def compare_batch(rounds=20, warmup=2, rtt_ms=0.0):
+    """
+    Median wall time of a dashboard bootstrap done as separate calls versus
+    one /api/batch/ call, in milliseconds. The test client has no network in
+    between, so ``rtt_ms`` adds a simulated round trip to every HTTP call.
+    """
+    user = AdminUser.objects.get(username=BENCH_USERNAME)
+    token = str(RefreshToken.for_user(user).access_token)
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    items = dashboard_requests()
+
+    def round_trip():
+        if rtt_ms:
+            time.sleep(rtt_ms / 1000)
+
+    def sequential():
+        ok = True
+        for item in items:
+            round_trip()
+            ok = client.get(item['path']).status_code < 400 and ok
+        return ok
+
+    def batched():
+        round_trip()
+        response = client.post('/api/batch/', {'requests': items}, content_type='application/json')
+        return response.status_code < 400 and all(
+            result['status'] < 400 for result in response.json()['responses']
+        )
+
+    timings = {}
+    for name, run in (('sequential', sequential), ('batch', batched)):
+        for _ in range(warmup):
+            run()
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            ok = run()
+            samples.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                raise RuntimeError(f'{name} dashboard bootstrap returned an error')
+        timings[name] = round(statistics.median(samples), 2)
+    timings['speedup'] = round(timings['sequential'] / timings['batch'], 2) if timings['batch'] else 0.0
+    return timings
+
+
+def compare_serializers(rounds=20, warmup=2):
+    """
+    Median CPU milliseconds to build and render one list page through the
+    model serializers versus the RowSerializer read path, per viewset.
+    """
+    from rest_framework.mixins import ListModelMixin
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from .row_serializers import RowListMixin
+    from .views import ProductViewSet, OrderViewSet
+
+    user = AdminUser.objects.get(username=BENCH_USERNAME)
+    factory = APIRequestFactory()
+    timings = {}
+    for name, viewset_class in (('products', ProductViewSet), ('orders', OrderViewSet)):
+        # Both variants skip ConditionalGetMixin so only the serializing differs
+        views = {
+            variant: type(viewset_class.__name__, (viewset_class,), {'list': list_method}).as_view({'get': 'list'})
+            for variant, list_method in (('model', ListModelMixin.list), ('rows', RowListMixin.list))
+        }
+        for variant, view in views.items():
+            samples = []
+            for round_index in range(warmup + rounds):
+                request = factory.get('/', HTTP_HOST='localhost')
+                force_authenticate(request, user=user)
+                start = time.process_time()
+                response = view(request)
+                response.render()
+                if round_index >= warmup:
+                    samples.append((time.process_time() - start) * 1000)
+            timings[f'{name}_{variant}'] = round(statistics.median(samples), 2)
+        timings[f'{name}_rows_per_page'] = len(json.loads(response.content)['results'])
+        timings[f'{name}_speedup'] = round(timings[f'{name}_model'] / timings[f'{name}_rows'], 2)
+    return timings
+
+
+def compare_quotes(cart_sizes=(1, 5, 20, 50), rounds=20, warmup=2, rtt_ms=0.0):
+    """
+    Per cart size: median wall milliseconds to price a cart the old way (a
+    product detail call per line plus the discount and code lists) versus one
+    /api/cart/quote/ call, uncached and cached, and the quote's query count.
+    """
+    from django.core.cache import cache
+
+    user = AdminUser.objects.get(username=BENCH_USERNAME)
+    token = str(RefreshToken.for_user(user).access_token)
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    code = DiscountCode.objects.values_list('code', flat=True).first()
+
+    def round_trip():
+        if rtt_ms:
+            time.sleep(rtt_ms / 1000)
+
+    def median_ms(run, before=None):
+        samples = []
+        for round_index in range(warmup + rounds):
+            if before:
+                before()
+            start = time.perf_counter()
+            ok = run()
+            if round_index >= warmup:
+                samples.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                raise RuntimeError('cart pricing call returned an error')
+        return round(statistics.median(samples), 2)
+
+    timings = []
+    for size in cart_sizes:
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:size])
+        cart = {'items': [{'product': product_id, 'quantity': 2} for product_id in product_ids], 'code': code}
+
+        def separate():
+            ok = True
+            for path in [f'/api/products/{product_id}/' for product_id in product_ids] + [
+                '/api/product-discounts/', '/api/discount-codes/'
+            ]:
+                round_trip()
+                ok = client.get(path).status_code < 400 and ok
+            return ok
+
+        def quote():
+            round_trip()
+            return client.post('/api/cart/quote/', cart, content_type='application/json').status_code < 400
+
+        queries = []
+        with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+            cache.clear()
+            quote()
+        timings.append({
+            'size': len(product_ids),
+            'separate': median_ms(separate),
+            'uncached': median_ms(quote, before=cache.clear),
+            'cached': median_ms(quote),
+            'queries': len(queries),
+        })
+    return timings
+
+
+def compare_autocomplete(rounds=20, warmup=2):
+    """
+    Per prefix length: median wall milliseconds for a type-ahead lookup
+    through /api/products/?search= versus /api/autocomplete/, plus the
+    seconds a full index build takes.
+    """
+    from .autocomplete import AutocompleteIndex, autocomplete_index
+
+    user = AdminUser.objects.get(username=BENCH_USERNAME)
+    token = str(RefreshToken.for_user(user).access_token)
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    word = Product.objects.order_by('id').values_list('name', flat=True).first().split()[0].lower()
+
+    start = time.perf_counter()
+    AutocompleteIndex().rebuild()
+    timings = {'build_seconds': round(time.perf_counter() - start, 3), 'prefixes': []}
+    autocomplete_index().ensure_current()
+
+    def median_ms(path):
+        samples = []
+        for round_index in range(warmup + rounds):
+            start = time.perf_counter()
+            response = client.get(path)
+            if round_index >= warmup:
+                samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{path} returned {response.status_code}')
+        return round(statistics.median(samples), 2)
+
+    for length in range(1, min(len(word), 4) + 1):
+        prefix = word[:length]
+        timings['prefixes'].append({
+            'prefix': prefix,
+            'search': median_ms(f'/api/products/?search={prefix}&page_size=8'),
+            'autocomplete': median_ms(f'/api/autocomplete/?q={prefix}'),
+        })
+    return timings
+
+
+def compare_recommendations(products=20, rounds=20, warmup=2):
+    """
+    Median wall milliseconds for a product's related products computed live
+    (an OrderItem self-join through its orders) versus the precomputed
+    /api/products/{id}/recommendations/, plus the seconds a full build takes.
+    """
+    from django.db.models import Count
+
+    from .recommendations import rebuild_recommendations
+
+    start = time.perf_counter()
+    rebuild_recommendations(lag=timedelta(0))
+    timings = {'build_seconds': round(time.perf_counter() - start, 3)}
+    client = Client()
+    # The most ordered products, where the live join has the most rows to count
+    product_ids = list(
+        OrderItem.objects.filter(product__isnull=False).values('product').annotate(items=Count('id'))
+        .order_by('-items', 'product').values_list('product', flat=True)[:products]
+    )
+
+    def live(product_id):
+        return list(
+            OrderItem.objects.filter(order__items__product_id=product_id).exclude(product_id=product_id)
+            .values('product').annotate(orders=Count('order', distinct=True)).order_by('-orders', 'product')[:10]
+        )
+
+    def precomputed(product_id):
+        response = client.get(f'/api/products/{product_id}/recommendations/')
+        if response.status_code >= 400:
+            raise RuntimeError(f'recommendations returned {response.status_code}')
+
+    for name, run in (('live', live), ('precomputed', precomputed)):
+        samples = []
+        for round_index in range(warmup + rounds):
+            product_id = product_ids[round_index % len(product_ids)]
+            start = time.perf_counter()
+            run(product_id)
+            if round_index >= warmup:
+                samples.append((time.perf_counter() - start) * 1000)
+        timings[name] = round(statistics.median(samples), 2)
+    return timings
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    """
+    Return a list of human-readable regressions. Latency and throughput get
+    ``tolerance`` slack; any increase in queries per request is a regression.
+    """
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if not base:
+            continue
+        if result.p95_ms > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{result.name}: p95 {result.p95_ms}ms vs baseline {base['p95_ms']}ms")
+        if result.throughput < base['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{result.name}: throughput {result.throughput}/s vs baseline {base['throughput']}/s"
+            )
+        if result.queries > base['queries']:
+            regressions.append(f"{result.name}: {result.queries} queries/request vs baseline {base['queries']}")
+        if result.errors > base.get('errors', 0):
+            regressions.append(f"{result.name}: {result.errors} errors vs baseline {base.get('errors', 0)}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path):
+    with open(path, 'w') as f:
+        json.dump({result.name: asdict(result) for result in results}, f, indent=2, sort_keys=True)
@@ -0,0 +1,70 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for viewset ``list`` and ``retrieve``.
+
+    Validators come from ``updated_at`` alone: a detail response sends an
+    ETag and Last-Modified from the row's timestamp, a list only an ETag from
+    max(updated_at) and the row count of the filtered queryset, so a matching
+    If-None-Match (or, for a detail, If-Modified-Since) is answered with 304
+    before any serializer runs. Lists get no Last-Modified: deleting a row
+    that isn't the newest, or a second write within the same second, leaves
+    the whole-second max(updated_at) unchanged. Changes to nested data
+    (images, labels, order items) bump the parent's ``updated_at`` through
+    signals so they invalidate these validators too.
+    """
+    validator_field = 'updated_at'
+
+    def make_etag(self, request, *parts):
+        user_id = request.user.pk if request.user.is_authenticated else ''
+        key = '|'.join(str(part) for part in (
+            self.basename, request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), user_id, *parts
+        ))
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def conditional_response(self, request, etag, last_modified):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+    def set_validators(self, response, etag, last_modified):
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        response['Vary'] = 'Accept, Authorization'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        validators = self.filter_queryset(self.get_queryset()).order_by().aggregate(
+            last_modified=Max(self.validator_field), count=Count('pk')
+        )
+        last_modified = validators['last_modified']
+        etag = self.make_etag(request, last_modified and last_modified.isoformat(), validators['count'])
+        not_modified = self.conditional_response(request, etag, None)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(super().list(request, *args, **kwargs), etag, None)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            last_modified = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).values_list(self.validator_field, flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            last_modified = None
+        if last_modified is None:
+            # Missing rows get the usual 404 from the normal path
+            return super().retrieve(request, *args, **kwargs)
+        etag = self.make_etag(request, last_modified.isoformat())
+        not_modified = self.conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
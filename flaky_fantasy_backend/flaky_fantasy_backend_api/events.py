@@ -0,0 +1,314 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import timedelta
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .models import Notification, Order, OrderStatusHistory
+
+logger = logging.getLogger(__name__)
+
+# Event kinds, in the order their source ids appear in an event id "n.o.h"
+NOTIFICATION, ORDER_CREATED, ORDER_STATUS = 0, 1, 2
+KIND_NAMES = ('notification', 'order.created', 'order.status')
+
+
+def format_position(position):
+    return '.'.join(str(part) for part in position)
+
+
+def parse_position(value):
+    try:
+        position = tuple(int(part) for part in value.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    return position if len(position) == 3 else None
+
+
+class Event:
+    __slots__ = ('kind', 'source_id', 'position', 'recipient_id', 'payload')
+
+    def __init__(self, kind, source_id, position, payload, recipient_id=None):
+        self.kind = kind
+        self.source_id = source_id
+        self.position = position
+        self.payload = payload
+        self.recipient_id = recipient_id
+
+    def after(self, position):
+        return self.source_id > position[self.kind]
+
+    def visible_to(self, user_id):
+        return self.recipient_id is None or self.recipient_id == user_id
+
+    def encode(self):
+        data = json.dumps(self.payload, cls=DjangoJSONEncoder)
+        return f'id: {format_position(self.position)}\nevent: {KIND_NAMES[self.kind]}\ndata: {data}\n\n'.encode()
+
+
+def latest_position():
+    return (
+        Notification.objects.aggregate(last=Max('id'))['last'] or 0,
+        Order.objects.aggregate(last=Max('id'))['last'] or 0,
+        OrderStatusHistory.objects.aggregate(last=Max('id'))['last'] or 0,
+    )
+
+
+def fetch_events(position, limit, now=None):
+    """
+    Rows added since ``position`` as events, plus whether any source hit
+    ``limit`` (so the caller should fetch again straight away).
+
+    Ids are taken before their transactions commit, so a gap just above a
+    high-water mark may be a row that is still to appear. Each source stops
+    at its first gap until the row after it is EVENTS_SETTLE_SECONDS old; a
+    gap older than that is a rollback or a delete. High-water marks, and so
+    Last-Event-ID, therefore never pass a row that commits late, at the
+    cost of a rollback delaying that source's later events by up to
+    EVENTS_SETTLE_SECONDS. The other sources aren't held back.
+    """
+    close_old_connections()
+    now = now or timezone.now()
+    settled = now - timedelta(seconds=getattr(settings, 'EVENTS_SETTLE_SECONDS', 2))
+    notification_id, order_id, history_id = position
+    sources = [
+        (NOTIFICATION, 'created_at', Notification.objects.filter(id__gt=notification_id).values(
+            'id', 'recipient_id', 'notification_type', 'title', 'message',
+            'related_order_id', 'related_product_id', 'created_at',
+        )),
+        (ORDER_CREATED, 'created_at', Order.objects.filter(id__gt=order_id).values(
+            'id', 'order_number', 'customer_name', 'status', 'total_amount', 'created_at',
+        )),
+        (ORDER_STATUS, 'changed_at', OrderStatusHistory.objects.filter(id__gt=history_id).values(
+            'id', 'order_id', 'order__order_number', 'from_status', 'to_status', 'changed_at',
+        )),
+    ]
+    events = []
+    more = False
+    position = list(position)
+    for kind, timestamp, queryset in sources:
+        rows = list(queryset.order_by('id')[:limit])
+        full = len(rows) == limit
+        for row in rows:
+            if row['id'] != position[kind] + 1 and row[timestamp] > settled:
+                # An id below this one may still commit; wait for it
+                full = False
+                break
+            position[kind] = row['id']
+            recipient_id = row.pop('recipient_id', None)
+            if kind == ORDER_STATUS:
+                row['order_number'] = row.pop('order__order_number')
+            events.append(Event(kind, row['id'], tuple(position), row, recipient_id))
+        more = more or full
+    return events, more
+
+
+class Subscriber:
+    def __init__(self, user_id, max_queue):
+        self.user_id = user_id
+        self.max_queue = max_queue
+        self.start_position = None
+        self.queue = asyncio.Queue()
+        self.overflowed = False
+
+    def offer(self, event):
+        if self.overflowed or not event.visible_to(self.user_id):
+            return
+        if self.queue.qsize() >= self.max_queue:
+            # Too slow to keep up: end its stream, the client resumes from the buffer
+            self.overflowed = True
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(event)
+
+
+class ChangeFeed:
+    """
+    One per process: a single task polls the notification, order and status
+    history tables for new ids and fans each new row out to every connected
+    stream, so DB load doesn't grow with the number of connections. The
+    latest events are kept in memory for Last-Event-ID resumes.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.buffer = deque()
+        self.position = None
+        self.evicted = None
+        self.task = None
+        self.starting = None
+
+    async def subscribe(self, user_id, since=None):
+        """
+        Register a stream. Returns the subscriber and the buffered events after
+        ``since`` (None if the buffer no longer reaches back that far); both
+        are taken together so nothing is missed or delivered twice.
+        """
+        if self.task is None or self.task.done():
+            if self.starting is None:
+                self.starting = asyncio.ensure_future(self.reset())
+            try:
+                await asyncio.shield(self.starting)
+            finally:
+                self.starting = None
+        subscriber = Subscriber(user_id, getattr(settings, 'EVENTS_MAX_QUEUE', 100))
+        subscriber.start_position = self.position
+        self.subscribers.add(subscriber)
+        if self.task is None or self.task.done():
+            # The poller runs while anyone is subscribed
+            self.task = asyncio.ensure_future(self.run())
+        backlog = self.replay(since, user_id) if since is not None else []
+        return subscriber, backlog
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def reset(self):
+        self.position = await sync_to_async(latest_position)()
+        self.evicted = self.position
+        self.buffer.clear()
+
+    def replay(self, since, user_id):
+        """Buffered events after ``since``, or None if the buffer no longer covers it."""
+        if any(since[kind] < self.evicted[kind] for kind in range(3)):
+            return None
+        return [event for event in self.buffer if event.after(since) and event.visible_to(user_id)]
+
+    async def run(self):
+        interval = getattr(settings, 'EVENTS_POLL_SECONDS', 1.0)
+        limit = getattr(settings, 'EVENTS_POLL_LIMIT', 500)
+        buffer_size = getattr(settings, 'EVENTS_BUFFER_SIZE', 1000)
+        fetch = sync_to_async(fetch_events)
+        while self.subscribers:
+            try:
+                events, more = await fetch(self.position, limit)
+            except Exception:
+                logger.exception('Event feed poll failed')
+                events, more = [], False
+            for event in events:
+                self.position = event.position
+                self.buffer.append(event)
+                if len(self.buffer) > buffer_size:
+                    evicted = self.buffer.popleft()
+                    self.evicted = tuple(
+                        max(old, evicted.source_id) if kind == evicted.kind else old
+                        for kind, old in enumerate(self.evicted)
+                    )
+                for subscriber in list(self.subscribers):
+                    subscriber.offer(event)
+            if not more:
+                await asyncio.sleep(interval)
+
+
+feed = ChangeFeed()
+
+
+def authenticate(raw_token):
+    """The staff user a JWT belongs to, or None."""
+    close_old_connections()
+    auth = JWTAuthentication()
+    try:
+        user = auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user if user.is_active and user.is_staff else None
+
+
+class EventStreamApp:
+    """
+    ASGI app for the staff Server-Sent Events stream. EventSource can't send
+    headers, so the access token may also be given as ``?token=``.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            return await self.respond(send, scope, 405, {'error': 'Method not allowed'})
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        raw_token = headers.get('authorization', '').partition(' ')[2] or query.get('token', [''])[0]
+        user = await sync_to_async(authenticate)(raw_token) if raw_token else None
+        if user is None:
+            return await self.respond(send, scope, 401, {'error': 'Staff authentication required'})
+
+        last_event_id = headers.get('last-event-id') or query.get('last_event_id', [''])[0]
+        since = parse_position(last_event_id) if last_event_id else None
+        subscriber, backlog = await feed.subscribe(user.pk, since)
+        try:
+            await self.stream(scope, receive, send, subscriber, backlog)
+        finally:
+            feed.unsubscribe(subscriber)
+
+    async def stream(self, scope, receive, send, subscriber, backlog):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': self.cors_headers(scope) + [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+        if backlog is None:
+            # Missed more than the buffer holds; the client should refetch over REST
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': f'id: {format_position(subscriber.start_position)}\nevent: reset\ndata: {{}}\n\n'.encode()})
+        else:
+            for event in backlog:
+                await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+
+        keepalive = getattr(settings, 'EVENTS_KEEPALIVE_SECONDS', 15)
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            while True:
+                getter = asyncio.ensure_future(subscriber.queue.get())
+                done, _ = await asyncio.wait({getter, disconnected}, timeout=keepalive,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    getter.cancel()
+                    return
+                if getter not in done:
+                    getter.cancel()
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                    continue
+                event = getter.result()
+                if event is None:
+                    break
+                await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    def cors_headers(self, scope):
+        origin = next((value for name, value in scope['headers'] if name == b'origin'), None)
+        if origin is None:
+            return []
+        allowed = getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False) or \
+            origin.decode('latin-1') in getattr(settings, 'CORS_ALLOWED_ORIGINS', [])
+        if not allowed:
+            return []
+        return [(b'access-control-allow-origin', origin), (b'access-control-allow-credentials', b'true')]
+
+    async def respond(self, send, scope, status, payload):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': self.cors_headers(scope) + [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
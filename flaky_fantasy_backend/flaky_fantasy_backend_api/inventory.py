@@ -0,0 +1,217 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Product, StockMovement, StockSnapshot
+
+# Keep IN (...) lists under SQLite's bound-parameter limit
+ID_CHUNK_SIZE = 500
+MOVEMENT_BATCH_SIZE = 1000
+OPENING_NOTE = 'Opening balance'
+
+# Sent once per committed batch with ``levels={product_id: (before, after)}``.
+# _move_stock updates the rows without save(), so Product's post_save
+# receivers don't run for stock changes; anything that reacts to stock
+# connects here instead (low-stock alerts, the local autocomplete index).
+# Sync, the catalog snapshot, conditional GETs and other processes'
+# autocomplete indexes see the bumped updated_at on their next poll.
+stock_changed = Signal()
+
+
+class InsufficientStock(ValueError):
+    def __init__(self, shortages):
+        # {product_id: units currently in stock}
+        self.shortages = shortages
+        super().__init__(f"Not enough stock for product(s) {', '.join(map(str, sorted(shortages)))}")
+
+
+def _chunks(items, size=ID_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def signed_quantity(kind, quantity):
+    """The ledger change for ``quantity`` units of ``kind``; only adjustments carry their own sign."""
+    sign = StockMovement.KIND_SIGNS[kind]
+    if sign == 0:
+        return quantity
+    if quantity <= 0:
+        raise ValueError(f"A {kind} must move a positive quantity")
+    return sign * quantity
+
+
+def record_movements(movements, user=None):
+    """
+    Append ``movements`` (unsaved StockMovements with signed quantities) to
+    the ledger and move each product's cached stock_quantity by its net
+    change, all in one transaction. A batch that would take any product
+    below zero is rejected whole with InsufficientStock.
+    """
+    movements = list(movements)
+    if not movements:
+        return []
+    now = timezone.now()
+    changed_by = user if user is not None and user.is_authenticated else None
+    net = defaultdict(int)
+    for movement in movements:
+        net[movement.product_id] += movement.quantity
+        movement.created_at = now
+        if movement.created_by_id is None:
+            movement.created_by = changed_by
+    product_ids = sorted(net)
+
+    with transaction.atomic():
+        stock = {}
+        for chunk in _chunks(product_ids):
+            stock.update(Product.objects.select_for_update().filter(id__in=chunk).values_list('id', 'stock_quantity'))
+        missing = [product_id for product_id in product_ids if product_id not in stock]
+        if missing:
+            raise Product.DoesNotExist(f"Product(s) {', '.join(map(str, missing))} not found")
+        shortages = {
+            product_id: stock[product_id] for product_id in product_ids if stock[product_id] + net[product_id] < 0
+        }
+        if shortages:
+            raise InsufficientStock(shortages)
+
+        created = StockMovement.objects.bulk_create(movements, batch_size=MOVEMENT_BATCH_SIZE)
+        changes = {product_id: change for product_id, change in net.items() if change}
+        _move_stock(changes, now)
+
+        if changes:
+            levels = {
+                product_id: (stock[product_id], stock[product_id] + change) for product_id, change in changes.items()
+            }
+            transaction.on_commit(lambda: stock_changed.send(sender=Product, levels=levels))
+    return created
+
+
+def _move_stock(changes, now):
+    # One parameterized UPDATE per product through executemany; an ORM
+    # update() with a CASE over thousands of ids costs more to compile than to run.
+    # Both SET expressions read the row's stock_quantity from before the UPDATE
+    connection = connections[router.db_for_write(Product)]
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {table} SET {stock} = {stock} + %s, {in_stock} = ({stock} + %s > 0), {updated} = %s WHERE {id} = %s'.format(
+        table=qn(Product._meta.db_table), stock=qn('stock_quantity'), in_stock=qn('in_stock'),
+        updated=qn('updated_at'), id=qn('id'),
+    )
+    updated_at = connection.ops.adapt_datetimefield_value(now)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(change, change, updated_at, product_id) for product_id, change in changes.items()])
+
+
+def set_stock(product, quantity, user=None, note=''):
+    """Record the adjustment that brings ``product`` to ``quantity`` units, if any is needed."""
+    with transaction.atomic():
+        current = Product.objects.select_for_update().values_list('stock_quantity', flat=True).get(pk=product.pk)
+        movement = None
+        if quantity != current:
+            movement, = record_movements(
+                [StockMovement(product_id=product.pk, kind='adjustment', quantity=quantity - current, note=note)],
+                user,
+            )
+    product.stock_quantity = product._loaded_stock = quantity
+    product.in_stock = quantity > 0
+    return movement
+
+
+def snapshot_lag():
+    # Movements younger than this are left to the next round, so transactions
+    # still open when a round starts can't commit below its watermark
+    return timedelta(seconds=getattr(settings, 'INVENTORY_SNAPSHOT_LAG', 300))
+
+
+def take_snapshots(lag=None):
+    """
+    Snapshot every product with movements since the last round, by adding
+    their net change to each product's previous snapshot. Returns the number
+    of snapshots written; run it periodically (snapshot_stock).
+    """
+    cutoff = timezone.now() - (snapshot_lag() if lag is None else lag)
+    watermark = StockSnapshot.objects.aggregate(last=Max('last_movement_id'))['last'] or 0
+    newest = (
+        StockMovement.objects.filter(id__gt=watermark, created_at__lte=cutoff)
+        .order_by('-id').values('id', 'created_at').first()
+    )
+    if newest is None:
+        return 0
+
+    changes = dict(
+        StockMovement.objects.filter(id__gt=watermark, id__lte=newest['id'])
+        .values('product').annotate(change=Sum('quantity')).values_list('product', 'change')
+    )
+    previous = StockSnapshot.objects.filter(product=OuterRef('pk')).order_by('-last_movement_id', '-id')
+    written = 0
+    for chunk in _chunks(sorted(changes)):
+        with transaction.atomic():
+            snapshots = [
+                StockSnapshot(
+                    product_id=product_id,
+                    quantity=before + changes[product_id],
+                    last_movement_id=newest['id'],
+                    as_of=newest['created_at'],
+                )
+                for product_id, before in Product.objects.filter(id__in=chunk).annotate(
+                    before=Coalesce(Subquery(previous.values('quantity')[:1]), 0)
+                ).values_list('id', 'before')
+            ]
+            StockSnapshot.objects.bulk_create(snapshots)
+        written += len(snapshots)
+    return written
+
+
+def stock_levels(product_ids, at=None):
+    """
+    Ledger stock per product as of ``at`` (now when not given): the latest
+    snapshot taken by then plus the movements recorded after it, one query
+    per chunk of products. Returns ``{product_id: (quantity, snapshot as_of or None, tail movements)}``.
+    """
+    snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'))
+    tail = StockMovement.objects.filter(product=OuterRef('pk'), id__gt=OuterRef('snapshot_last_id'))
+    if at is not None:
+        snapshots = snapshots.filter(as_of__lte=at)
+        tail = tail.filter(created_at__lte=at)
+    snapshots = snapshots.order_by('-last_movement_id', '-id')
+    tail = tail.order_by().values('product')
+
+    levels = {}
+    for chunk in _chunks(list(product_ids)):
+        rows = Product.objects.filter(id__in=chunk).annotate(
+            snapshot_quantity=Coalesce(Subquery(snapshots.values('quantity')[:1]), 0),
+            snapshot_last_id=Coalesce(Subquery(snapshots.values('last_movement_id')[:1]), 0),
+            snapshot_as_of=Subquery(snapshots.values('as_of')[:1]),
+        ).annotate(
+            tail_change=Coalesce(Subquery(tail.annotate(total=Sum('quantity')).values('total')), 0),
+            tail_count=Coalesce(Subquery(tail.annotate(count=Count('id')).values('count')), 0),
+        ).values_list('id', 'snapshot_quantity', 'snapshot_as_of', 'tail_change', 'tail_count')
+        for product_id, base, as_of, change, count in rows:
+            levels[product_id] = (base + change, as_of, count)
+    return levels
+
+
+def ledger_totals(product_ids):
+    """Each product's stock summed over its whole ledger; the slow path the checks compare against."""
+    totals = {}
+    for chunk in _chunks(list(product_ids)):
+        totals.update(
+            StockMovement.objects.filter(product_id__in=chunk).order_by()
+            .values('product').annotate(total=Sum('quantity')).values_list('product', 'total')
+        )
+    return {product_id: totals.get(product_id, 0) for product_id in product_ids}
+
+
+def opening_movements(products):
+    """Ledger rows matching stock_quantity on products written without going through it (bulk_create)."""
+    return [
+        StockMovement(
+            product_id=product.pk, kind='adjustment', quantity=product.stock_quantity, note=OPENING_NOTE,
+            created_at=product.created_at or timezone.now(),
+        )
+        for product in products if product.stock_quantity
+    ]
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+
+from flaky_fantasy_backend_api.retention import (
+    archivable_orders, archive_orders, order_archive_cutoff,
+    prune_notifications, notification_cutoff,
+    prune_tombstones, tombstone_cutoff,
+)
+from flaky_fantasy_backend_api.models import Notification, Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Archive old delivered/cancelled orders and prune old read notifications and sync tombstones in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order-age-days', type=int, help='Defaults to settings.ORDER_ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--notification-ttl-days', type=int, help='Defaults to settings.NOTIFICATION_TTL_DAYS')
+        parser.add_argument('--batch-size', type=int, help='Defaults to settings.RETENTION_BATCH_SIZE')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches per table')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--skip-orders', action='store_true')
+        parser.add_argument('--skip-notifications', action='store_true')
+        parser.add_argument('--skip-tombstones', action='store_true')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows qualify')
+
+    def handle(self, *args, **options):
+        batching = {
+            'batch_size': options['batch_size'],
+            'max_batches': options['max_batches'],
+            'pause': options['pause'],
+        }
+
+        if not options['skip_orders']:
+            if options['dry_run']:
+                count = archivable_orders(order_archive_cutoff(options['order_age_days'])).count()
+                self.stdout.write(f'{count} orders would be archived')
+            else:
+                total = 0
+                for done in archive_orders(options['order_age_days'], **batching):
+                    total += done
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Archived {total} orders')
+                self.stdout.write(self.style.SUCCESS(f'Archived {total} orders'))
+
+        if not options['skip_notifications']:
+            if options['dry_run']:
+                count = Notification.objects.filter(
+                    is_read=True, created_at__lt=notification_cutoff(options['notification_ttl_days'])
+                ).count()
+                self.stdout.write(f'{count} notifications would be deleted')
+            else:
+                total = 0
+                for done in prune_notifications(options['notification_ttl_days'], **batching):
+                    total += done
+                self.stdout.write(self.style.SUCCESS(f'Deleted {total} read notifications'))
+
+        if not options['skip_tombstones']:
+            if options['dry_run']:
+                count = Tombstone.objects.filter(deleted_at__lt=tombstone_cutoff()).count()
+                self.stdout.write(f'{count} tombstones would be deleted')
+            else:
+                total = 0
+                for done in prune_tombstones(**batching):
+                    total += done
+                self.stdout.write(self.style.SUCCESS(f'Deleted {total} sync tombstones'))
@@ -0,0 +1,126 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from flaky_fantasy_backend_api.benchmark import (
+    seed_dataset, default_endpoints, run_benchmarks, compare_batch, compare_serializers, compare_quotes,
+    compare_autocomplete, compare_recommendations, compare_to_baseline, load_baseline, save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and benchmark every API endpoint with a concurrent in-process client'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=100, help='Timed requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--only', nargs='*', help='Endpoint names to run')
+        parser.add_argument('--baseline', help='Baseline JSON to compare against')
+        parser.add_argument('--save-baseline', help='Write results to this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.25)
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--batch', action='store_true',
+                            help='Also time the dashboard bootstrap as separate calls vs one /api/batch/ call')
+        parser.add_argument('--rtt-ms', type=float, default=0.0,
+                            help='Simulated client round trip added to each call in the --batch and --quotes comparisons')
+        parser.add_argument('--serializers', action='store_true',
+                            help='Also compare CPU time per list page: model serializers vs the row read path')
+        parser.add_argument('--quotes', action='store_true',
+                            help='Also time pricing carts of several sizes: separate calls vs /api/cart/quote/')
+        parser.add_argument('--autocomplete', action='store_true',
+                            help='Also time type-ahead lookups: /api/products/?search= vs /api/autocomplete/')
+        parser.add_argument('--recommendations', action='store_true',
+                            help='Also time related products: computed live vs precomputed by build_recommendations')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            # A file database lets worker threads share the seeded data
+            tmpdir = tempfile.mkdtemp(prefix='ffbench-')
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Every request comes from one client, which the rate limits would stop
+        throttling_off = override_settings(THROTTLE_ENABLED=False)
+        throttling_off.enable()
+        try:
+            seed_dataset(
+                categories=options['categories'],
+                products=options['products'],
+                orders=options['orders'],
+            )
+            endpoints = default_endpoints()
+            if options['only']:
+                endpoints = [endpoint for endpoint in endpoints if endpoint.name in options['only']]
+            results = run_benchmarks(endpoints, options['requests'], options['concurrency'])
+            batch_timings = compare_batch(rtt_ms=options['rtt_ms']) if options['batch'] else None
+            serializer_timings = compare_serializers() if options['serializers'] else None
+            quote_timings = compare_quotes(rtt_ms=options['rtt_ms']) if options['quotes'] else None
+            autocomplete_timings = compare_autocomplete() if options['autocomplete'] else None
+            recommendation_timings = compare_recommendations() if options['recommendations'] else None
+        finally:
+            throttling_off.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        header = f"{'endpoint':<24}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KB':>10}{'errors':>8}"
+        self.stdout.write(header)
+        for r in results:
+            self.stdout.write(
+                f'{r.name:<24}{r.throughput:>9}{r.p50_ms:>9}{r.p95_ms:>9}{r.p99_ms:>9}'
+                f'{r.queries:>9}{r.peak_memory_kb:>10}{r.errors:>8}'
+            )
+
+        if batch_timings:
+            self.stdout.write(
+                f"\ndashboard bootstrap: {batch_timings['sequential']} ms as separate calls, "
+                f"{batch_timings['batch']} ms batched ({batch_timings['speedup']}x)"
+            )
+
+        if serializer_timings:
+            for name in ('products', 'orders'):
+                self.stdout.write(
+                    f"{name} list page ({serializer_timings[f'{name}_rows_per_page']} rows): "
+                    f"{serializer_timings[f'{name}_model']} ms CPU with model serializers, "
+                    f"{serializer_timings[f'{name}_rows']} ms with the row read path "
+                    f"({serializer_timings[f'{name}_speedup']}x)"
+                )
+
+        if quote_timings:
+            self.stdout.write(f"\n{'cart lines':<12}{'separate ms':>13}{'quote ms':>10}{'cached ms':>11}{'queries':>9}")
+            for row in quote_timings:
+                self.stdout.write(
+                    f"{row['size']:<12}{row['separate']:>13}{row['uncached']:>10}{row['cached']:>11}{row['queries']:>9}"
+                )
+
+        if autocomplete_timings:
+            self.stdout.write(f"\nautocomplete index build: {autocomplete_timings['build_seconds']} s")
+            self.stdout.write(f"{'prefix':<10}{'search ms':>11}{'autocomplete ms':>17}")
+            for row in autocomplete_timings['prefixes']:
+                self.stdout.write(f"{row['prefix']:<10}{row['search']:>11}{row['autocomplete']:>17}")
+
+        if recommendation_timings:
+            self.stdout.write(
+                f"\nrelated products: {recommendation_timings['live']} ms computed live, "
+                f"{recommendation_timings['precomputed']} ms precomputed "
+                f"(full build {recommendation_timings['build_seconds']} s)"
+            )
+
+        if options['save_baseline']:
+            save_baseline(results, options['save_baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['save_baseline']}"))
+
+        if options['baseline']:
+            regressions = compare_to_baseline(results, load_baseline(options['baseline']), options['tolerance'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f'REGRESSION {regression}'))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+            elif options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regression(s) against baseline')
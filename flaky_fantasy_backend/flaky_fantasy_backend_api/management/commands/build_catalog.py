@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from flaky_fantasy_backend_api.snapshot import build_snapshot, snapshot_root
+
+
+class Command(BaseCommand):
+    help = 'Write the storefront catalog as static versioned JSON, rebuilding only shards with changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every shard')
+
+    def handle(self, *args, **options):
+        manifest, rebuilt = build_snapshot(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Catalog v{manifest['version']} in {snapshot_root()}: "
+            f"rebuilt {len(rebuilt)} of {manifest['shard_count']} product shards"
+        ))
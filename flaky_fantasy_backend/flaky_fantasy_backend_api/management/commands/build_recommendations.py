@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flaky_fantasy_backend_api.recommendations import ConcurrentRun, rebuild_recommendations, update_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Update "frequently bought together" recommendations from orders placed since the last run (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recount every order; also drops pairs from deleted order items')
+        parser.add_argument('--lag', type=int, help='Seconds an order must age first; defaults to settings.RECOMMENDATIONS_LAG')
+
+    def handle(self, *args, **options):
+        lag = timedelta(seconds=options['lag']) if options['lag'] is not None else None
+        try:
+            run = rebuild_recommendations(lag) if options['full'] else update_recommendations(lag)
+        except ConcurrentRun as exc:
+            raise CommandError(str(exc))
+        if run is None:
+            self.stdout.write('No new orders since the last run')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Rebuilt' if run.full else 'Updated'} recommendations for {run.products} products "
+            f"from {run.orders} orders, up to order item {run.last_item_id}"
+        ))
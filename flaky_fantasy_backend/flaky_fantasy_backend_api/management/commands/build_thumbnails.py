@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from flaky_fantasy_backend_api.models import ProductImage
+from flaky_fantasy_backend_api.thumbnails import make_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Make the admin thumbnails missing for any product image (images saved since get theirs on save)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        written = images = 0
+        queryset = ProductImage.objects.order_by('id').only('id', 'image')
+        for product_image in queryset.iterator(chunk_size=options['chunk_size']):
+            images += 1
+            written += make_thumbnails(product_image.image)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} thumbnails for {images} images'))
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Case, Sum, Value, When
+
+from flaky_fantasy_backend_api.inventory import ID_CHUNK_SIZE, ledger_totals, stock_levels
+from flaky_fantasy_backend_api.models import Product, StockMovement, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Check Product.stock_quantity and the latest snapshot plus tail against the full inventory ledger; '
+        '--fix rewrites the cache and snapshots from the ledger'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Repair drift instead of failing')
+        parser.add_argument('--limit', type=int, default=20, help='Mismatches to list')
+
+    def handle(self, *args, **options):
+        checked = 0
+        cache_drift = {}
+        snapshot_drift = {}
+        last_id = 0
+        while True:
+            rows = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'stock_quantity')[:ID_CHUNK_SIZE])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            ids = [product_id for product_id, _ in rows]
+            totals = ledger_totals(ids)
+            levels = stock_levels(ids)
+            for product_id, cached in rows:
+                if cached != totals[product_id]:
+                    cache_drift[product_id] = (cached, totals[product_id])
+                if levels[product_id][0] != totals[product_id]:
+                    snapshot_drift[product_id] = (levels[product_id][0], totals[product_id])
+            checked += len(rows)
+
+        self.stdout.write(f'Checked {checked} products against the ledger')
+        for label, drift in (('stock_quantity', cache_drift), ('snapshot + tail', snapshot_drift)):
+            for product_id, (found, expected) in list(drift.items())[:options['limit']]:
+                self.stdout.write(f'  product {product_id}: {label} {found}, ledger {expected}')
+        if not cache_drift and not snapshot_drift:
+            self.stdout.write(self.style.SUCCESS('Stock matches the ledger'))
+            return
+
+        summary = f'{len(cache_drift)} stock_quantity and {len(snapshot_drift)} snapshot mismatches'
+        if not options['fix']:
+            raise CommandError(summary)
+        self.fix_cache(cache_drift)
+        self.fix_snapshots(snapshot_drift)
+        self.stdout.write(self.style.SUCCESS(f'Repaired {summary}'))
+
+    def fix_cache(self, drift):
+        negative = [product_id for product_id, (_, expected) in drift.items() if expected < 0]
+        if negative:
+            self.stdout.write(self.style.WARNING(
+                f"Ledger is below zero for product(s) {', '.join(map(str, negative))}; left for a manual adjustment"
+            ))
+        ids = [product_id for product_id in drift if product_id not in negative]
+        for i in range(0, len(ids), ID_CHUNK_SIZE):
+            chunk = ids[i:i + ID_CHUNK_SIZE]
+            Product.objects.filter(id__in=chunk).update(
+                stock_quantity=Case(*[When(id=product_id, then=Value(drift[product_id][1])) for product_id in chunk]),
+                in_stock=Case(*[When(id=product_id, then=Value(drift[product_id][1] > 0)) for product_id in chunk]),
+            )
+
+    def fix_snapshots(self, drift):
+        # Replacement snapshots sit at the current watermark, so the next
+        # snapshot_stock round carries on from the same place
+        latest = StockSnapshot.objects.order_by('-last_movement_id').values('last_movement_id', 'as_of').first()
+        if latest is None or not drift:
+            return
+        ids = list(drift)
+        totals = {}
+        for i in range(0, len(ids), ID_CHUNK_SIZE):
+            totals.update(
+                StockMovement.objects.filter(product_id__in=ids[i:i + ID_CHUNK_SIZE], id__lte=latest['last_movement_id'])
+                .order_by().values('product').annotate(total=Sum('quantity')).values_list('product', 'total')
+            )
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(
+                product_id=product_id, quantity=totals.get(product_id, 0),
+                last_movement_id=latest['last_movement_id'], as_of=latest['as_of'],
+            )
+            for product_id in ids
+        ])
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from flaky_fantasy_backend_api.media_gc import collect_media, quarantine_root
+
+
+def _mib(size):
+    return f'{size / 1024 / 1024:.1f} MiB'
+
+
+class Command(BaseCommand):
+    help = 'Quarantine media files no row references, and delete those quarantined long enough (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be quarantined, restored or deleted')
+        parser.add_argument('--grace', type=int, help='Seconds a file must age first; defaults to settings.MEDIA_GC_GRACE_SECONDS')
+        parser.add_argument('--quarantine-seconds', type=int,
+                            help='Seconds a file stays quarantined before deletion; defaults to settings.MEDIA_QUARANTINE_SECONDS')
+        parser.add_argument('--workers', type=int, help='Directory scanning threads; defaults to settings.MEDIA_GC_WORKERS')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or getattr(settings, 'MEDIA_GC_WORKERS', 8)
+        report = collect_media(
+            dry_run=options['dry_run'], grace=options['grace'], hold=options['quarantine_seconds'], workers=workers,
+        )
+        would = 'would be ' if options['dry_run'] else ''
+        self.stdout.write(
+            f'Scanned {report.scanned} files ({_mib(report.scanned_bytes)}); '
+            f'{report.too_new} unreferenced but too new to collect'
+        )
+        self.stdout.write(
+            f'{report.orphans} orphaned files ({_mib(report.orphan_bytes)}) {would}quarantined in {quarantine_root()}'
+        )
+        self.stdout.write(f'{report.restored} quarantined files {would}restored, referenced again')
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.purged} quarantined files {would}deleted, {_mib(report.purged_bytes)} {would or "was "}reclaimed'
+        ))
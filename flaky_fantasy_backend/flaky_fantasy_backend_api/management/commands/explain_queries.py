@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from flaky_fantasy_backend_api.models import Category, Product, Order
+from flaky_fantasy_backend_api.query_plans import capture_plans
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN output for the hot viewset queries and flag full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error if any hot query does a full table scan')
+
+    def handle(self, *args, **options):
+        sample = {
+            'category': Category.objects.values_list('id', flat=True).first(),
+            'product': Product.objects.values_list('id', flat=True).first(),
+        }
+        if sample['category'] is None or sample['product'] is None:
+            raise CommandError('Seed at least one category and product first')
+        # Plans don't depend on a match, so placeholders do when there are no orders
+        order = Order.objects.values('customer_email', 'customer_phone', 'order_number').first() or {
+            'customer_email': 'customer@example.com', 'customer_phone': '+2340000000', 'order_number': 'FF0000000001',
+        }
+        sample.update(
+            email=order['customer_email'], phone=order['customer_phone'][:8], order_number=order['order_number'],
+        )
+
+        scanned = []
+        for name, (plan, table, is_scan) in capture_plans(sample).items():
+            marker = self.style.ERROR('FULL SCAN') if is_scan else self.style.SUCCESS('indexed')
+            self.stdout.write(f'== {name} [{marker}]')
+            self.stdout.write(plan)
+            if is_scan:
+                scanned.append(name)
+
+        if scanned and options['fail_on_scan']:
+            raise CommandError(f"Full table scans in: {', '.join(scanned)}")
@@ -0,0 +1,381 @@
+import math
+import multiprocessing
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from flaky_fantasy_backend_api.models import (
+    AdminUser, Category, ProductLabel, Product, ProductImage,
+    ProductDiscount, Order, OrderItem, Notification, StockMovement
+)
+from flaky_fantasy_backend_api.inventory import opening_movements
+from flaky_fantasy_backend_api.normalize import (
+    normalize_email, normalize_phone, normalize_order_number, normalize_name
+)
+
+# Order status mix for a shop that has been trading for a while
+STATUS_WEIGHTS = [
+    ('delivered', 60), ('shipped', 10), ('processing', 8), ('pending', 12), ('cancelled', 10),
+]
+FIRST_NAMES = ['Amara', 'Ben', 'Chioma', 'Daniel', 'Esther', 'Femi', 'Grace', 'Hassan', 'Ifeoma', 'James',
+               'Kemi', 'Lina', 'Musa', 'Ngozi', 'Olu', 'Precious', 'Rita', 'Samuel', 'Tobi', 'Uche']
+LAST_NAMES = ['Adeyemi', 'Bello', 'Chukwu', 'Danjuma', 'Eze', 'Fofana', 'Garba', 'Ibrahim', 'Johnson',
+              'Kamara', 'Mensah', 'Nwosu', 'Okafor', 'Ogunleye', 'Smith', 'Tanko', 'Usman', 'Williams']
+ADJECTIVES = ['Classic', 'Velvet', 'Chocolate', 'Vanilla', 'Strawberry', 'Lemon', 'Caramel', 'Red', 'Golden',
+              'Mini', 'Royal', 'Fluffy', 'Crispy', 'Honey', 'Coconut', 'Almond', 'Mango', 'Berry']
+NOUNS = ['Cake', 'Cupcake', 'Croissant', 'Doughnut', 'Tart', 'Cookie', 'Brownie', 'Muffin', 'Pie',
+         'Macaron', 'Eclair', 'Roll', 'Loaf', 'Puff', 'Cheesecake', 'Scone']
+ORDER_CHUNK = 10000
+
+# Fields stamped by auto_now/auto_now_add; switched off so history can be backdated
+TIMESTAMP_FIELDS = [
+    (Category, 'created_at'), (Product, 'created_at'), (Product, 'updated_at'),
+    (Order, 'created_at'), (Order, 'updated_at'), (Notification, 'created_at'),
+]
+
+_worker_state = {}
+
+
+@contextmanager
+def backdated_timestamps():
+    saved = []
+    for model, name in TIMESTAMP_FIELDS:
+        field = model._meta.get_field(name)
+        saved.append((field, field.auto_now, field.auto_now_add))
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def zipf_cum_weights(n, s=1.1):
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+def next_id(model):
+    return (model.objects.aggregate(m=Max('pk'))['m'] or 0) + 1
+
+
+def money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def _init_worker(state):
+    import django
+    django.setup()
+    _worker_state.update(state)
+    for model, name in TIMESTAMP_FIELDS:
+        field = model._meta.get_field(name)
+        field.auto_now = field.auto_now_add = False
+
+
+def _db_datetime(value):
+    # SQLite stores naive UTC text; Postgres takes aware datetimes as they are
+    if connection.vendor == 'sqlite':
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _insert_rows(model, columns, rows, batch_size):
+    """Plain executemany INSERT; skips per-object ORM work for the biggest tables."""
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(model._meta.db_table),
+        ', '.join(qn(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[offset:offset + batch_size])
+
+
+def _generate_order_chunk(task):
+    """Build and insert one chunk of orders and items; deterministic per chunk."""
+    chunk_index, first_id, count = task
+    state = _worker_state
+    rng = random.Random(f"{state['seed']}-orders-{chunk_index}")
+    product_ids = state['product_ids']
+    product_prices = state['product_prices']
+    cum_weights = state['product_cum_weights']
+    product_range = range(len(product_ids))
+    statuses, status_weights = zip(*STATUS_WEIGHTS)
+    now = state['now']
+    span_seconds = state['span_days'] * 86400
+
+    orders = []
+    items = []
+    for order_id in range(first_id, first_id + count):
+        # Sqrt skew puts more orders in recent months, like a growing shop
+        created = now - timedelta(seconds=span_seconds * (1 - math.sqrt(rng.random())))
+        line_count = min(1 + int(rng.expovariate(0.6)), 12)
+        total = Decimal('0')
+        for pick in rng.choices(product_range, cum_weights=cum_weights, k=line_count):
+            quantity = 1 if rng.random() < 0.7 else rng.randint(2, 6)
+            price = product_prices[pick]
+            total += price * quantity
+            items.append((order_id, product_ids[pick], quantity, price))
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        number = f'FF{order_id:010d}'
+        name = f'{first} {last}'
+        email = f'{first.lower()}.{last.lower()}{rng.randint(1, 9999)}@example.com'
+        phone = f'+234{rng.randint(7000000000, 9099999999)}'
+        orders.append((
+            order_id,
+            number,
+            name,
+            email,
+            phone,
+            f'{rng.randint(1, 300)} {rng.choice(LAST_NAMES)} Street',
+            rng.choices(statuses, weights=status_weights)[0],
+            total,
+            _db_datetime(created),
+            _db_datetime(min(created + timedelta(hours=rng.randint(0, 96)), now)),
+            normalize_email(email),
+            normalize_phone(phone),
+            normalize_order_number(number),
+            normalize_name(name),
+        ))
+
+    batch_size = state['batch_size']
+    with transaction.atomic():
+        _insert_rows(Order, [
+            'id', 'order_number', 'customer_name', 'customer_email', 'customer_phone',
+            'shipping_address', 'status', 'total_amount', 'created_at', 'updated_at',
+            *Order.LOOKUP_FIELDS,
+        ], orders, batch_size)
+        _insert_rows(OrderItem, ['order_id', 'product_id', 'quantity', 'price_at_purchase'], items, batch_size)
+    return len(orders), len(items)
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, deterministic synthetic dataset for profiling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--labels', type=int, default=30)
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--notifications', type=int, default=50000)
+        parser.add_argument('--staff', type=int, default=5, help='Staff accounts to receive notifications')
+        parser.add_argument('--days', type=int, default=730, help='How far back order history goes')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes generating orders in parallel (ignored on SQLite)')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        started = time.perf_counter()
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+                cursor.execute('PRAGMA journal_mode = WAL')
+
+        with backdated_timestamps():
+            staff = self.generate_staff(options['staff'])
+            categories = self.generate_categories(options['categories'])
+            labels = self.generate_labels(options['labels'])
+            products = self.generate_products(options['products'], categories, labels)
+            order_ids = self.generate_orders(options['orders'], products, options)
+            self.generate_notifications(options['notifications'], staff, order_ids)
+        self.reset_sequences()
+
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.1f}s'))
+
+    def reset_sequences(self):
+        # Rows were inserted with explicit ids, so Postgres sequences lag behind
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [AdminUser, Category, ProductLabel, Product, Order]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def report(self, label, count, since):
+        elapsed = time.perf_counter() - since
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f'{label}: {count} rows in {elapsed:.1f}s ({rate:,.0f}/s)')
+
+    def generate_staff(self, count):
+        existing = list(AdminUser.objects.filter(is_staff=True, is_active=True).values_list('id', flat=True))
+        missing = max(0, count - len(existing))
+        start = next_id(AdminUser)
+        users = [
+            AdminUser(id=start + i, username=f'staff{start + i}', email=f'staff{start + i}@example.com',
+                      is_staff=True, role='staff', password='!')
+            for i in range(missing)
+        ]
+        AdminUser.objects.bulk_create(users)
+        return existing + [user.id for user in users]
+
+    def generate_categories(self, count):
+        since = time.perf_counter()
+        start = next_id(Category)
+        rows = [
+            Category(id=start + i, name=f'{self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)}s {start + i}',
+                     created_at=self.now - timedelta(days=self.rng.randint(0, 900)))
+            for i in range(count)
+        ]
+        Category.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.report('categories', count, since)
+        return [row.id for row in rows]
+
+    def generate_labels(self, count):
+        since = time.perf_counter()
+        start = next_id(ProductLabel)
+        rows = [
+            ProductLabel(id=start + i, name=f'Label {start + i}', color=f'#{self.rng.randint(0, 0xFFFFFF):06X}')
+            for i in range(count)
+        ]
+        ProductLabel.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.report('labels', count, since)
+        return [row.id for row in rows]
+
+    def generate_products(self, count, categories, labels):
+        """Returns ``(ids, prices)`` in popularity order for order generation."""
+        since = time.perf_counter()
+        rng = self.rng
+        start = next_id(Product)
+        category_weights = zipf_cum_weights(len(categories))
+        through = Product.labels.through
+        ids, prices = [], []
+        discount_count = image_count = 0
+
+        for offset in range(0, count, self.batch_size):
+            products, product_labels, images, discounts = [], [], [], []
+            for product_id in range(start + offset, start + min(offset + self.batch_size, count)):
+                price = money(min(max(rng.lognormvariate(2.8, 0.7), 1), 500))
+                stock = 0 if rng.random() < 0.05 else int(rng.paretovariate(1.5) * 5)
+                created = self.now - timedelta(days=rng.randint(0, 720), seconds=rng.randint(0, 86400))
+                products.append(Product(
+                    id=product_id,
+                    name=f'{rng.choice(ADJECTIVES)} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}',
+                    description='Freshly baked.' if rng.random() < 0.8 else None,
+                    price=price,
+                    category_id=rng.choices(categories, cum_weights=category_weights)[0],
+                    stock_quantity=min(stock, 1000),
+                    in_stock=stock > 0,
+                    created_at=created,
+                    updated_at=min(created + timedelta(days=rng.randint(0, 30)), self.now),
+                ))
+                for label_id in rng.sample(labels, min(len(labels), rng.choices([0, 1, 2, 3], [30, 40, 20, 10])[0])):
+                    product_labels.append(through(product_id=product_id, productlabel_id=label_id))
+                for position in range(rng.randint(1, 5)):
+                    images.append(ProductImage(
+                        product_id=product_id, image=f'products/{product_id}-{position}.jpg',
+                        alt_text='', is_primary=position == 0,
+                    ))
+                if rng.random() < 0.1:
+                    starts = self.now - timedelta(days=rng.randint(-10, 60))
+                    discounts.append(ProductDiscount(
+                        product_id=product_id,
+                        discount_type=rng.choice(['percentage', 'fixed']),
+                        value=money(rng.choice([5, 10, 15, 20, 25])),
+                        start_date=starts,
+                        end_date=starts + timedelta(days=rng.randint(3, 90)),
+                        is_active=rng.random() < 0.9,
+                    ))
+                ids.append(product_id)
+                prices.append(price)
+
+            with transaction.atomic():
+                Product.objects.bulk_create(products)
+                StockMovement.objects.bulk_create(opening_movements(products), batch_size=self.batch_size)
+                through.objects.bulk_create(product_labels, batch_size=self.batch_size)
+                ProductImage.objects.bulk_create(images, batch_size=self.batch_size)
+                ProductDiscount.objects.bulk_create(discounts, batch_size=self.batch_size)
+            image_count += len(images)
+            discount_count += len(discounts)
+
+        self.report('products', count, since)
+        self.stdout.write(f'  with {image_count} images and {discount_count} discounts')
+
+        # Shuffle so popularity (Zipf rank) is independent of id
+        order = list(range(len(ids)))
+        rng.shuffle(order)
+        return [ids[i] for i in order], [prices[i] for i in order]
+
+    def generate_orders(self, count, products, options):
+        if not count or not products[0]:
+            return range(0)
+        since = time.perf_counter()
+        product_ids, product_prices = products
+        state = {
+            'seed': options['seed'],
+            'product_ids': product_ids,
+            'product_prices': product_prices,
+            'product_cum_weights': zipf_cum_weights(len(product_ids)),
+            'now': self.now,
+            'span_days': options['days'],
+            'batch_size': self.batch_size,
+        }
+        start = next_id(Order)
+        tasks = [
+            (index, start + offset, min(ORDER_CHUNK, count - offset))
+            for index, offset in enumerate(range(0, count, ORDER_CHUNK))
+        ]
+
+        workers = options['workers']
+        if connection.vendor == 'sqlite' and workers > 1:
+            self.stdout.write('SQLite allows a single writer; generating orders in-process')
+            workers = 1
+
+        orders = items = 0
+        if workers > 1:
+            # Children open their own connections; inherited sockets must not be shared
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(state,)) as pool:
+                for chunk_orders, chunk_items in pool.imap_unordered(_generate_order_chunk, tasks):
+                    orders += chunk_orders
+                    items += chunk_items
+        else:
+            _worker_state.update(state)
+            for chunk_orders, chunk_items in map(_generate_order_chunk, tasks):
+                orders += chunk_orders
+                items += chunk_items
+
+        self.report('orders', orders, since)
+        self.stdout.write(f'  with {items} order items')
+        return range(start, start + count)
+
+    def generate_notifications(self, count, staff, order_ids):
+        if not count or not staff:
+            return
+        since = time.perf_counter()
+        rng = self.rng
+        types = ['order', 'low_stock', 'system']
+        for offset in range(0, count, self.batch_size):
+            rows = []
+            for _ in range(min(self.batch_size, count - offset)):
+                kind = rng.choices(types, weights=[70, 20, 10])[0]
+                created = self.now - timedelta(seconds=rng.randint(0, 180 * 86400))
+                rows.append(Notification(
+                    recipient_id=rng.choice(staff),
+                    notification_type=kind,
+                    title={'order': 'New order', 'low_stock': 'Low stock', 'system': 'System alert'}[kind],
+                    message='Generated notification',
+                    # Older notifications are much more likely to have been read
+                    is_read=rng.random() < min(0.95, (self.now - created).days / 30),
+                    created_at=created,
+                    related_order_id=rng.choice(order_ids) if kind == 'order' and order_ids else None,
+                ))
+            Notification.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.report('notifications', count, since)
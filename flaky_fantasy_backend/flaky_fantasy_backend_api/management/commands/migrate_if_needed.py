@@ -0,0 +1,27 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+class Command(BaseCommand):
+    help = 'Run migrate only when there are unapplied migrations'
+    # Checks run with the real migrate when it is needed; skipping them here
+    # is most of what makes the no-op case fast
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        database = options['database']
+        executor = MigrationExecutor(connections[database])
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if not plan:
+            if options['verbosity'] > 0:
+                self.stdout.write('No migrations to apply')
+            return
+        call_command(
+            'migrate', database=database, verbosity=options['verbosity'], interactive=False,
+            stdout=self.stdout, stderr=self.stderr,
+        )
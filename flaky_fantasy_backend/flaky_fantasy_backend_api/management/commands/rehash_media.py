@@ -0,0 +1,73 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from flaky_fantasy_backend_api.models import ProductImage, Service
+from flaky_fantasy_backend_api.storage import content_addressed_storage, is_blob
+
+IMAGE_FIELDS = [
+    (ProductImage, 'image'),
+    (Service, 'icon'),
+    (Service, 'image'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Move existing media into content-addressed blobs and repoint image fields at them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--remove-originals', action='store_true',
+                            help='Delete each original file once every reference points at its blob')
+
+    def handle(self, *args, **options):
+        storage = content_addressed_storage
+        moved = missing = deduplicated = saved_bytes = 0
+        seen_blobs = set()
+
+        for model, field_name in IMAGE_FIELDS:
+            # Materialise the names first; rows are updated while we go
+            names = list(
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .exclude(**{f'{field_name}__startswith': 'blobs/'})
+                .values_list(field_name, flat=True).distinct().order_by()
+            )
+            for name in names:
+                path = storage.path(name)
+                if not os.path.exists(path):
+                    missing += 1
+                    self.stderr.write(f'Missing file for {model.__name__}.{field_name}: {name}')
+                    continue
+                if options['dry_run']:
+                    moved += 1
+                    continue
+
+                size = os.path.getsize(path)
+                with open(path, 'rb') as f:
+                    blob = storage.save(name, File(f))
+                if blob in seen_blobs:
+                    deduplicated += 1
+                    saved_bytes += size
+                seen_blobs.add(blob)
+
+                # Every row sharing the old name is repointed in one statement
+                model.objects.filter(**{field_name: name}).update(**{field_name: blob})
+                moved += 1
+
+                if options['remove_originals'] and not self.still_referenced(name):
+                    os.unlink(path)
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {moved} files into blobs ({deduplicated} duplicates, '
+            f'{saved_bytes / 1024 / 1024:.1f} MiB saved), {missing} missing'
+        ))
+
+    def still_referenced(self, name):
+        if is_blob(name):
+            return True
+        return any(
+            model.objects.filter(**{field_name: name}).exists()
+            for model, field_name in IMAGE_FIELDS
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from flaky_fantasy_backend_api.stock_alerts import scan_low_stock
+
+
+class Command(BaseCommand):
+    help = 'Create low_stock notifications for every product at or below its threshold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        alerted = scan_low_stock(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Alerted on {alerted} low-stock products'))
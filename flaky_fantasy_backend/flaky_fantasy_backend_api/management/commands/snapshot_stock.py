@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from flaky_fantasy_backend_api.inventory import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Snapshot ledger stock for every product with movements since the last run (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag', type=int, help='Seconds a movement must age first; defaults to settings.INVENTORY_SNAPSHOT_LAG')
+
+    def handle(self, *args, **options):
+        lag = timedelta(seconds=options['lag']) if options['lag'] is not None else None
+        written = take_snapshots(lag)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} stock snapshots'))
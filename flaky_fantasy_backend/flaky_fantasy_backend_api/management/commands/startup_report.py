@@ -0,0 +1,96 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Highlighted in the report even when they aren't among the slowest
+KEY_PACKAGES = ['django', 'rest_framework', 'rest_framework_simplejwt', 'django_filters', 'PIL', 'psycopg2']
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(.*)$')
+
+# Runs in a fresh interpreter so nothing is imported or cached yet
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - start
+warm = {}
+if sys.argv[1] == 'warm':
+    from flaky_fantasy_backend_api.warmup import warm_up
+    warm = warm_up()
+from django.test import Client
+client = Client(HTTP_HOST=sys.argv[3])
+begin = time.perf_counter()
+status = client.get(sys.argv[2]).status_code
+first = time.perf_counter() - begin
+begin = time.perf_counter()
+client.get(sys.argv[2])
+second = time.perf_counter() - begin
+print(json.dumps({'setup': setup, 'warm': warm, 'first': first, 'second': second, 'status': status}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Report import time per package and time-to-first-response with and without the warm-up hook'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/categories/', help='Request timed as the first response')
+        parser.add_argument('--top', type=int, default=15, help='Packages to list by import time')
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes per measurement (median is shown)')
+
+    def run_probe(self, *args, importtime=False):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE, *args]
+        result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f'Probe failed:\n{result.stderr[-2000:]}')
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def handle(self, *args, **options):
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h and h != '*'), 'localhost')
+        probe_args = (options['path'], host)
+
+        _, importtime = self.run_probe('cold', *probe_args, importtime=True)
+        by_package = defaultdict(int)
+        for line in importtime.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                # Self time summed per top-level package, so nested imports aren't double counted
+                by_package[match.group(3).strip().split('.')[0]] += int(match.group(1))
+        total = sum(by_package.values())
+
+        self.stdout.write(f'Import time by package (total {total / 1000:.0f} ms, under -X importtime)')
+        ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)
+        shown = [name for name, _ in ranked[:options['top']]]
+        shown += [name for name in KEY_PACKAGES if name in by_package and name not in shown]
+        for name in shown:
+            self.stdout.write(f'  {name:<28}{by_package[name] / 1000:>9.1f} ms')
+
+        runs = {'cold': [], 'warm': []}
+        for _ in range(options['runs']):
+            for mode in runs:
+                runs[mode].append(self.run_probe(mode, *probe_args)[0])
+
+        def median(mode, key):
+            values = sorted(run[key] for run in runs[mode])
+            return values[len(values) // 2] * 1000
+
+        self.stdout.write(f"\nFirst response to {options['path']} in a fresh process (median of {options['runs']})")
+        self.stdout.write(f"  django.setup()             {median('cold', 'setup'):>9.1f} ms")
+        self.stdout.write(f"  first request, cold        {median('cold', 'first'):>9.1f} ms")
+        self.stdout.write(f"  first request, warmed      {median('warm', 'first'):>9.1f} ms")
+        self.stdout.write(f"  steady-state request       {median('cold', 'second'):>9.1f} ms")
+        phases = runs['warm'][0]['warm']
+        self.stdout.write('  warm-up phases: ' + ', '.join(
+            f"{name} {sorted(run['warm'][name] for run in runs['warm'])[len(runs['warm']) // 2] * 1000:.1f} ms"
+            for name in phases
+        ))
+        status = runs['cold'][0]['status']
+        if status >= 400:
+            self.stdout.write(self.style.WARNING(f"{options['path']} answered {status}; timings may not be representative"))
@@ -0,0 +1,242 @@
+import hashlib
+import os
+import posixpath
+import shutil
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import FileField
+
+from .storage import BLOB_DIR
+from .thumbnails import THUMBNAIL_DIR
+
+REFERENCE_CHUNK_SIZE = 5000
+
+
+@dataclass
+class CollectionReport:
+    scanned: int = 0
+    scanned_bytes: int = 0
+    too_new: int = 0
+    orphans: int = 0
+    orphan_bytes: int = 0
+    restored: int = 0
+    purged: int = 0
+    purged_bytes: int = 0
+
+
+def _key(name):
+    # 8 bytes per name keeps the set small; a collision can only keep an orphan, never drop a live file
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big')
+
+
+def media_fields():
+    """Every (model, field name) whose files live under MEDIA_ROOT."""
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, FileField) and os.path.realpath(field.storage.location) == media_root
+    ]
+
+
+def collected_dirs(fields):
+    """
+    Directories the collector may remove files from: the blob store, the
+    thumbnails, and each field's fixed upload_to. The catalog snapshot and
+    anything else under MEDIA_ROOT is never touched.
+    """
+    dirs = {BLOB_DIR, THUMBNAIL_DIR}
+    for model, field_name in fields:
+        upload_to = model._meta.get_field(field_name).upload_to
+        if isinstance(upload_to, str) and upload_to.strip('/') and '%' not in upload_to:
+            dirs.add(upload_to.strip('/'))
+    # Nested upload_to directories are walked from their parent
+    return sorted(d for d in dirs if not any(d.startswith(f'{parent}/') for parent in dirs))
+
+
+class References:
+    """
+    Keys of every file name the database references, and of each name less
+    its extension for matching thumbnails. Names are streamed column by
+    column, so memory grows with the references, not the rows or the files.
+    """
+
+    def __init__(self, fields):
+        self.names = set()
+        self.roots = set()
+        for model, field_name in fields:
+            names = (
+                model._base_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .order_by().values_list(field_name, flat=True).iterator(chunk_size=REFERENCE_CHUNK_SIZE)
+            )
+            for name in names:
+                self.names.add(_key(name))
+                self.roots.add(_key(posixpath.splitext(name)[0]))
+
+    def __contains__(self, name):
+        if name.startswith(f'{THUMBNAIL_DIR}/'):
+            # thumbnails/<size>/<source name less extension>.jpg
+            parts = name.split('/', 2)
+            return len(parts) == 3 and _key(posixpath.splitext(parts[2])[0]) in self.roots
+        return _key(name) in self.names
+
+
+def _scan_dir(root, rel_dir, references, cutoff, skip):
+    """One directory: its subdirectories, its orphans as (name, size) and its totals."""
+    subdirs, orphans = [], []
+    scanned = scanned_bytes = too_new = 0
+    with os.scandir(os.path.join(root, rel_dir)) as entries:
+        for entry in entries:
+            name = posixpath.join(rel_dir, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                if name not in skip:
+                    subdirs.append(name)
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            scanned += 1
+            scanned_bytes += stat.st_size
+            if name in references:
+                continue
+            if stat.st_mtime >= cutoff:
+                # Possibly an upload whose row isn't committed yet
+                too_new += 1
+            else:
+                orphans.append((name, stat.st_size))
+    return subdirs, orphans, (scanned, scanned_bytes, too_new)
+
+
+def find_orphans(references, report, dirs, root=None, grace=None, workers=8, skip=()):
+    """
+    Walk ``dirs`` under ``root`` (MEDIA_ROOT) on a thread pool, a directory
+    per task, and yield (name, size) for each unreferenced file older than
+    ``grace`` seconds. At most two tasks per worker are in flight, so only
+    that many directories' orphans are held however many files there are.
+    """
+    root = root or settings.MEDIA_ROOT
+    grace = grace if grace is not None else getattr(settings, 'MEDIA_GC_GRACE_SECONDS', 3600)
+    cutoff = time.time() - grace
+    skip = set(skip)
+    queue = deque(rel_dir for rel_dir in dirs if os.path.isdir(os.path.join(root, rel_dir)))
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while queue or pending:
+            while queue and len(pending) < workers * 2:
+                pending.add(pool.submit(_scan_dir, root, queue.popleft(), references, cutoff, skip))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirs, orphans, (scanned, scanned_bytes, too_new) = future.result()
+                queue.extend(subdirs)
+                report.scanned += scanned
+                report.scanned_bytes += scanned_bytes
+                report.too_new += too_new
+                yield from orphans
+
+
+def quarantine_root():
+    # Inside MEDIA_ROOT by default, so quarantining and restoring are renames on one filesystem
+    return getattr(settings, 'MEDIA_QUARANTINE_ROOT', None) or os.path.join(settings.MEDIA_ROOT, '.quarantine')
+
+
+def _move(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(source, target)
+
+
+def quarantine(name, root=None, quarantine_dir=None, cutoff=None):
+    """
+    Move ``name`` out of media into the quarantine, where it waits
+    MEDIA_QUARANTINE_SECONDS to be purged. Returns False, leaving the file
+    where it is, if it was modified at or after ``cutoff`` (uploaded again
+    since the scan found it).
+    """
+    root = root or settings.MEDIA_ROOT
+    source = os.path.join(root, name)
+    if cutoff is not None and os.stat(source).st_mtime >= cutoff:
+        return False
+    target = os.path.join(quarantine_dir or quarantine_root(), name)
+    _move(source, target)
+    # The quarantine period runs from now
+    os.utime(target)
+    return True
+
+
+def sweep_quarantine(references, report, root=None, quarantine_dir=None, hold=None, dry_run=False):
+    """
+    Put back quarantined files that are referenced again (the same content
+    uploaded after all, or a row restored) and delete the rest once they
+    have been held ``hold`` seconds.
+    """
+    root = root or settings.MEDIA_ROOT
+    quarantine_dir = quarantine_dir or quarantine_root()
+    hold = hold if hold is not None else getattr(settings, 'MEDIA_QUARANTINE_SECONDS', 7 * 24 * 3600)
+    cutoff = time.time() - hold
+    if not os.path.isdir(quarantine_dir):
+        return
+    for dirpath, dirnames, filenames in os.walk(quarantine_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, quarantine_dir).replace(os.sep, '/')
+            if name in references:
+                report.restored += 1
+                if dry_run:
+                    continue
+                target = os.path.join(root, name)
+                if os.path.exists(target):
+                    # Uploaded again while quarantined; that copy is the live one
+                    os.unlink(path)
+                else:
+                    _move(path, target)
+                continue
+            stat = os.stat(path)
+            if stat.st_mtime < cutoff:
+                report.purged += 1
+                report.purged_bytes += stat.st_size
+                if not dry_run:
+                    os.unlink(path)
+    if not dry_run:
+        # Bottom-up, so emptied parents go too
+        for dirpath, dirnames, filenames in os.walk(quarantine_dir, topdown=False):
+            if dirpath != quarantine_dir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+
+def collect_media(dry_run=False, grace=None, hold=None, workers=8):
+    """
+    One garbage collection round: sweep the quarantine, then move every
+    orphaned media file into it. Files are deleted by a later round once
+    they have sat in quarantine for MEDIA_QUARANTINE_SECONDS still unreferenced.
+    """
+    root = settings.MEDIA_ROOT
+    grace = grace if grace is not None else getattr(settings, 'MEDIA_GC_GRACE_SECONDS', 3600)
+    fields = media_fields()
+    references = References(fields)
+    report = CollectionReport()
+    quarantine_dir = quarantine_root()
+    sweep_quarantine(references, report, root, quarantine_dir, hold, dry_run)
+
+    # Never collect the quarantine itself, in case it sits inside a collected directory
+    skip = {os.path.relpath(quarantine_dir, root).replace(os.sep, '/')}
+    for name, size in find_orphans(references, report, collected_dirs(fields), root, grace, workers, skip):
+        report.orphans += 1
+        report.orphan_bytes += size
+        if not dry_run:
+            try:
+                # The scan may be minutes old by now; check the file again
+                moved = quarantine(name, root, quarantine_dir, cutoff=time.time() - grace)
+            except FileNotFoundError:
+                # Removed since the scan
+                moved = None
+            if not moved:
+                report.orphans -= 1
+                report.orphan_bytes -= size
+                if moved is False:
+                    report.too_new += 1
+    return report
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:35
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flaky_fantasy_backend_api', '0004_order_status_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='related_product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='flaky_fantasy_backend_api.product'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['related_product', 'notification_type', 'created_at'], name='notification_dedupe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock_quantity__lte', 100)), fields=['stock_quantity'], name='product_low_stock_idx'),
+        ),
+    ]
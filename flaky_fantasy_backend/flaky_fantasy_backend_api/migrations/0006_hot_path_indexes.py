@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flaky_fantasy_backend_api', '0005_low_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'in_stock', '-created_at'], name='product_cat_stock_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at'], name='product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productdiscount',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['product', 'start_date', 'end_date'], name='productdiscount_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(condition=models.Q(('is_primary', True)), fields=['product'], name='productimage_primary_idx'),
+        ),
+    ]
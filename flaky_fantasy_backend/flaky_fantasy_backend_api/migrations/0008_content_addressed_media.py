@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:49
+
+from django.db import migrations, models
+import flaky_fantasy_backend_api.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flaky_fantasy_backend_api', '0007_order_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=flaky_fantasy_backend_api.storage.ContentAddressedStorage(), upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='icon',
+            field=models.ImageField(blank=True, null=True, storage=flaky_fantasy_backend_api.storage.ContentAddressedStorage(), upload_to='services/icons/'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=flaky_fantasy_backend_api.storage.ContentAddressedStorage(), upload_to='services/images/'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:13
+
+from django.db import migrations, models
+
+from flaky_fantasy_backend_api.normalize import (
+    normalize_email, normalize_phone, normalize_order_number, normalize_name
+)
+
+BATCH_SIZE = 5000
+
+
+def backfill_normalized(apps, schema_editor):
+    Order = apps.get_model('flaky_fantasy_backend_api', 'Order')
+    connection = schema_editor.connection
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s, {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+        qn(Order._meta.db_table),
+        *map(qn, ['email_normalized', 'phone_normalized', 'number_normalized', 'name_normalized', 'id']),
+    )
+    last_id = 0
+    while True:
+        rows = list(Order.objects.filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'customer_email', 'customer_phone', 'order_number', 'customer_name'
+        )[:BATCH_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                (normalize_email(email), normalize_phone(phone), normalize_order_number(number),
+                 normalize_name(name), order_id)
+                for order_id, email, phone, number, name in rows
+            ])
+
+
+def create_trigram_index(apps, schema_editor):
+    # Fuzzy name search uses pg_trgm on Postgres; other backends fall back to a scan
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS order_name_trgm_idx ON flaky_fantasy_backend_api_order '
+        'USING gin (name_normalized gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS order_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flaky_fantasy_backend_api', '0010_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='email_normalized',
+            field=models.CharField(default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='name_normalized',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='number_normalized',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='phone_normalized',
+            field=models.CharField(default='', editable=False, max_length=20),
+        ),
+        # Fill the new columns before indexing them
+        migrations.RunPython(backfill_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['email_normalized', '-created_at'], name='order_email_idx', opclasses=['varchar_pattern_ops', '']),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['phone_normalized', '-created_at'], name='order_phone_idx', opclasses=['varchar_pattern_ops', '']),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['number_normalized'], name='order_number_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+BATCH_SIZE = 5000
+
+
+def open_ledger(apps, schema_editor):
+    # One opening adjustment per product, so the ledger sums to today's stock_quantity
+    Product = apps.get_model('flaky_fantasy_backend_api', 'Product')
+    StockMovement = apps.get_model('flaky_fantasy_backend_api', 'StockMovement')
+    now = django.utils.timezone.now()
+    last_id = 0
+    while True:
+        rows = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'stock_quantity')[:BATCH_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=product_id, kind='adjustment', quantity=stock, note='Opening balance', created_at=now)
+            for product_id, stock in rows if stock
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flaky_fantasy_backend_api', '0011_order_lookup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('last_movement_id', models.BigIntegerField()),
+                ('as_of', models.DateTimeField()),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='flaky_fantasy_backend_api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-last_movement_id'], name='stocksnapshot_product_idx'), models.Index(fields=['last_movement_id'], name='stocksnapshot_movement_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('restock', 'Restock'), ('sale', 'Sale'), ('adjustment', 'Adjustment'), ('reservation', 'Reservation'), ('release', 'Release')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='flaky_fantasy_backend_api.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='flaky_fantasy_backend_api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'id'], name='stockmovement_product_idx'), models.Index(fields=['created_at'], name='stockmovement_created_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -2,8 +2,11 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
 from django.urls import reverse
 from django.utils.html import format_html
+from .storage import content_addressed_storage
+from .normalize import normalize_email, normalize_phone, normalize_order_number, normalize_name
 
 class AdminUser(AbstractUser):
     ROLE_CHOICES = [
@@ -19,9 +22,16 @@ class AdminUser(AbstractUser):
         verbose_name = 'Administrator'
         verbose_name_plural = 'Administrators'
 
+# Upper bound for low-stock thresholds, so alert scans can stay on a partial index
+LOW_STOCK_MAX_THRESHOLD = 100
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    low_stock_threshold = models.PositiveIntegerField(
+        blank=True, null=True, validators=[MaxValueValidator(LOW_STOCK_MAX_THRESHOLD)]
+    )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -29,6 +39,7 @@ class Category(models.Model):
 class ProductLabel(models.Model):
     name = models.CharField(max_length=50, unique=True)
     color = models.CharField(max_length=7, default="#FF5733")
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -40,16 +51,53 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     labels = models.ManyToManyField(ProductLabel, blank=True)  # Already optional
     stock_quantity = models.PositiveIntegerField(default=0)
+    low_stock_threshold = models.PositiveIntegerField(
+        blank=True, null=True, validators=[MaxValueValidator(LOW_STOCK_MAX_THRESHOLD)]
+    )
     in_stock = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['category', 'in_stock', '-created_at'],
+                name='product_cat_stock_created_idx',
+            ),
+            models.Index(fields=['-created_at'], name='product_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='product_updated_idx'),
+            models.Index(
+                fields=['stock_quantity'],
+                name='product_low_stock_idx',
+                condition=models.Q(stock_quantity__lte=LOW_STOCK_MAX_THRESHOLD),
+            ),
+        ]
+    
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = instance.__dict__.get('stock_quantity')
+        return instance
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_stock = self.__dict__.get('stock_quantity')
+    
     def save(self, *args, **kwargs):
+        # stock_quantity caches the inventory ledger; changes go through inventory.set_stock
+        update_fields = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_stock', None)
+        if (
+            loaded is not None and 'stock_quantity' in self.__dict__ and self.stock_quantity != loaded
+            and (update_fields is None or 'stock_quantity' in update_fields)
+        ):
+            raise ValueError(f"Product {self.pk}: record stock changes with inventory.set_stock, not save()")
         self.in_stock = self.stock_quantity > 0
         super().save(*args, **kwargs)
+        self._loaded_stock = self.stock_quantity
     
     def get_absolute_url(self):
         return reverse('product_detail', kwargs={'pk': self.pk})
@@ -61,10 +109,19 @@ class Product(models.Model):
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to='products/', storage=content_addressed_storage)
     alt_text = models.CharField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['product'],
+                name='productimage_primary_idx',
+                condition=models.Q(is_primary=True),
+            ),
+        ]
+    
     def __str__(self):
         return f"Image for {self.product.name}"
     
@@ -83,6 +140,7 @@ class DiscountCode(models.Model):
     valid_from = models.DateTimeField(default=timezone.now)
     valid_until = models.DateTimeField()
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.code
@@ -102,6 +160,17 @@ class ProductDiscount(models.Model):
     start_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['product', 'start_date', 'end_date'],
+                name='productdiscount_active_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(fields=['updated_at', 'id'], name='productdiscount_updated_idx'),
+        ]
     
     def __str__(self):
         return f"Discount for {self.product.name}"
@@ -118,6 +187,16 @@ class Order(models.Model):
         ('delivered', 'Delivered'),
         ('cancelled', 'Cancelled'),
     ]
+    # Allowed moves out of each status; delivered and cancelled are terminal
+    STATUS_TRANSITIONS = {
+        'pending': ('processing', 'cancelled'),
+        'processing': ('shipped', 'cancelled'),
+        'shipped': ('delivered',),
+        'delivered': (),
+        'cancelled': (),
+    }
+    # Internal to search; kept out of the API representation
+    LOOKUP_FIELDS = ['email_normalized', 'phone_normalized', 'number_normalized', 'name_normalized']
     
     order_number = models.CharField(max_length=100, unique=True)
     customer_name = models.CharField(max_length=200)
@@ -128,9 +207,66 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Normalized copies of the customer fields for indexed lookups, kept by save()
+    email_normalized = models.CharField(max_length=254, default='', editable=False)
+    phone_normalized = models.CharField(max_length=20, default='', editable=False)
+    number_normalized = models.CharField(max_length=100, default='', editable=False)
+    name_normalized = models.CharField(max_length=200, default='', editable=False)
+    
+    class Meta:
+        # Pattern opclasses let Postgres serve prefix LIKEs from the same index
+        # regardless of collation; other backends ignore them. The trigram index
+        # on name_normalized is Postgres-only and created in migration 0011.
+        indexes = [
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='order_updated_idx'),
+            models.Index(
+                fields=['email_normalized', '-created_at'], name='order_email_idx',
+                opclasses=['varchar_pattern_ops', ''],
+            ),
+            models.Index(
+                fields=['phone_normalized', '-created_at'], name='order_phone_idx',
+                opclasses=['varchar_pattern_ops', ''],
+            ),
+            models.Index(
+                fields=['number_normalized'], name='order_number_idx',
+                opclasses=['varchar_pattern_ops'],
+            ),
+        ]
     
     def __str__(self):
         return self.order_number
+    
+    def save(self, *args, **kwargs):
+        self.normalize_lookup_fields()
+        super().save(*args, **kwargs)
+    
+    def normalize_lookup_fields(self):
+        # Also call this before bulk_create, which skips save()
+        self.email_normalized = normalize_email(self.customer_email)
+        self.phone_normalized = normalize_phone(self.customer_phone)
+        self.number_normalized = normalize_order_number(self.order_number)
+        self.name_normalized = normalize_name(self.customer_name)
+    
+    @classmethod
+    def can_transition(cls, from_status, to_status):
+        return to_status in cls.STATUS_TRANSITIONS.get(from_status, ())
+
+class OrderStatusHistory(models.Model):
+    # Append-only log of status changes; rows are never updated or deleted
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_history')
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    changed_by = models.ForeignKey(AdminUser, on_delete=models.SET_NULL, null=True, blank=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name_plural = 'Order status history'
+        ordering = ['-changed_at']
+    
+    def __str__(self):
+        return f"{self.order_id}: {self.from_status} -> {self.to_status}"
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -144,14 +280,106 @@ class OrderItem(models.Model):
     def get_total(self):
         return self.quantity * self.price_at_purchase
 
+class StockMovement(models.Model):
+    # Append-only stock ledger; Product.stock_quantity caches each product's sum.
+    # quantity is the signed change, so a reservation holds stock back from
+    # stock_quantity until a release (or a sale) follows it
+    KIND_CHOICES = [
+        ('restock', 'Restock'),
+        ('sale', 'Sale'),
+        ('adjustment', 'Adjustment'),
+        ('reservation', 'Reservation'),
+        ('release', 'Release'),
+    ]
+    # Direction each kind moves stock in; adjustments go either way
+    KIND_SIGNS = {'restock': 1, 'sale': -1, 'adjustment': 0, 'reservation': -1, 'release': 1}
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_by = models.ForeignKey(AdminUser, on_delete=models.SET_NULL, null=True, blank=True)
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'id'], name='stockmovement_product_idx'),
+            models.Index(fields=['created_at'], name='stockmovement_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+d} for product {self.product_id}"
+
+class StockSnapshot(models.Model):
+    # A product's ledger balance over its movements up to last_movement_id;
+    # as_of is the created_at of the newest movement the snapshot covers
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    quantity = models.IntegerField()
+    last_movement_id = models.BigIntegerField()
+    as_of = models.DateTimeField()
+    taken_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-last_movement_id'], name='stocksnapshot_product_idx'),
+            models.Index(fields=['last_movement_id'], name='stocksnapshot_movement_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Product {self.product_id}: {self.quantity} as of {self.as_of}"
+
+class ProductPairCount(models.Model):
+    # Orders containing both products, stored once per pair with
+    # product_a_id < product_b_id; build_recommendations keeps it current
+    product_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    product_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_a', 'product_b'], name='productpaircount_pair_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"Products {self.product_a_id} + {self.product_b_id}: {self.orders} orders"
+
+class ProductRecommendation(models.Model):
+    # A product's top related products from ProductPairCount, best first
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations', db_index=False)
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='productrecommendation_rank_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"Product {self.product_id} #{self.rank}: {self.related_id}"
+
+class RecommendationRun(models.Model):
+    # One row per build_recommendations run; the next run reads order items
+    # after the latest run's last_item_id
+    last_item_id = models.BigIntegerField()
+    full = models.BooleanField(default=False)
+    orders = models.PositiveIntegerField(default=0)
+    products = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{'Full' if self.full else 'Incremental'} run up to item {self.last_item_id}"
+
 class Service(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
-    icon = models.ImageField(upload_to='services/icons/', blank=True, null=True)
-    image = models.ImageField(upload_to='services/images/', blank=True, null=True)
+    icon = models.ImageField(upload_to='services/icons/', storage=content_addressed_storage, blank=True, null=True)
+    image = models.ImageField(upload_to='services/images/', storage=content_addressed_storage, blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -170,6 +398,68 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     related_order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True)
+    related_product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['related_product', 'notification_type', 'created_at'],
+                name='notification_dedupe_idx',
+            ),
+            models.Index(
+                fields=['created_at'],
+                name='notification_read_idx',
+                condition=models.Q(is_read=True),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} - {self.recipient.username}"
+
+# Archive tables for orders moved out of the live tables by the retention job.
+# Rows keep their original primary keys so archived ids match old references.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order_number = models.CharField(max_length=100, unique=True)
+    customer_name = models.CharField(max_length=200)
+    customer_email = models.EmailField()
+    customer_phone = models.CharField(max_length=20)
+    shipping_address = models.TextField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    status_history = models.JSONField(default=list, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at'], name='archivedorder_created_idx'),
+        ]
+    
+    def __str__(self):
+        return self.order_number
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
+    quantity = models.PositiveIntegerField()
+    price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    def get_total(self):
+        return self.quantity * self.price_at_purchase
+
+class Tombstone(models.Model):
+    # Left behind when a synced row is deleted so delta-sync clients can drop it
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at', 'id'], name='tombstone_model_deleted_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.title} - {self.recipient.username}"
\ No newline at end of file
+        return f"{self.model} #{self.object_id} deleted"
@@ -0,0 +1,42 @@
+import re
+import unicodedata
+
+NON_DIGITS = re.compile(r'\D')
+WHITESPACE = re.compile(r'\s+')
+NON_WORD = re.compile(r'[^\w\s]')
+
+
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+
+def normalize_phone(value):
+    # Digits only, so "+234 (703) 555-0100" and "2347035550100" compare equal
+    return NON_DIGITS.sub('', value or '')
+
+
+def normalize_order_number(value):
+    return (value or '').strip().lstrip('#').upper()
+
+
+def normalize_name(value):
+    # Lowercase, accents and punctuation dropped, single spaces
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return WHITESPACE.sub(' ', NON_WORD.sub(' ', stripped.lower())).strip()
+
+
+def trigrams(value):
+    """The trigram set pg_trgm builds for ``value``: each word padded by two spaces before, one after."""
+    grams = set()
+    for word in normalize_name(value).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,118 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, Func, Q, Value
+from rest_framework.filters import BaseFilterBackend
+
+from .normalize import normalize_email, normalize_phone, normalize_order_number, normalize_name
+
+PHONE_SHAPE = re.compile(r'\+?[\d\s().-]+')
+# A single token with characters names don't have, e.g. "jane.do" or "jdoe_"
+EMAIL_SHAPE = re.compile(r'[^\s@]*[._+][^\s@]*')
+MIN_PHONE_DIGITS = 6
+# Highest code point, so value + PREFIX_END sorts after every string starting with value
+PREFIX_END = '\U0010ffff'
+
+
+class TrigramMatch(Func):
+    # pg_trgm's ``%`` operator, which the GIN trigram index can serve
+    arg_joiner = ' %% '
+    template = '%(expressions)s'
+    output_field = BooleanField()
+
+
+class Similarity(Func):
+    # pg_trgm's similarity(); on SQLite the same function is registered from Python
+    function = 'SIMILARITY'
+    output_field = FloatField()
+
+
+def classify(term):
+    """Which customer field ``term`` most likely is: email, phone, number or name."""
+    if '@' in term or EMAIL_SHAPE.fullmatch(term):
+        return 'email'
+    if PHONE_SHAPE.fullmatch(term) and len(normalize_phone(term)) >= MIN_PHONE_DIGITS:
+        return 'phone'
+    if not any(char.isspace() for char in term) and any(char.isdigit() for char in term):
+        return 'number'
+    return 'name'
+
+
+def prefix_q(vendor, field, value):
+    if vendor == 'postgresql':
+        # LIKE 'value%' is served by the varchar_pattern_ops index
+        return Q(**{f'{field}__startswith': value})
+    # SQLite's LIKE is case-insensitive and can't use a plain index; a range can
+    return Q(**{f'{field}__gte': value, f'{field}__lt': value + PREFIX_END})
+
+
+def match_q(vendor, field, value, exact):
+    if exact or len(value) < getattr(settings, 'ORDER_LOOKUP_MIN_PREFIX', 3):
+        return Q(**{field: value})
+    return prefix_q(vendor, field, value)
+
+
+def search_names(queryset, term):
+    name = normalize_name(term)
+    if not name:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    ranked = queryset.alias(similarity=Similarity(F('name_normalized'), Value(name)))
+    if vendor == 'postgresql':
+        matched = ranked.filter(TrigramMatch(F('name_normalized'), Value(name)))
+    else:
+        # No trigram index: narrow with a substring scan on each word's start,
+        # then apply the same similarity cut-off pg_trgm uses by default
+        words = Q()
+        for word in name.split():
+            words |= Q(name_normalized__contains=word[:3])
+        matched = ranked.filter(words, similarity__gte=getattr(settings, 'ORDER_LOOKUP_SIMILARITY', 0.3))
+    return matched.order_by('-similarity', '-created_at')
+
+
+def lookup_orders(queryset, term, kind=None, exact=False):
+    """
+    Orders in ``queryset`` matching ``term`` on the normalized customer
+    columns, newest first (best match first for names). ``kind`` is one of
+    email, phone, number or name, guessed from ``term`` when not given.
+    Emails, phones and order numbers match exactly or by prefix.
+    """
+    term = term.strip()
+    if not term:
+        return queryset.none()
+    kind = kind or classify(term)
+    if kind == 'name':
+        return search_names(queryset, term)
+
+    vendor = connections[queryset.db].vendor
+    if kind == 'email':
+        condition = match_q(vendor, 'email_normalized', normalize_email(term), exact)
+    elif kind == 'phone':
+        digits = normalize_phone(term)
+        if not digits:
+            return queryset.none()
+        condition = match_q(vendor, 'phone_normalized', digits, exact)
+        if digits == term:
+            # A bare run of digits may also be a whole order number
+            condition |= Q(number_normalized=normalize_order_number(term))
+    else:
+        condition = match_q(vendor, 'number_normalized', normalize_order_number(term), exact)
+    return queryset.filter(condition).order_by('-created_at')
+
+
+class OrderLookupFilter(BaseFilterBackend):
+    """
+    ``?search=`` over the indexed lookup columns. ``?search_field=`` forces
+    email, phone, number or name; ``?exact=true`` turns off prefix matching.
+    """
+    search_param = 'search'
+    kinds = ('email', 'phone', 'number', 'name')
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '')
+        if not term.strip():
+            return queryset
+        kind = request.query_params.get('search_field')
+        exact = request.query_params.get('exact') in ('true', '1')
+        return lookup_orders(queryset, term, kind if kind in self.kinds else None, exact)
@@ -0,0 +1,83 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderStatusHistory
+
+# Keep IN (...) lists under SQLite's bound-parameter limit
+ID_CHUNK_SIZE = 500
+HISTORY_BATCH_SIZE = 1000
+
+
+def _chunks(items, size=ID_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def bulk_transition_orders(order_ids, to_status, user=None):
+    """
+    Move many orders to ``to_status`` with one UPDATE per source status.
+
+    Returns a dict keyed by order id with either the applied transition or
+    the reason it was rejected.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    results = {}
+    now = timezone.now()
+    changed_by = user if user is not None and user.is_authenticated else None
+
+    with transaction.atomic():
+        current = {}
+        for chunk in _chunks(order_ids):
+            rows = (
+                Order.objects.select_for_update()
+                .filter(id__in=chunk)
+                .values_list('id', 'status')
+            )
+            current.update(rows)
+
+        by_source = defaultdict(list)
+        for order_id in order_ids:
+            from_status = current.get(order_id)
+            if from_status is None:
+                results[order_id] = {'ok': False, 'error': 'Order not found'}
+            elif from_status == to_status:
+                results[order_id] = {'ok': False, 'error': f"Order is already {to_status}"}
+            elif not Order.can_transition(from_status, to_status):
+                results[order_id] = {
+                    'ok': False,
+                    'error': f"Cannot change status from {from_status} to {to_status}",
+                }
+            else:
+                by_source[from_status].append(order_id)
+
+        history = []
+        for from_status, ids in by_source.items():
+            for chunk in _chunks(ids):
+                Order.objects.filter(id__in=chunk, status=from_status).update(
+                    status=to_status, updated_at=now
+                )
+            for order_id in ids:
+                results[order_id] = {'ok': True, 'from': from_status, 'to': to_status}
+                history.append(OrderStatusHistory(
+                    order_id=order_id,
+                    from_status=from_status,
+                    to_status=to_status,
+                    changed_by=changed_by,
+                    changed_at=now,
+                ))
+        OrderStatusHistory.objects.bulk_create(history, batch_size=HISTORY_BATCH_SIZE)
+
+    return [{'id': order_id, **results[order_id]} for order_id in order_ids]
+
+
+def record_status_change(order, from_status, user=None):
+    if from_status == order.status:
+        return None
+    return OrderStatusHistory.objects.create(
+        order=order,
+        from_status=from_status,
+        to_status=order.status,
+        changed_by=user if user is not None and user.is_authenticated else None,
+    )
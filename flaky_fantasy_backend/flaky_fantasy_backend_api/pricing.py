@@ -0,0 +1,38 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Q
+from django.utils import timezone
+
+CENT = Decimal('0.01')
+
+
+def quantize(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def apply_discount(price, discount_type, value):
+    """Price after one percentage or fixed discount, never below zero."""
+    price = Decimal(price)
+    if discount_type == 'percentage':
+        reduced = price - price * Decimal(value) / 100
+    else:
+        reduced = price - Decimal(value)
+    return max(quantize(reduced), Decimal('0.00'))
+
+
+def best_price(price, discounts):
+    """
+    Lowest price from ``discounts`` (``(discount_type, value)`` pairs).
+    Product discounts don't stack; the customer gets the best one.
+    """
+    prices = [apply_discount(price, discount_type, value) for discount_type, value in discounts]
+    return min(prices, default=quantize(price))
+
+
+def active_discounts_q(now=None, prefix=''):
+    now = now or timezone.now()
+    return Q(**{
+        f'{prefix}is_active': True,
+        f'{prefix}start_date__lte': now,
+        f'{prefix}end_date__gte': now,
+    })
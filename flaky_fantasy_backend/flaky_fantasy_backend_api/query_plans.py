@@ -0,0 +1,109 @@
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .models import Product, ProductDiscount, ProductImage, Order
+from .stock_alerts import low_stock_products
+from .views import ProductViewSet, OrderViewSet
+
+SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def viewset_queryset(viewset_class, params=None, user=None, action='list'):
+    """Build the queryset a viewset would run for a GET with ``params``."""
+    request = APIRequestFactory().get('/', params or {})
+    if user is not None:
+        force_authenticate(request, user=user)
+    view = viewset_class(action=action, format_kwarg=None, kwargs={})
+    view.request = Request(request)
+    return view.filter_queryset(view.get_queryset())
+
+
+def hot_queries(sample):
+    """
+    The main queries behind each viewset, keyed by name. ``sample`` supplies
+    ids and order fields from the seeded database, e.g.
+    ``{'category': 1, 'product': 1, 'email': 'c@example.com', ...}``.
+    Each entry is (queryset, table that must not be fully scanned).
+    """
+    now = timezone.now()
+    return {
+        'products_by_category': (
+            viewset_queryset(ProductViewSet, {
+                'category': sample['category'], 'in_stock': 'true', 'ordering': '-created_at',
+            }),
+            Product._meta.db_table,
+        ),
+        'products_newest': (
+            viewset_queryset(ProductViewSet, {'ordering': '-created_at'})[:20],
+            Product._meta.db_table,
+        ),
+        'products_low_stock': (
+            low_stock_products(),
+            Product._meta.db_table,
+        ),
+        'orders_by_status': (
+            viewset_queryset(OrderViewSet, {'status': 'pending', 'ordering': '-created_at'}),
+            Order._meta.db_table,
+        ),
+        'orders_newest': (
+            viewset_queryset(OrderViewSet, {'ordering': '-created_at'})[:20],
+            Order._meta.db_table,
+        ),
+        'orders_search_email': (
+            viewset_queryset(OrderViewSet, {'search': sample['email']}),
+            Order._meta.db_table,
+        ),
+        'orders_search_phone': (
+            viewset_queryset(OrderViewSet, {'search': sample['phone'], 'search_field': 'phone'}),
+            Order._meta.db_table,
+        ),
+        'orders_search_number': (
+            viewset_queryset(OrderViewSet, {'search': sample['order_number']}),
+            Order._meta.db_table,
+        ),
+        'product_active_discounts': (
+            ProductDiscount.objects.filter(
+                product=sample['product'], is_active=True, start_date__lte=now, end_date__gte=now,
+            ),
+            ProductDiscount._meta.db_table,
+        ),
+        'product_primary_image': (
+            ProductImage.objects.filter(product=sample['product'], is_primary=True),
+            ProductImage._meta.db_table,
+        ),
+    }
+
+
+def explain(queryset):
+    if connection.vendor == 'postgresql':
+        # Small seeded tables make a seq scan the cheapest plan; disable it so
+        # the plan shows whether an index is usable at all
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+    return queryset.explain()
+
+
+def full_scans(plan):
+    if connection.vendor == 'postgresql':
+        return set(POSTGRES_SCAN.findall(plan))
+    if connection.vendor == 'sqlite':
+        # An ordered "SCAN t USING INDEX" walks the whole index too, but is
+        # fine when a LIMIT stops it early, so only bare table scans count
+        return set(SQLITE_SCAN.findall(plan))
+    return set()
+
+
+def capture_plans(sample):
+    """Return ``{name: (plan, table, scanned)}`` for every hot query."""
+    plans = {}
+    for name, (queryset, table) in hot_queries(sample).items():
+        plan = explain(queryset)
+        plans[name] = (plan, table, table in full_scans(plan))
+    return plans
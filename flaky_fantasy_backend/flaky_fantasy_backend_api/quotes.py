@@ -0,0 +1,126 @@
+import hashlib
+import json
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import DiscountCode, Product, ProductDiscount
+from .pricing import active_discounts_q, apply_discount, best_price, quantize
+from .serializers import CartQuoteSerializer
+
+ZERO = Decimal('0.00')
+
+
+def merge_lines(items):
+    """``(product_id, quantity)`` pairs with repeated products added together, by product id."""
+    quantities = defaultdict(int)
+    for item in items:
+        quantities[item['product']] += item['quantity']
+    return sorted(quantities.items())
+
+
+def quote_cache_key(lines, code):
+    cart = json.dumps([lines, code or ''], separators=(',', ':'))
+    return 'cart-quote:' + hashlib.sha256(cart.encode()).hexdigest()
+
+
+def code_problem(code, now):
+    # The same rules as DiscountCode.is_valid, with a reason the storefront can show
+    if not code['is_active']:
+        return 'inactive'
+    if now < code['valid_from']:
+        return 'not_started'
+    if now > code['valid_until']:
+        return 'expired'
+    if code['used_count'] >= code['max_uses']:
+        return 'used_up'
+    return None
+
+
+def build_quote(lines, code=None, now=None):
+    """
+    Price a cart of ``(product_id, quantity)`` lines with the product
+    discounts active at ``now`` and an optional discount code. Every line is
+    resolved together: one query for the products, one for their discounts
+    and one for the code, whatever the size of the cart. Amounts are
+    Decimals rounded half up to the cent, the same way as pricing.py.
+    """
+    now = now or timezone.now()
+    ids = [product_id for product_id, _ in lines]
+    products = {
+        row['id']: row for row in Product.objects.filter(id__in=ids).values(
+            'id', 'name', 'price', 'stock_quantity', 'in_stock'
+        )
+    }
+    discounts = defaultdict(list)
+    for product_id, discount_type, value in (
+        ProductDiscount.objects.filter(active_discounts_q(now), product_id__in=products)
+        .values_list('product_id', 'discount_type', 'value')
+    ):
+        discounts[product_id].append((discount_type, value))
+
+    quoted = []
+    missing = []
+    subtotal = ZERO
+    line_discounts = ZERO
+    for product_id, quantity in lines:
+        product = products.get(product_id)
+        if product is None:
+            missing.append(product_id)
+            continue
+        unit_price = quantize(product['price'])
+        discounted = best_price(unit_price, discounts[product_id])
+        line_total = quantize(discounted * quantity)
+        subtotal += line_total
+        line_discounts += quantize(unit_price * quantity) - line_total
+        quoted.append({
+            'product': product_id,
+            'name': product['name'],
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'discounted_unit_price': discounted,
+            'line_total': line_total,
+            'stock_quantity': product['stock_quantity'],
+            'available': product['in_stock'] and product['stock_quantity'] >= quantity,
+        })
+
+    total = subtotal
+    code_result = None
+    if code:
+        row = DiscountCode.objects.filter(code=code).values(
+            'discount_type', 'value', 'is_active', 'valid_from', 'valid_until', 'used_count', 'max_uses'
+        ).first()
+        problem = 'not_found' if row is None else code_problem(row, now)
+        if problem is None:
+            total = apply_discount(subtotal, row['discount_type'], row['value'])
+        code_result = {'code': code, 'valid': problem is None, 'reason': problem, 'discount': subtotal - total}
+
+    return {
+        'lines': quoted,
+        'missing': missing,
+        'subtotal': subtotal,
+        'product_discounts': line_discounts,
+        'code': code_result,
+        'total': total,
+        'available': not missing and all(line['available'] for line in quoted),
+        'quoted_at': now,
+        'valid_until': now + timedelta(seconds=quote_ttl()),
+    }
+
+
+def quote_ttl():
+    return getattr(settings, 'CART_QUOTE_TTL', 30)
+
+
+def cached_quote(lines, code=None):
+    """The serialized build_quote, shared for ``quote_ttl()`` seconds between identical carts."""
+    key = quote_cache_key(lines, code)
+    data = cache.get(key)
+    if data is None:
+        data = dict(CartQuoteSerializer(build_quote(lines, code)).data)
+        cache.set(key, data, quote_ttl())
+    return data
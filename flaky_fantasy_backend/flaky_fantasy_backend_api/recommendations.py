@@ -0,0 +1,218 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from heapq import nlargest
+from itertools import chain, combinations, groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OrderItem, ProductPairCount, ProductRecommendation, RecommendationRun
+
+# Keep IN (...) lists under SQLite's bound-parameter limit
+ID_CHUNK_SIZE = 500
+ITEM_CHUNK_SIZE = 5000
+WRITE_BATCH_SIZE = 1000
+
+
+class ConcurrentRun(RuntimeError):
+    pass
+
+
+def _chunks(items, size=ID_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def recommendation_lag():
+    # Items of orders younger than this are left to the next run, so
+    # transactions still open when a run starts can't commit below its watermark
+    return timedelta(seconds=getattr(settings, 'RECOMMENDATIONS_LAG', 300))
+
+
+def baskets(rows):
+    """Each order's distinct products, sorted, from (order_id, product_id) rows in order_id order."""
+    for _, order_rows in groupby(rows, key=itemgetter(0)):
+        yield sorted({product_id for _, product_id in order_rows})
+
+
+def top_related(counts_by_product):
+    """{product_id: [(related_id, orders), ...]} best first: most orders, then lowest id."""
+    limit = getattr(settings, 'RECOMMENDATIONS_TOP_K', 10)
+    min_orders = getattr(settings, 'RECOMMENDATIONS_MIN_ORDERS', 1)
+    return {
+        product_id: nlargest(
+            limit, ((related, orders) for related, orders in related_counts.items() if orders >= min_orders),
+            key=lambda pair: (pair[1], -pair[0]),
+        )
+        for product_id, related_counts in counts_by_product.items()
+    }
+
+
+def _by_product(pairs):
+    # Both directions of each (a, b) -> orders pair
+    counts_by_product = defaultdict(dict)
+    for (product_a, product_b), orders in pairs:
+        counts_by_product[product_a][product_b] = orders
+        counts_by_product[product_b][product_a] = orders
+    return counts_by_product
+
+
+def _insert_rows(model, columns, rows):
+    # Multi-row INSERTs straight from tuples; on a full rebuild building the
+    # model instances for bulk_create costs several times the writes themselves
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    rows = iter(rows)
+    batch_size = min(WRITE_BATCH_SIZE, connection.ops.bulk_batch_size(columns, [None] * WRITE_BATCH_SIZE))
+    placeholder = '({})'.format(', '.join(['%s'] * len(columns)))
+    with connection.cursor() as cursor:
+        while batch := list(islice(rows, batch_size)):
+            cursor.execute(
+                'INSERT INTO {} ({}) VALUES {}'.format(
+                    qn(model._meta.db_table), ', '.join(map(qn, columns)), ', '.join([placeholder] * len(batch)),
+                ),
+                list(chain.from_iterable(batch)),
+            )
+
+
+def _write_top(product_ids, top, replace=True):
+    if replace:
+        ProductRecommendation.objects.filter(product_id__in=product_ids).delete()
+    _insert_rows(
+        ProductRecommendation, ['product_id', 'related_id', 'orders', 'rank'],
+        (
+            (product_id, related, orders, rank)
+            for product_id in product_ids
+            for rank, (related, orders) in enumerate(top.get(product_id, ()), start=1)
+        ),
+    )
+
+
+def _newest_item(watermark, cutoff):
+    return (
+        OrderItem.objects.filter(id__gt=watermark, order__created_at__lte=cutoff)
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+
+
+def _latest_run(lock=False):
+    runs = RecommendationRun.objects.order_by('-id')
+    return (runs.select_for_update() if lock else runs).first()
+
+
+def rebuild_recommendations(lag=None):
+    """
+    Count product pairs over every order and replace the pair counts and
+    every product's top related products. Returns the RecommendationRun.
+    """
+    cutoff = timezone.now() - (recommendation_lag() if lag is None else lag)
+    newest = _newest_item(0, cutoff) or 0
+    rows = (
+        OrderItem.objects.filter(id__lte=newest, product__isnull=False).order_by('order_id')
+        .values_list('order_id', 'product_id').iterator(chunk_size=ITEM_CHUNK_SIZE)
+    )
+    order_count = 0
+    counts = Counter()
+    for products in baskets(rows):
+        order_count += 1
+        if len(products) > 1:
+            counts.update(combinations(products, 2))
+    top = top_related(_by_product(counts.items()))
+
+    with transaction.atomic():
+        _latest_run(lock=True)
+        ProductPairCount.objects.all().delete()
+        _insert_rows(
+            ProductPairCount, ['product_a_id', 'product_b_id', 'orders'],
+            ((a, b, orders) for (a, b), orders in counts.items()),
+        )
+        ProductRecommendation.objects.all().delete()
+        product_ids = sorted(top)
+        _write_top(product_ids, top, replace=False)
+        return RecommendationRun.objects.create(
+            last_item_id=newest, full=True, orders=order_count, products=len(product_ids),
+        )
+
+
+def added_pairs(rows, watermark):
+    """
+    Pairs an order gains from its items after ``watermark``, from its
+    (order_id, product_id, item_id) rows in order_id order: the new products
+    with each other and with the products it already had.
+    """
+    pairs = Counter()
+    for _, order_rows in groupby(rows, key=itemgetter(0)):
+        before, after = set(), set()
+        for _, product_id, item_id in order_rows:
+            (before if item_id <= watermark else after).add(product_id)
+        added = sorted(after - before)
+        pairs.update(combinations(added, 2))
+        pairs.update((min(a, b), max(a, b)) for a in added for b in before)
+    return pairs
+
+
+def update_recommendations(lag=None):
+    """
+    Fold order items added since the last run into the pair counts and
+    recompute the top related products of only the products they touch.
+    Falls back to a full rebuild when there has been no run yet. Returns
+    the RecommendationRun, or None when there was nothing new.
+    """
+    previous = _latest_run()
+    if previous is None:
+        return rebuild_recommendations(lag)
+    watermark = previous.last_item_id
+    cutoff = timezone.now() - (recommendation_lag() if lag is None else lag)
+    newest = _newest_item(watermark, cutoff)
+    if newest is None:
+        return None
+
+    order_ids = sorted(set(
+        OrderItem.objects.filter(id__gt=watermark, id__lte=newest, product__isnull=False)
+        .values_list('order_id', flat=True)
+    ))
+    delta = Counter()
+    for chunk in _chunks(order_ids):
+        delta.update(added_pairs(
+            OrderItem.objects.filter(order_id__in=chunk, id__lte=newest, product__isnull=False)
+            .order_by('order_id').values_list('order_id', 'product_id', 'id'),
+            watermark,
+        ))
+    touched = sorted(set(chain.from_iterable(delta)))
+
+    with transaction.atomic():
+        if _latest_run(lock=True).pk != previous.pk:
+            raise ConcurrentRun('Another recommendations run finished first; run again')
+        totals = dict(delta)
+        for chunk in _chunks(sorted({a for a, _ in delta})):
+            for a, b, orders in ProductPairCount.objects.filter(product_a_id__in=chunk).values_list(
+                'product_a_id', 'product_b_id', 'orders'
+            ):
+                if (a, b) in totals:
+                    totals[(a, b)] += orders
+        ProductPairCount.objects.bulk_create(
+            [ProductPairCount(product_a_id=a, product_b_id=b, orders=orders) for (a, b), orders in totals.items()],
+            batch_size=WRITE_BATCH_SIZE, update_conflicts=True,
+            unique_fields=['product_a', 'product_b'], update_fields=['orders'],
+        )
+        for chunk in _chunks(touched):
+            pairs = ProductPairCount.objects.filter(Q(product_a_id__in=chunk) | Q(product_b_id__in=chunk))
+            top = top_related(_by_product(
+                ((a, b), orders) for a, b, orders in pairs.values_list('product_a_id', 'product_b_id', 'orders')
+            ))
+            _write_top(chunk, top)
+        return RecommendationRun.objects.create(last_item_id=newest, orders=len(order_ids), products=len(touched))
+
+
+def recommendations_for(product_id):
+    """A product's stored recommendations joined to the related products, in one query on (product, rank)."""
+    rows = ProductRecommendation.objects.filter(product_id=product_id).order_by('rank').values_list(
+        'related_id', 'related__name', 'related__price', 'related__in_stock', 'orders',
+    )
+    return [
+        {'id': related_id, 'name': name, 'price': str(price), 'in_stock': in_stock, 'orders': orders}
+        for related_id, name, price, in_stock, orders in rows
+    ]
@@ -0,0 +1,134 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .sync import delete_with_tombstones
+from .models import (
+    Order, OrderItem, OrderStatusHistory, Notification,
+    ArchivedOrder, ArchivedOrderItem, Tombstone
+)
+
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled')
+ORDER_FIELDS = [
+    'id', 'order_number', 'customer_name', 'customer_email', 'customer_phone',
+    'shipping_address', 'status', 'total_amount', 'created_at', 'updated_at',
+]
+
+
+def order_archive_cutoff(days=None):
+    days = days if days is not None else getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def notification_cutoff(days=None):
+    days = days if days is not None else getattr(settings, 'NOTIFICATION_TTL_DAYS', 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def tombstone_cutoff(days=None):
+    days = days if days is not None else getattr(settings, 'TOMBSTONE_TTL_DAYS', 30)
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable_orders(cutoff):
+    return Order.objects.filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff)
+
+
+def _lock_batch(queryset, batch_size):
+    # Rows another worker is archiving are skipped rather than waited on
+    if connection.features.has_select_for_update_skip_locked:
+        queryset = queryset.select_for_update(skip_locked=True)
+    # No ORDER BY: the partial/status indexes can stop after batch_size rows
+    # instead of sorting every candidate on each pass
+    return list(queryset.order_by().values_list('id', flat=True)[:batch_size])
+
+
+def archive_order_batch(cutoff, batch_size):
+    """
+    Move one batch of finished orders and their items into the archive tables.
+    Each batch is its own transaction, so the job can stop at any point and a
+    re-run carries on from the remaining rows. Returns the number archived.
+    """
+    with transaction.atomic():
+        ids = _lock_batch(archivable_orders(cutoff), batch_size)
+        if not ids:
+            return 0
+
+        history = defaultdict(list)
+        for row in (OrderStatusHistory.objects.filter(order_id__in=ids)
+                    .order_by('changed_at')
+                    .values('order_id', 'from_status', 'to_status', 'changed_by_id', 'changed_at')):
+            history[row['order_id']].append({
+                'from': row['from_status'],
+                'to': row['to_status'],
+                'changed_by': row['changed_by_id'],
+                'changed_at': row['changed_at'].isoformat(),
+            })
+
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(status_history=history.get(row['id'], []), **row)
+            for row in Order.objects.filter(id__in=ids).values(*ORDER_FIELDS)
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(**row)
+            for row in OrderItem.objects.filter(order_id__in=ids).values(
+                'id', 'order_id', 'product_id', 'quantity', 'price_at_purchase'
+            )
+        ], batch_size=1000)
+
+        # Keep notifications about archived orders; only drop the link
+        Notification.objects.filter(related_order_id__in=ids).update(related_order=None)
+        # Sync clients see archived orders as deleted; see DeltaSyncMixin
+        delete_with_tombstones(Order.objects.filter(id__in=ids))
+    return len(ids)
+
+
+def prune_notification_batch(cutoff, batch_size):
+    with transaction.atomic():
+        ids = _lock_batch(Notification.objects.filter(is_read=True, created_at__lt=cutoff), batch_size)
+        if ids:
+            Notification.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def prune_tombstone_batch(cutoff, batch_size):
+    with transaction.atomic():
+        ids = _lock_batch(Tombstone.objects.filter(deleted_at__lt=cutoff), batch_size)
+        if ids:
+            Tombstone.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def run_in_batches(step, max_batches=None, pause=0.0):
+    """Call ``step()`` until it returns 0; yields each batch's count."""
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        done = step()
+        if not done:
+            return
+        batches += 1
+        yield done
+        if pause:
+            time.sleep(pause)
+
+
+def archive_orders(days=None, batch_size=None, max_batches=None, pause=0.0):
+    cutoff = order_archive_cutoff(days)
+    batch_size = batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', 500)
+    return run_in_batches(lambda: archive_order_batch(cutoff, batch_size), max_batches, pause)
+
+
+def prune_notifications(days=None, batch_size=None, max_batches=None, pause=0.0):
+    cutoff = notification_cutoff(days)
+    batch_size = batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', 500)
+    return run_in_batches(lambda: prune_notification_batch(cutoff, batch_size), max_batches, pause)
+
+
+def prune_tombstones(days=None, batch_size=None, max_batches=None, pause=0.0):
+    cutoff = tombstone_cutoff(days)
+    batch_size = batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', 500)
+    return run_in_batches(lambda: prune_tombstone_batch(cutoff, batch_size), max_batches, pause)
@@ -0,0 +1,239 @@
+import decimal
+import threading
+from collections import defaultdict
+from operator import itemgetter
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+# Fields whose to_representation returns the value values() already gives
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.EmailField,
+    serializers.BooleanField, serializers.ChoiceField, serializers.SlugField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+SKIP = object()
+
+_cache = {}
+_cache_lock = threading.RLock()
+
+
+def _converting(column, convert):
+    # Serializer.to_representation gives None without calling the field
+    def get(row):
+        value = row[column]
+        return None if value is None else convert(value)
+    return get
+
+
+def _guarded(get, guards, missing):
+    # A null foreign key on the way to a dotted source: DRF skips the key (or gives None)
+    def guarded(row):
+        for guard in guards:
+            if row[guard] is None:
+                return missing
+        return get(row)
+    return guarded
+
+
+def _decimal(field):
+    # DecimalField.to_representation with its context and exponent built once
+    if field.decimal_places is None or field.localize or not getattr(
+            field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+        return field.to_representation
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            return field.to_representation(value)
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def _datetime(field):
+    # DateTimeField.to_representation with the time zone looked up once, not per value
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or value.utcoffset() is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+# Page-level stand-ins for to_representation that give the same output faster
+CONVERTERS = {
+    serializers.DecimalField: _decimal,
+    serializers.DateTimeField: _datetime,
+}
+
+
+def _file_url(storage, request):
+    def convert(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
+
+
+class RowSerializer:
+    """
+    Read-only twin of a ModelSerializer for list pages. Rows come from
+    values() and every output key has an accessor worked out once from the
+    model serializer's own fields, so the JSON matches it byte for byte
+    without building a field tree or model instance per row. Nested
+    ``many=True`` serializers are filled from one query per relation.
+    """
+
+    def __init__(self, serializer_class):
+        serializer = serializer_class(context={})
+        self.name = serializer_class.__name__
+        self.model = serializer.Meta.model
+        self.pk = self.model._meta.pk.attname
+        self.columns = [self.pk]
+        self.fields = []
+        for key, field in serializer.fields.items():
+            if not field.write_only:
+                self.fields.append((key, *self.plan_field(key, field)))
+
+    @classmethod
+    def for_serializer(cls, serializer_class):
+        with _cache_lock:
+            if serializer_class not in _cache:
+                _cache[serializer_class] = cls(serializer_class)
+            return _cache[serializer_class]
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def plan_field(self, key, field):
+        if isinstance(field, serializers.ListSerializer):
+            relation = self.model._meta.get_field(field.source)
+            if not (relation.one_to_many or relation.many_to_many):
+                raise ImproperlyConfigured(f'{self.name}.{key}: unsupported nested relation')
+            return 'many', (relation, RowSerializer.for_serializer(type(field.child)))
+
+        attrs = field.source_attrs
+        if field.source == '*' or not attrs or isinstance(field, serializers.ManyRelatedField):
+            raise ImproperlyConfigured(f'{self.name}.{key} cannot be read from values() rows')
+        if len(attrs) == 1:
+            model_field = self.model._meta.get_field(attrs[0])
+            column = self.add_column(model_field.attname)
+        else:
+            model_field = None
+            column = self.add_column('__'.join(attrs))
+
+        if isinstance(field, serializers.FileField):
+            storage = model_field.storage if model_field is not None else None
+            if storage is None or not getattr(field, 'use_url', True):
+                raise ImproperlyConfigured(f'{self.name}.{key}: only direct file fields with URLs are supported')
+            return 'file', (column, storage)
+
+        converted = None if type(field) in PASSTHROUGH_FIELDS else field
+        if len(attrs) == 1:
+            return 'value', (column, converted, (), None)
+        guards = [self.add_column('__'.join(attrs[:depth])) for depth in range(1, len(attrs))]
+        if field.default is not empty:
+            missing = field.get_default()
+        else:
+            missing = None if field.allow_null else SKIP
+        return 'value', (column, converted, guards, missing)
+
+    def values(self, queryset, extra=()):
+        # Prefetches don't apply to values() querysets
+        return queryset.prefetch_related(None).values(*self.columns, *extra)
+
+    def fetch_many(self, relation, child, ids, context):
+        """Serialized children for ``ids``, as a function of the parent row."""
+        grouped = defaultdict(list)
+        if relation.one_to_many:
+            link = relation.field.attname
+            rows = list(child.values(
+                child.model.objects.filter(**{f'{link}__in': ids}).order_by(link, child.pk), extra=[link]
+            ))
+            for row, item in zip(rows, child.serialize(rows, context)):
+                grouped[row[link]].append(item)
+        else:
+            through = relation.remote_field.through
+            source, target = relation.m2m_column_name(), relation.m2m_reverse_name()
+            links = list(through.objects.filter(**{f'{source}__in': ids}).order_by(source, target)
+                         .values_list(source, target))
+            rows = list(child.values(
+                child.model.objects.filter(pk__in={target_id for _, target_id in links}).order_by(child.pk)
+            ))
+            by_id = dict(zip((row[child.pk] for row in rows), child.serialize(rows, context)))
+            for parent_id, target_id in links:
+                grouped[parent_id].append(by_id[target_id])
+        pk = self.pk
+        return lambda row: grouped.get(row[pk], [])
+
+    def accessors(self, rows, context):
+        request = context.get('request')
+        ids = None
+        accessors = []
+        for key, kind, spec in self.fields:
+            if kind == 'many':
+                if ids is None:
+                    ids = [row[self.pk] for row in rows]
+                get = self.fetch_many(*spec, ids, context)
+            elif kind == 'file':
+                column, storage = spec
+                get = _converting(column, _file_url(storage, request))
+            else:
+                column, field, guards, missing = spec
+                if field is None:
+                    get = itemgetter(column)
+                else:
+                    converter = CONVERTERS.get(type(field))
+                    get = _converting(column, converter(field) if converter else field.to_representation)
+                if guards:
+                    get = _guarded(get, guards, missing)
+            accessors.append((key, get))
+        return accessors
+
+    def serialize(self, rows, context=None):
+        rows = list(rows)
+        if not rows:
+            return []
+        accessors = self.accessors(rows, context or {})
+        data = []
+        for row in rows:
+            item = {}
+            for key, get in accessors:
+                value = get(row)
+                if value is not SKIP:
+                    item[key] = value
+            data.append(item)
+        return data
+
+
+class RowListMixin:
+    """
+    Serve ``list`` through a RowSerializer built from the viewset's
+    serializer class; the model serializer still handles everything else.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        reader = RowSerializer.for_serializer(self.get_serializer_class())
+        rows = reader.values(queryset)
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(reader.serialize(page, context))
+        return Response(reader.serialize(rows, context))
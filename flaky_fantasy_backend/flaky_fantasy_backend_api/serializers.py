@@ -1,8 +1,13 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
 from rest_framework import serializers
 from .models import (
     AdminUser, Category, ProductLabel, Product, ProductImage,
-    DiscountCode, ProductDiscount, Order, OrderItem, Service, Notification
+    DiscountCode, ProductDiscount, Order, OrderItem, Service, Notification,
+    OrderStatusHistory, ArchivedOrder, ArchivedOrderItem, StockMovement
 )
+from .inventory import OPENING_NOTE, set_stock, signed_quantity
 
 class AdminUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -44,22 +49,29 @@ class ProductSerializer(serializers.ModelSerializer):
         required=False
     )
     primary_image_id = serializers.IntegerField(write_only=True, required=False)
+    # Stock only changes through the ledger: an opening balance here, then update_stock
+    opening_stock = serializers.IntegerField(write_only=True, required=False, min_value=0)
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'description', 'price', 'category', 'labels',
-            'label_ids', 'stock_quantity', 'in_stock', 'created_at', 'updated_at',
-            'images', 'category_name', 'image_files', 'primary_image_id'
+            'label_ids', 'stock_quantity', 'low_stock_threshold', 'in_stock', 'created_at', 'updated_at',
+            'images', 'category_name', 'image_files', 'primary_image_id', 'opening_stock'
         ]
-        read_only_fields = ('created_at', 'updated_at', 'in_stock')
+        read_only_fields = ('created_at', 'updated_at', 'stock_quantity', 'in_stock')
+
+    def request_user(self):
+        return getattr(self.context.get('request'), 'user', None)
 
     def create(self, validated_data):
         image_files = validated_data.pop('image_files', [])
         primary_image_id = validated_data.pop('primary_image_id', None)
         labels = validated_data.pop('labels', [])
+        stock = validated_data.pop('opening_stock', 0)
 
         product = Product.objects.create(**validated_data)
+        set_stock(product, stock, self.request_user(), note=OPENING_NOTE)
 
         if labels:
             product.labels.set(labels)
@@ -89,6 +101,7 @@ class ProductSerializer(serializers.ModelSerializer):
         image_files = validated_data.pop('image_files', [])
         primary_image_id = validated_data.pop('primary_image_id', None)
         labels = validated_data.pop('labels', None)
+        validated_data.pop('opening_stock', None)
 
         # Update product fields
         for attr, value in validated_data.items():
@@ -161,6 +174,60 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
+        exclude = Order.LOOKUP_FIELDS
+
+    def validate_status(self, value):
+        if self.instance and value != self.instance.status:
+            if not Order.can_transition(self.instance.status, value):
+                raise serializers.ValidationError(
+                    f"Cannot change status from {self.instance.status} to {value}"
+                )
+        return value
+
+class OrderStatusHistorySerializer(serializers.ModelSerializer):
+    changed_by_name = serializers.CharField(source='changed_by.username', read_only=True)
+
+    class Meta:
+        model = OrderStatusHistory
+        fields = '__all__'
+
+class BulkOrderStatusSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=10000
+    )
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    # quantity is given as a count of units and shown as the signed ledger change;
+    # only adjustments take a sign on input
+    class Meta:
+        model = StockMovement
+        fields = ['id', 'product', 'kind', 'quantity', 'order', 'note', 'created_by', 'created_at']
+        read_only_fields = ['created_by', 'created_at']
+
+    def validate(self, data):
+        try:
+            data['quantity'] = signed_quantity(data['kind'], data['quantity'])
+        except ValueError as error:
+            raise serializers.ValidationError({'quantity': str(error)})
+        if data['quantity'] == 0:
+            raise serializers.ValidationError({'quantity': "A movement must change stock"})
+        return data
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = '__all__'
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
         fields = '__all__'
 
 class ServiceSerializer(serializers.ModelSerializer):
@@ -180,3 +247,72 @@ class HealthSerializer(serializers.Serializer):
     status = serializers.CharField()
     database = serializers.CharField(required=False)
     message = serializers.CharField(required=False)
+
+class BatchItemSerializer(serializers.Serializer):
+    id = serializers.CharField(max_length=100, required=False)
+    method = serializers.ChoiceField(
+        choices=['GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET'
+    )
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        parts = urlsplit(value)
+        if parts.scheme or parts.netloc or not parts.path.startswith('/api/'):
+            raise serializers.ValidationError("Must be a path under /api/")
+        if parts.path.rstrip('/') == '/api/batch':
+            raise serializers.ValidationError("Batches cannot be nested")
+        return value
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        limit = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} requests per batch")
+        return value
+
+class CartItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=10000)
+
+class CartQuoteRequestSerializer(serializers.Serializer):
+    items = CartItemSerializer(many=True, allow_empty=False)
+    code = serializers.CharField(max_length=50, required=False, allow_blank=True)
+
+    def validate_items(self, value):
+        limit = getattr(settings, 'CART_MAX_LINES', 100)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} lines per cart")
+        return value
+
+    def validate_code(self, value):
+        return value.strip()
+
+class QuoteLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    quantity = serializers.IntegerField()
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    discounted_unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    line_total = serializers.DecimalField(max_digits=16, decimal_places=2)
+    stock_quantity = serializers.IntegerField()
+    available = serializers.BooleanField()
+
+class QuoteCodeSerializer(serializers.Serializer):
+    code = serializers.CharField()
+    valid = serializers.BooleanField()
+    reason = serializers.CharField(allow_null=True)
+    discount = serializers.DecimalField(max_digits=16, decimal_places=2)
+
+class CartQuoteSerializer(serializers.Serializer):
+    lines = QuoteLineSerializer(many=True)
+    missing = serializers.ListField(child=serializers.IntegerField())
+    subtotal = serializers.DecimalField(max_digits=16, decimal_places=2)
+    product_discounts = serializers.DecimalField(max_digits=16, decimal_places=2)
+    code = QuoteCodeSerializer(allow_null=True)
+    total = serializers.DecimalField(max_digits=16, decimal_places=2)
+    available = serializers.BooleanField()
+    quoted_at = serializers.DateTimeField()
+    valid_until = serializers.DateTimeField()
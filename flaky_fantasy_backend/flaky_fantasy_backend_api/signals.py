@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .autocomplete import INDEXED_MODELS, mark_stale
+from .inventory import stock_changed
+from .models import Category, ProductLabel, Product, ProductImage, ProductDiscount, Order, OrderItem, Tombstone
+from .normalize import similarity
+from .stock_alerts import check_low_stock, could_be_low
+from .sync import SYNCED_MODELS, tombstone_label
+from .thumbnails import make_thumbnails
+
+
+@receiver(post_save, sender=Product)
+def product_threshold_changed(sender, instance, raw=False, **kwargs):
+    # Stock itself moves through the ledger (stock_moved below); a save can still lower the bar
+    if raw or not could_be_low(instance):
+        return
+    transaction.on_commit(lambda: check_low_stock([instance.pk]))
+
+
+@receiver(stock_changed)
+def stock_moved(sender, levels, **kwargs):
+    lowered = [product_id for product_id, (before, after) in levels.items() if after < before]
+    if lowered:
+        check_low_stock(lowered)
+    # Suggestions rank in-stock products first
+    if any((before > 0) != (after > 0) for before, after in levels.values()):
+        mark_stale()
+
+
+def _cascaded_from(model, kwargs):
+    # True when the delete() that fired this signal was on ``model``
+    origin = kwargs.get('origin')
+    return getattr(origin, 'model', type(origin)) is model
+
+
+# Nested data is part of the parent's API representation, so changing it
+# bumps the parent's updated_at and with it the ETag / Last-Modified validators
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def product_image_changed(sender, instance, raw=False, **kwargs):
+    if not raw and not _cascaded_from(Product, kwargs):
+        Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ProductImage)
+def product_image_saved(sender, instance, raw=False, **kwargs):
+    # After commit, so a rolled-back upload leaves no thumbnails behind
+    if not raw and instance.image:
+        image = instance.image
+        transaction.on_commit(lambda: make_thumbnails(image))
+
+
+@receiver([post_save, post_delete], sender=ProductDiscount)
+def product_discount_changed(sender, instance, raw=False, **kwargs):
+    # Discounts change the effective price in the catalog snapshot
+    if not raw and not _cascaded_from(Product, kwargs):
+        Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Product.labels.through)
+def product_labels_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Product.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+    elif pk_set:
+        Product.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        Product.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ProductLabel)
+def label_changed(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        Product.objects.filter(labels=instance).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def order_item_changed(sender, instance, raw=False, **kwargs):
+    if not raw and not _cascaded_from(Order, kwargs):
+        Order.objects.filter(pk=instance.order_id).update(updated_at=timezone.now())
+
+
+def indexed_name_changed(sender, raw=False, **kwargs):
+    # Other processes catch up through the autocomplete index's version check
+    if not raw:
+        transaction.on_commit(mark_stale)
+
+
+def record_tombstone(sender, instance, **kwargs):
+    # For single-instance deletes and what they cascade to; bulk deletes go
+    # through delete_with_tombstones, which has already written these rows' tombstones.
+    # Runs inside the deleting transaction, so a rolled-back delete leaves no tombstone
+    origin = kwargs.get('origin')
+    if getattr(origin, 'tombstones_written', False) and origin.model is sender:
+        return
+    Tombstone.objects.create(model=tombstone_label(sender), object_id=instance.pk)
+
+
+for synced_model in SYNCED_MODELS:
+    post_delete.connect(record_tombstone, sender=synced_model, dispatch_uid=f'tombstone_{synced_model.__name__}')
+
+# Per model: a receiver for every sender would stop Django fast-deleting any model
+for indexed_model in INDEXED_MODELS:
+    for signal in (post_save, post_delete):
+        signal.connect(indexed_name_changed, sender=indexed_model, dispatch_uid=f'autocomplete_{indexed_model.__name__}')
+
+
+@receiver(connection_created)
+def register_sqlite_functions(sender, connection, **kwargs):
+    # Stand-in for pg_trgm's similarity() in fuzzy order search
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('SIMILARITY', 2, similarity, deterministic=True)
@@ -0,0 +1,225 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Category, ProductLabel, Product, ProductImage, ProductDiscount, Service, Tombstone
+from .pricing import active_discounts_q, best_price
+from .sync import tombstone_label
+
+MANIFEST_NAME = 'manifest.json'
+CHUNK_SIZE = 2000
+
+
+def snapshot_root():
+    return getattr(settings, 'CATALOG_SNAPSHOT_ROOT', os.path.join(settings.MEDIA_ROOT, 'catalog'))
+
+
+def shard_of(product_id, shard_count):
+    return product_id % shard_count
+
+
+def read_manifest(root=None):
+    try:
+        with open(os.path.join(root or snapshot_root(), MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def write_document(root, stem, payload):
+    """
+    Write ``payload`` as ``<stem>.<hash>.json`` plus a ``.gz`` sibling for
+    servers that send precompressed files. Names change with the content, so
+    the files can be cached forever; unchanged content is not rewritten.
+    """
+    data = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    name = f'{stem}.{hashlib.sha256(data).hexdigest()[:16]}.json'
+    path = os.path.join(root, name)
+    if not os.path.exists(path):
+        _atomic_write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        _atomic_write(path, data)
+    return name
+
+
+def product_documents(queryset, now):
+    """Storefront documents for ``queryset``, built from a few queries per chunk."""
+    image_storage = ProductImage._meta.get_field('image').storage
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values(
+            'id', 'name', 'description', 'price', 'category_id', 'in_stock', 'updated_at'
+        )[:CHUNK_SIZE])
+        if not rows:
+            return
+        ids = [row['id'] for row in rows]
+        last_id = ids[-1]
+
+        images = defaultdict(list)
+        for product_id, image, alt_text, is_primary in (
+            ProductImage.objects.filter(product_id__in=ids).order_by('-is_primary', 'id')
+            .values_list('product_id', 'image', 'alt_text', 'is_primary')
+        ):
+            images[product_id].append({
+                'url': image_storage.url(image), 'alt_text': alt_text, 'is_primary': is_primary,
+            })
+        labels = defaultdict(list)
+        for product_id, label_id in (
+            Product.labels.through.objects.filter(product_id__in=ids).order_by('productlabel_id')
+            .values_list('product_id', 'productlabel_id')
+        ):
+            labels[product_id].append(label_id)
+        discounts = defaultdict(list)
+        for product_id, discount_type, value in (
+            ProductDiscount.objects.filter(active_discounts_q(now), product_id__in=ids)
+            .values_list('product_id', 'discount_type', 'value')
+        ):
+            discounts[product_id].append((discount_type, value))
+
+        for row in rows:
+            product_id = row['id']
+            yield {
+                'id': product_id,
+                'name': row['name'],
+                'description': row['description'],
+                'price': row['price'],
+                'effective_price': best_price(row['price'], discounts[product_id]),
+                'category': row['category_id'],
+                'labels': labels[product_id],
+                'in_stock': row['in_stock'],
+                'images': images[product_id],
+                'updated_at': row['updated_at'],
+            }
+
+
+def service_documents():
+    service_fields = {name: Service._meta.get_field(name).storage for name in ('icon', 'image')}
+    for row in Service.objects.filter(is_active=True).order_by('id').values(
+        'id', 'name', 'description', 'price', 'icon', 'image'
+    ):
+        for name, storage in service_fields.items():
+            row[name] = storage.url(row[name]) if row[name] else None
+        yield row
+
+
+def dirty_shards(since, now, shard_count):
+    """
+    Shards holding a product that changed, was deleted, or had a discount
+    start or end since ``since``. Image, label, category and discount edits
+    already bump the product's updated_at.
+    """
+    product_ids = set(Product.objects.filter(updated_at__gte=since).values_list('id', flat=True))
+    product_ids.update(Tombstone.objects.filter(
+        model=tombstone_label(Product), deleted_at__gte=since
+    ).values_list('object_id', flat=True))
+    # A discount window opening or closing changes prices without any write
+    product_ids.update(ProductDiscount.objects.filter(is_active=True).filter(
+        Q(start_date__gte=since, start_date__lte=now) | Q(end_date__gte=since, end_date__lte=now)
+    ).values_list('product_id', flat=True))
+    return {shard_of(product_id, shard_count) for product_id in product_ids}
+
+
+def build_snapshot(full=False):
+    """
+    Bring the catalog snapshot under ``snapshot_root()`` up to date. Only
+    product shards with changes are rebuilt unless ``full`` is set; the new
+    manifest is swapped in atomically once every file it names is on disk.
+    Returns the new manifest and the shards that were rebuilt.
+    """
+    root = snapshot_root()
+    os.makedirs(root, exist_ok=True)
+    shard_count = getattr(settings, 'CATALOG_SHARDS', 16)
+    with open(os.path.join(root, '.lock'), 'w') as lock:
+        # One builder at a time; a second run waits and then finds little to do
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        now = timezone.now()
+        previous = read_manifest(root)
+        if full or previous is None or previous.get('shard_count') != shard_count:
+            product_files = [None] * shard_count
+            rebuild = set(range(shard_count))
+        else:
+            product_files = list(previous['files']['products'])
+            # Overlap the last run a little so rows committed late aren't missed
+            since = parse_datetime(previous['built_at']) - timedelta(
+                seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 5)
+            )
+            rebuild = dirty_shards(since, now, shard_count)
+
+        # One shard in memory at a time
+        sharded = Product.objects.annotate(shard=Mod('id', shard_count))
+        for shard in sorted(rebuild):
+            documents = list(product_documents(sharded.filter(shard=shard), now))
+            product_files[shard] = write_document(root, f'products-{shard:03d}', documents)
+
+        files = {
+            'categories': write_document(root, 'categories', list(
+                Category.objects.order_by('name').values('id', 'name')
+            )),
+            'labels': write_document(root, 'labels', list(
+                ProductLabel.objects.order_by('name').values('id', 'name', 'color')
+            )),
+            'services': write_document(root, 'services', list(service_documents())),
+            'products': product_files,
+        }
+        changed = previous is None or files != previous['files']
+        manifest = {
+            'version': (previous['version'] if previous else 0) + (1 if changed else 0),
+            'built_at': now.isoformat(),
+            'shard_count': shard_count,
+            'files': files,
+        }
+        _atomic_write(os.path.join(root, MANIFEST_NAME), json.dumps(manifest, indent=1).encode())
+        if previous is not None:
+            retire_files(root, manifest_names(previous['files']) - manifest_names(files))
+        remove_stale_files(root, files)
+    return manifest, sorted(rebuild)
+
+
+def manifest_names(files):
+    names = {files['categories'], files['labels'], files['services'], *files['products']}
+    names.discard(None)
+    return names | {f'{name}.gz' for name in names}
+
+
+def retire_files(root, names):
+    # The grace period for files dropped from the manifest starts now
+    for name in names:
+        try:
+            os.utime(os.path.join(root, name))
+        except FileNotFoundError:
+            pass
+
+
+def remove_stale_files(root, files):
+    """Drop files the manifest no longer names, once clients can't still be fetching them."""
+    keep = manifest_names(files) | {MANIFEST_NAME, '.lock'}
+    cutoff = time.time() - getattr(settings, 'CATALOG_GRACE_SECONDS', 3600)
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.name not in keep and entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
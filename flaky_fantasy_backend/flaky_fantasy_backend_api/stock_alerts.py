@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import AdminUser, Notification, Product, LOW_STOCK_MAX_THRESHOLD
+
+DEFAULT_THRESHOLD = 5
+DEFAULT_ALERT_WINDOW = timedelta(hours=24)
+CHUNK_SIZE = 500
+
+
+def default_threshold():
+    return min(getattr(settings, 'LOW_STOCK_THRESHOLD', DEFAULT_THRESHOLD), LOW_STOCK_MAX_THRESHOLD)
+
+
+def alert_window():
+    return getattr(settings, 'LOW_STOCK_ALERT_WINDOW', DEFAULT_ALERT_WINDOW)
+
+
+def low_stock_products():
+    # The stock_quantity bound matches the partial index condition on Product
+    return (
+        Product.objects
+        .filter(stock_quantity__lte=LOW_STOCK_MAX_THRESHOLD)
+        .annotate(threshold=Coalesce(
+            'low_stock_threshold', 'category__low_stock_threshold', Value(default_threshold())
+        ))
+        .filter(stock_quantity__lte=F('threshold'))
+    )
+
+
+def could_be_low(product):
+    # Cheap pre-check used by signals so well-stocked saves cost no query
+    if product.low_stock_threshold is not None:
+        return product.stock_quantity <= product.low_stock_threshold
+    return product.stock_quantity <= LOW_STOCK_MAX_THRESHOLD
+
+
+def notify_low_stock(products, recipients=None):
+    """
+    Create low_stock notifications for ``products`` (annotated with
+    ``threshold``), skipping any product already alerted within the window.
+    Returns the number of products alerted.
+    """
+    products = {product.pk: product for product in products}
+    if not products:
+        return 0
+
+    since = timezone.now() - alert_window()
+    recent = set(
+        Notification.objects.filter(
+            notification_type='low_stock',
+            related_product_id__in=list(products),
+            created_at__gte=since,
+        ).values_list('related_product_id', flat=True)
+    )
+    pending = [product for pk, product in products.items() if pk not in recent]
+    if not pending:
+        return 0
+
+    if recipients is None:
+        recipients = list(AdminUser.objects.filter(is_staff=True, is_active=True).only('id'))
+    notifications = []
+    for product in pending:
+        for admin in recipients:
+            notifications.append(Notification(
+                recipient=admin,
+                notification_type='low_stock',
+                title=f"Low stock: {product.name}",
+                message=f"{product.name} has {product.stock_quantity} left (threshold {product.threshold}).",
+                related_product=product,
+            ))
+    Notification.objects.bulk_create(notifications, batch_size=1000)
+    return len(pending)
+
+
+def check_low_stock(product_ids):
+    """Entry point for stock-change paths, including bulk ``update()`` calls."""
+    product_ids = list(set(product_ids))
+    alerted = 0
+    recipients = None
+    for i in range(0, len(product_ids), CHUNK_SIZE):
+        chunk = list(low_stock_products().filter(id__in=product_ids[i:i + CHUNK_SIZE]).only(
+            'id', 'name', 'stock_quantity', 'low_stock_threshold'
+        ))
+        if chunk and recipients is None:
+            recipients = list(AdminUser.objects.filter(is_staff=True, is_active=True).only('id'))
+        alerted += notify_low_stock(chunk, recipients)
+    return alerted
+
+
+def scan_low_stock(chunk_size=CHUNK_SIZE):
+    """Backfill scan over every product currently at or below its threshold."""
+    alerted = 0
+    recipients = list(AdminUser.objects.filter(is_staff=True, is_active=True).only('id'))
+    batch = []
+    queryset = low_stock_products().only('id', 'name', 'stock_quantity', 'low_stock_threshold').order_by()
+    for product in queryset.iterator(chunk_size=chunk_size):
+        batch.append(product)
+        if len(batch) >= chunk_size:
+            alerted += notify_low_stock(batch, recipients)
+            batch = []
+    alerted += notify_low_stock(batch, recipients)
+    return alerted
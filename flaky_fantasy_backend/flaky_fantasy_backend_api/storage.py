@@ -0,0 +1,68 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+
+
+@deconstructible(path='flaky_fantasy_backend_api.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each upload under the SHA-256 of its content, so identical files
+    are kept once and a URL never changes meaning (safe to cache forever).
+    The name passed in only contributes its extension.
+
+    Blobs can be shared by many rows, so ``delete()`` leaves them in place;
+    unreferenced blobs are removed by the media garbage collector.
+    """
+
+    def blob_name(self, digest, ext):
+        return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext}'
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed in _save
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(f'{BLOB_DIR}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        try:
+            # Hash while streaming to disk so large uploads are read only once
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    out.write(chunk)
+            blob = self.blob_name(digest.hexdigest(), ext)
+            blob_path = self.path(blob)
+            try:
+                # Already stored: restart the media collector's grace period,
+                # since the row about to reference it isn't committed yet
+                os.utime(blob_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, blob_path)
+            else:
+                os.unlink(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return blob
+
+    def delete(self, name):
+        pass
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{BLOB_DIR}/')
+
+
+content_addressed_storage = ContentAddressedStorage()
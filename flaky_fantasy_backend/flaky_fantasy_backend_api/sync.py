@@ -0,0 +1,154 @@
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import (
+    Category, ProductLabel, Product, DiscountCode, ProductDiscount, Order, Service,
+    Tombstone
+)
+
+# Models served through DeltaSyncMixin; deleting one of these leaves a Tombstone
+SYNCED_MODELS = [Category, ProductLabel, Product, DiscountCode, ProductDiscount, Order, Service]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def tombstone_label(model):
+    return model._meta.label_lower
+
+
+def delete_with_tombstones(queryset, batch_size=1000):
+    """
+    ``queryset.delete()`` for a synced model, with the rows' tombstones
+    written by bulk INSERTs instead of one per row from the post_delete
+    receiver, which skips the rows of a delete started here. Rows of other
+    synced models the delete cascades to still get theirs from the receiver.
+    """
+    label = tombstone_label(queryset.model)
+    with transaction.atomic(using=queryset.db):
+        ids = list(queryset.values_list('pk', flat=True))
+        if not ids:
+            return 0, {}
+        Tombstone.objects.bulk_create(
+            [Tombstone(model=label, object_id=pk) for pk in ids], batch_size=batch_size,
+        )
+        doomed = queryset.model._base_manager.using(queryset.db).filter(pk__in=ids)
+        doomed.tombstones_written = True
+        return doomed.delete()
+
+
+def encode_cursor(rows_key, tombstones_key):
+    raw = '|'.join([
+        rows_key[0].isoformat(), str(rows_key[1]),
+        tombstones_key[0].isoformat(), str(tombstones_key[1]),
+    ])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """
+    Returns ``(rows_key, tombstones_key)``, each a ``(timestamp, id)`` pair.
+    Besides cursors handed out by ``changes`` a plain ISO timestamp is
+    accepted, which starts both streams at that time.
+    """
+    moment = parse_datetime(value)
+    if moment is not None:
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment, dt_timezone.utc)
+        return (moment, 0), (moment, 0)
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        rows_at, rows_id, tombstones_at, tombstones_id = parts
+        rows_key = (datetime.fromisoformat(rows_at), int(rows_id))
+        tombstones_key = (datetime.fromisoformat(tombstones_at), int(tombstones_id))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError({'updated_since': 'Invalid cursor.'})
+    return rows_key, tombstones_key
+
+
+def after(queryset, field, key):
+    # (field, id) > key, written so the (field, id) index can range-scan
+    moment, last_id = key
+    return queryset.filter(**{f'{field}__gte': moment}).exclude(**{field: moment, 'id__lte': last_id})
+
+
+def advance(since, last, full, settled):
+    """
+    Next cursor position for one stream. A full page continues after its
+    last row. Otherwise the cursor stops at ``settled`` so rows written by
+    transactions that commit a little late are picked up by the next call;
+    clients upsert, so seeing a row twice is harmless.
+    """
+    if full:
+        return last
+    floor = (settled, 0)
+    return max(since, min(last, floor)) if last else max(since, floor)
+
+
+class DeltaSyncMixin:
+    """
+    Adds ``GET <list>/changes/?updated_since=<cursor>``, which returns the rows
+    changed and the ids deleted since the cursor, plus the cursor for the next
+    call. Leave ``updated_since`` out for the first, full sync and keep
+    calling while ``has_more`` is true.
+
+    Orders moved to the archive by apply_retention leave the orders table,
+    so they are reported in ``deleted`` like any other delete; clients that
+    keep order history can fetch them from /api/archived-orders/.
+    """
+    sync_field = 'updated_at'
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        page_size = getattr(settings, 'SYNC_PAGE_SIZE', 500)
+        now = timezone.now()
+        settled = now - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 5))
+
+        since = request.query_params.get('updated_since')
+        if since:
+            rows_key, tombstones_key = decode_cursor(since)
+            horizon = now - timedelta(days=getattr(settings, 'TOMBSTONE_TTL_DAYS', 30))
+            if tombstones_key[0] < horizon:
+                # Tombstones this old may have been pruned, so deletions could be missed
+                return Response(
+                    {'error': 'Cursor has expired, run a full sync'}, status=status.HTTP_410_GONE
+                )
+        else:
+            # Nothing to delete on a first sync; only watch for deletes from now on
+            rows_key, tombstones_key = (EPOCH, 0), (settled, 0)
+
+        queryset = after(self.get_queryset(), self.sync_field, rows_key)
+        rows = list(queryset.order_by(self.sync_field, 'id')[:page_size + 1])
+        rows_full = len(rows) > page_size
+        rows = rows[:page_size]
+
+        tombstones = list(
+            after(Tombstone.objects.filter(model=tombstone_label(self.queryset.model)), 'deleted_at', tombstones_key)
+            .order_by('deleted_at', 'id')
+            .values_list('deleted_at', 'id', 'object_id')[:page_size + 1]
+        )
+        tombstones_full = len(tombstones) > page_size
+        tombstones = tombstones[:page_size]
+
+        last_row = (getattr(rows[-1], self.sync_field), rows[-1].id) if rows else None
+        last_tombstone = tombstones[-1][:2] if tombstones else None
+        cursor = encode_cursor(
+            advance(rows_key, last_row, rows_full, settled),
+            advance(tombstones_key, last_tombstone, tombstones_full, settled),
+        )
+        return Response({
+            'results': self.get_serializer(rows, many=True).data,
+            'deleted': [object_id for _, _, object_id in tombstones],
+            'cursor': cursor,
+            'has_more': rows_full or tombstones_full,
+        })
@@ -1,3 +1,1335 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import addModuleCleanup, mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.db.utils import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIClient
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.tokens import AccessToken
+
+from flaky_fantasy_backend import db_router
+
+from . import autocomplete, events, warmup
+from .models import (
+    AdminUser, Category, ProductLabel, Product, ProductImage, ProductDiscount, DiscountCode, Order, OrderItem,
+    StockMovement, StockSnapshot, ProductPairCount, ProductRecommendation, Tombstone, ArchivedOrder, Notification,
+    OrderStatusHistory, Service
+)
+from .autocomplete import AutocompleteIndex
+from .inventory import InsufficientStock, record_movements, set_stock, stock_changed, stock_levels, take_snapshots
+from .media_gc import find_orphans
+from .order_lookup import classify, lookup_orders
+from .order_status import bulk_transition_orders
+from .query_plans import capture_plans
+from .retention import archive_order_batch, archive_orders, order_archive_cutoff
+from .row_serializers import RowListMixin
+from .snapshot import MANIFEST_NAME, build_snapshot, manifest_names, read_manifest, shard_of
+from .stock_alerts import alert_window, check_low_stock, scan_low_stock
+from .storage import BLOB_DIR, ContentAddressedStorage
+from .sync import delete_with_tombstones, tombstone_label
+from .throttling import SharedBuckets
+from .thumbnails import THUMBNAIL_DIR, THUMBNAIL_SIZES, make_thumbnails, thumbnail_name, thumbnail_url
+
+
+def setUpModule():
+    # Throttle counters and replica pins go in state of their own, not the host's shared files
+    state_dir = tempfile.mkdtemp()
+    addModuleCleanup(shutil.rmtree, state_dir)
+    shared_state = override_settings(THROTTLE_STATE_PATH=os.path.join(state_dir, 'throttle'), CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'replica_pins': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'replica-pins'},
+    })
+    shared_state.enable()
+    addModuleCleanup(shared_state.disable)
+
+
+class StockAlertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('alice', 'bob'):
+            AdminUser.objects.create_user(username=name, password='staff-password', is_staff=True)
+        AdminUser.objects.create_user(username='carol', password='staff-password', is_staff=True, is_active=False)
+        AdminUser.objects.create_user(username='customer', password='customer-password')
+        pantry = Category.objects.create(name='Pantry', low_stock_threshold=10)
+        bakery = Category.objects.create(name='Bakery')
+        cls.flour = Product.objects.create(name='Flour', category=pantry, stock_quantity=8)
+        cls.salt = Product.objects.create(name='Salt', category=pantry, stock_quantity=8, low_stock_threshold=3)
+        cls.rye = Product.objects.create(name='Rye', category=bakery, stock_quantity=5)
+        cls.oats = Product.objects.create(name='Oats', category=bakery, stock_quantity=6)
+
+    def alerts(self):
+        return Notification.objects.filter(notification_type='low_stock')
+
+    def test_product_then_category_then_default_threshold(self):
+        # Flour is under its category's 10, Salt is over its own 3, Rye is at the default 5
+        self.assertEqual(check_low_stock([self.flour.pk, self.salt.pk, self.rye.pk, self.oats.pk]), 2)
+        self.assertEqual(
+            sorted(self.alerts().values_list('related_product__name', 'recipient__username')),
+            [('Flour', 'alice'), ('Flour', 'bob'), ('Rye', 'alice'), ('Rye', 'bob')],
+        )
+        with override_settings(LOW_STOCK_THRESHOLD=6):
+            self.assertEqual(check_low_stock([self.oats.pk]), 1)
+
+    def test_alerts_once_per_window(self):
+        self.assertEqual(check_low_stock([self.flour.pk, self.flour.pk]), 1)
+        self.assertEqual(check_low_stock([self.flour.pk]), 0)
+        self.assertEqual(scan_low_stock(), 1)
+
+        self.alerts().update(created_at=timezone.now() - alert_window() - timedelta(minutes=1))
+        self.assertEqual(check_low_stock([self.flour.pk]), 1)
+        self.assertEqual(self.alerts().filter(related_product=self.flour).count(), 4)
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(5)])
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', category=categories[i % 5], stock_quantity=i % 30, in_stock=i % 30 > 0)
+            for i in range(200)
+        ])
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'products/{product.pk}.png', is_primary=True)
+            for product in products
+        ])
+        now = timezone.now()
+        ProductDiscount.objects.bulk_create([
+            ProductDiscount(product=product, discount_type='percentage', value=10,
+                            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+            for product in products[::4]
+        ])
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        orders = [
+            Order(order_number=f'ORD-{i}', customer_name='Customer', customer_email=f'c{i % 20}@example.com',
+                  customer_phone=f'+234 700 000 {i % 20:04d}', shipping_address='Address', total_amount=10,
+                  status=statuses[i % len(statuses)])
+            for i in range(200)
+        ]
+        for order in orders:
+            order.normalize_lookup_fields()
+        Order.objects.bulk_create(orders)
+        cls.sample = {
+            'category': categories[0].pk, 'product': products[0].pk,
+            'email': 'C1@example.com', 'phone': '+234 700', 'order_number': 'ord-17',
+        }
+
+    def test_hot_queries_use_indexes(self):
+        for name, (plan, table, scanned) in capture_plans(self.sample).items():
+            with self.subTest(query=name):
+                self.assertFalse(scanned, f'{name} does a full scan of {table}:\n{plan}')
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        media = override_settings(MEDIA_ROOT=self.root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.admin = AdminUser.objects.create_superuser(username='admin', password='admin-password')
+        self.category = Category.objects.create(name='Category')
+
+    def upload(self, name, color):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), color).save(buffer, 'PNG')
+        product = Product.objects.create(name=name, category=self.category)
+        return ProductImage.objects.create(
+            product=product, image=ContentFile(buffer.getvalue(), name=f'{name}.png'), is_primary=True,
+        )
+
+    def thumbnails(self):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, name), self.root)
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, THUMBNAIL_DIR)) for name in filenames
+        )
+
+    def test_thumbnails_are_made_on_save_and_only_linked_by_the_changelist(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            saved = self.upload('Saved', 'red')
+        unsaved = self.upload('Unsaved', 'blue')
+        self.assertEqual(self.thumbnails(), sorted(thumbnail_name(saved.image, size) for size in THUMBNAIL_SIZES))
+        with Image.open(os.path.join(self.root, thumbnail_name(saved.image, 50))) as thumb:
+            self.assertEqual(thumb.size, (50, 38))
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/flaky_fantasy_backend_api/product/', HTTP_HOST='localhost')
+        self.assertContains(response, thumbnail_url(saved.image, 50))
+        self.assertContains(response, 'No preview')
+        self.assertEqual(len(self.thumbnails()), len(THUMBNAIL_SIZES))
+
+        out = StringIO()
+        call_command('build_thumbnails', stdout=out)
+        self.assertIn(f'Wrote {len(THUMBNAIL_SIZES)} thumbnails for 2 images', out.getvalue())
+        self.assertIsNotNone(thumbnail_url(unsaved.image, 50))
+        self.assertEqual(make_thumbnails(unsaved.image), 0)
+
+
+class RowSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Category')
+        labels = [ProductLabel.objects.create(name=f'Label {i}') for i in range(3)]
+        products = []
+        for i in range(6):
+            product = Product.objects.create(
+                name=f'Product {i}', category=category, price='12.5', stock_quantity=i,
+                description=None if i % 2 else f'Description {i}', low_stock_threshold=i or None,
+            )
+            product.labels.set(labels[:i % 4])
+            for j in range(i % 3):
+                ProductImage.objects.create(product=product, image=f'products/{i}-{j}.png', is_primary=j == 0)
+            products.append(product)
+        for i in range(4):
+            order = Order.objects.create(
+                order_number=f'ORD-{i}', customer_name='Customer', customer_email='c@example.com',
+                customer_phone='000', shipping_address='Address', total_amount='30.10',
+            )
+            for product in products[i:i + 2]:
+                OrderItem.objects.create(order=order, product=product, quantity=2, price_at_purchase='15.05')
+        # An item whose product is gone has no product_name key at all
+        OrderItem.objects.create(order=order, product=None, quantity=1, price_at_purchase='1.00')
+        cls.user = AdminUser.objects.create_user('staff', password='password', is_staff=True)
+
+    def assertSameJson(self, path):
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(self.user)
+        fast = client.get(path)
+        with mock.patch.object(RowListMixin, 'list', ListModelMixin.list):
+            slow = client.get(path)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+
+    def test_product_list_matches_model_serializer(self):
+        self.assertSameJson('/api/products/?ordering=name')
+
+    def test_order_list_matches_model_serializer(self):
+        self.assertSameJson('/api/orders/?ordering=created_at')
+
+
+class BulkTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AdminUser.objects.create_user(username='ops', password='ops-password', is_staff=True)
+
+    def order(self, status):
+        number = Order.objects.count() + 1
+        return Order.objects.create(
+            order_number=f'ORD-{number}', customer_name='Customer', customer_email='c@example.com',
+            customer_phone='+234 700 000 0000', shipping_address='Address', total_amount=10, status=status,
+        )
+
+    def test_allowed_transitions_use_one_update_per_source_status(self):
+        orders = [self.order('pending'), self.order('pending'), self.order('processing')]
+        with CaptureQueriesContext(connections['default']) as queries:
+            results = bulk_transition_orders([order.pk for order in orders], 'cancelled', user=self.user)
+        self.assertEqual(
+            results,
+            [{'id': order.pk, 'ok': True, 'from': order.status, 'to': 'cancelled'} for order in orders],
+        )
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 2)
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'cancelled'})
+        self.assertEqual(
+            sorted(OrderStatusHistory.objects.values_list('order_id', 'from_status', 'to_status', 'changed_by')),
+            [(order.pk, order.status, 'cancelled', self.user.pk) for order in orders],
+        )
+
+    def test_rejected_transitions_change_nothing(self):
+        delivered, pending = self.order('delivered'), self.order('pending')
+        results = bulk_transition_orders([delivered.pk, pending.pk, 999999], 'pending')
+        self.assertEqual([result['ok'] for result in results], [False, False, False])
+        self.assertEqual(
+            [result['error'] for result in results],
+            ['Cannot change status from delivered to pending', 'Order is already pending', 'Order not found'],
+        )
+        self.assertEqual(sorted(Order.objects.values_list('status', flat=True)), ['delivered', 'pending'])
+        self.assertFalse(OrderStatusHistory.objects.exists())
+
+    def test_mixed_batch_reports_each_order(self):
+        shipped, cancelled, processing = self.order('shipped'), self.order('cancelled'), self.order('processing')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/orders/bulk_transition/', {
+            'order_ids': [shipped.pk, cancelled.pk, shipped.pk, processing.pk], 'status': 'delivered',
+        }, format='json', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['updated'], body['failed']), (1, 2))
+        # One result per distinct order, in request order
+        self.assertEqual([(result['id'], result['ok']) for result in body['results']], [
+            (shipped.pk, True), (cancelled.pk, False), (processing.pk, False),
+        ])
+        self.assertEqual(body['results'][0], {'id': shipped.pk, 'ok': True, 'from': 'shipped', 'to': 'delivered'})
+        self.assertEqual(Order.objects.get(pk=processing.pk).status, 'processing')
+
+
+class RetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AdminUser.objects.create_user(username='ops', password='ops-password', is_staff=True)
+        cls.product = Product.objects.create(name='Loaf', category=Category.objects.create(name='Category'))
+
+    def order(self, number, status, age_days=400):
+        order = Order.objects.create(
+            order_number=number, customer_name='Customer', customer_email='c@example.com',
+            customer_phone='+234 700 000 0000', shipping_address='Address', total_amount='9.00', status=status,
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=age_days))
+        return Order.objects.get(pk=order.pk)
+
+    def test_archived_orders_keep_items_and_history(self):
+        order = self.order('ORD-1', 'delivered')
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price_at_purchase='4.50')
+        changed_at = timezone.now() - timedelta(days=399)
+        OrderStatusHistory.objects.create(
+            order=order, from_status='pending', to_status='delivered', changed_by=self.user, changed_at=changed_at,
+        )
+        notification = Notification.objects.create(
+            recipient=self.user, notification_type='order', title='New order', message='-', related_order=order,
+        )
+        self.order('ORD-2', 'delivered', age_days=30)
+        self.order('ORD-3', 'pending')
+
+        self.assertEqual(archive_order_batch(order_archive_cutoff(), 500), 1)
+        self.assertEqual(sorted(Order.objects.values_list('order_number', flat=True)), ['ORD-2', 'ORD-3'])
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual(
+            (archived.pk, archived.order_number, archived.status, archived.total_amount, archived.created_at),
+            (order.pk, 'ORD-1', 'delivered', Decimal('9.00'), order.created_at),
+        )
+        self.assertEqual(archived.status_history, [
+            {'from': 'pending', 'to': 'delivered', 'changed_by': self.user.pk, 'changed_at': changed_at.isoformat()},
+        ])
+        self.assertEqual(
+            list(archived.items.values_list('product_id', 'quantity', 'price_at_purchase')),
+            [(self.product.pk, 2, Decimal('4.50'))],
+        )
+        notification.refresh_from_db()
+        self.assertIsNone(notification.related_order_id)
+
+    def test_orders_are_archived_in_skip_locked_batches(self):
+        for i in range(5):
+            self.order(f'ORD-{i}', 'cancelled')
+        out = StringIO()
+        call_command(
+            'apply_retention', '--batch-size=2', '--max-batches=1', '--skip-notifications', '--skip-tombstones',
+            stdout=out,
+        )
+        self.assertIn('Archived 2 orders', out.getvalue())
+
+        # SQLite has no row locks; check the batches ask for them where the database does
+        features = connections['default'].features
+        unlocked = mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=lambda qs, **kw: qs)
+        with mock.patch.object(features, 'has_select_for_update_skip_locked', True), unlocked as lock:
+            self.assertEqual(list(archive_orders(batch_size=2)), [2, 1])
+        self.assertEqual(lock.call_args_list, [mock.call(mock.ANY, skip_locked=True)] * 3)
+        self.assertEqual((Order.objects.count(), ArchivedOrder.objects.count()), (0, 5))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AdminUser.objects.create_user(username='ops', password='ops-password', is_staff=True)
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Loaf', category=category)
+        cls.order = Order.objects.create(
+            order_number='ORD-1', customer_name='Customer', customer_email='c@example.com',
+            customer_phone='+234 700 000 0000', shipping_address='Address', total_amount=10,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, **headers):
+        return self.client.get(path, HTTP_HOST='localhost', **headers)
+
+    def etag(self, path):
+        response = self.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_resources_are_not_modified(self):
+        for path in (f'/api/products/{self.product.pk}/', '/api/products/'):
+            with self.subTest(path=path):
+                response = self.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        path = f'/api/products/{self.product.pk}/'
+        last_modified = self.get(path)['Last-Modified']
+        self.assertEqual(self.get(path, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_list_ignores_if_modified_since(self):
+        older = Product.objects.create(name='Older', category=self.product.category)
+        Product.objects.filter(pk=older.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        response = self.get('/api/products/')
+        self.assertNotIn('Last-Modified', response)
+        # max(updated_at) is unchanged by deleting a row that isn't the newest
+        since = http_date(time.time() + 60)
+        older.delete()
+        response = self.get('/api/products/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Loaf'])
+
+    def test_child_rows_change_the_parent_etag(self):
+        product_path, order_path = f'/api/products/{self.product.pk}/', f'/api/orders/{self.order.pk}/'
+        changes = [
+            (product_path, lambda: ProductImage.objects.create(product=self.product, image='products/loaf.png')),
+            (product_path, lambda: ProductDiscount.objects.create(
+                product=self.product, discount_type='percentage', value=10,
+                start_date=timezone.now(), end_date=timezone.now() + timedelta(days=1),
+            )),
+            (order_path, lambda: OrderItem.objects.create(
+                order=self.order, product=self.product, quantity=1, price_at_purchase=10,
+            )),
+        ]
+        for path, change in changes:
+            with self.subTest(path=path):
+                before = self.etag(path)
+                change()
+                self.assertNotEqual(self.etag(path), before)
+                self.assertEqual(self.get(path, HTTP_IF_NONE_MATCH=before).status_code, 200)
+
+
+@override_settings(CATALOG_SHARDS=4, CATALOG_GRACE_SECONDS=3600)
+class CatalogSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Category')
+        cls.products = [Product.objects.create(name=f'Product {i}', category=category) for i in range(8)]
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        root = override_settings(CATALOG_SNAPSHOT_ROOT=self.root)
+        root.enable()
+        self.addCleanup(root.disable)
+        # Older than the overlap each incremental build re-reads
+        Product.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def age(self, *names, seconds=7200):
+        for name in names:
+            os.utime(os.path.join(self.root, name), (time.time() - seconds, time.time() - seconds))
+
+    def test_a_product_change_rewrites_only_its_shard(self):
+        first, rebuilt = build_snapshot()
+        self.assertEqual(rebuilt, [0, 1, 2, 3])
+        self.assertEqual(build_snapshot(), (dict(first, built_at=mock.ANY), []))
+
+        product = self.products[5]
+        product.name = 'Renamed'
+        product.save()
+        second, rebuilt = build_snapshot()
+        shard = shard_of(product.pk, 4)
+        self.assertEqual(rebuilt, [shard])
+        self.assertEqual(second['version'], first['version'] + 1)
+        changed = [i for i, (a, b) in enumerate(zip(first['files']['products'], second['files']['products'])) if a != b]
+        self.assertEqual(changed, [shard])
+        with open(os.path.join(self.root, second['files']['products'][shard])) as f:
+            self.assertIn('Renamed', [document['name'] for document in json.load(f)])
+
+    def test_manifest_is_swapped_in_whole(self):
+        manifest, _ = build_snapshot()
+        Category.objects.create(name='Added')
+        replace = os.replace
+
+        def fail_manifest(src, dst):
+            if dst.endswith(MANIFEST_NAME):
+                raise OSError('disk full')
+            return replace(src, dst)
+        with mock.patch.object(os, 'replace', side_effect=fail_manifest), self.assertRaises(OSError):
+            build_snapshot()
+        self.assertEqual(read_manifest(), manifest)
+        self.assertFalse([name for name in os.listdir(self.root) if name.startswith('.tmp-')])
+        # Every file a manifest names is written before the manifest itself
+        manifest, _ = build_snapshot()
+        self.assertTrue(manifest_names(manifest['files']) <= set(os.listdir(self.root)))
+
+    def test_retired_files_are_removed_after_the_grace_period(self):
+        first, _ = build_snapshot()
+        self.age(*os.listdir(self.root))
+        product = self.products[2]
+        product.name = 'Renamed'
+        product.save()
+        second, _ = build_snapshot()
+        retired = manifest_names(first['files']) - manifest_names(second['files'])
+        self.assertEqual(len(retired), 2)
+        # Written long ago, but only just dropped from the manifest
+        self.assertTrue(retired <= set(os.listdir(self.root)))
+
+        self.age(*retired, seconds=3601)
+        build_snapshot()
+        present = set(os.listdir(self.root))
+        self.assertFalse(retired & present)
+        self.assertTrue(manifest_names(second['files']) <= present)
+
+
+# Reads run in the request thread: pool threads' connections can't see the test's transaction
+@override_settings(BATCH_MAX_WORKERS=1)
+class BatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AdminUser.objects.create_user(username='ops', password='ops-password', is_staff=True)
+        Category.objects.create(name='Existing')
+
+    def batch(self, *requests, client=None):
+        return (client or APIClient()).post(
+            '/api/batch/', {'requests': list(requests)}, format='json', HTTP_HOST='localhost',
+        )
+
+    def test_nested_batches_and_outside_paths_are_rejected(self):
+        for path in ('/api/batch/', '/api/batch', '/admin/', 'https://example.com/api/products/'):
+            with self.subTest(path=path):
+                response = self.batch({'method': 'GET', 'path': path})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('path', response.json()['requests'][0])
+
+    def test_subrequests_apply_their_own_permissions(self):
+        requests = ({'id': 'orders', 'path': '/api/orders/'}, {'id': 'categories', 'path': '/api/categories/'})
+        anonymous = self.batch(*requests).json()['responses']
+        self.assertEqual(
+            [(result['id'], result['status']) for result in anonymous], [('orders', 401), ('categories', 200)],
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        signed_in = self.batch(*requests, client=client).json()['responses']
+        self.assertEqual([result['status'] for result in signed_in], [200, 200])
+
+    def test_writes_are_ordered_before_following_reads(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        before, created, after = self.batch(
+            {'path': '/api/categories/'},
+            {'method': 'POST', 'path': '/api/categories/', 'body': {'name': 'Batched'}},
+            {'path': '/api/categories/'},
+            client=client,
+        ).json()['responses']
+        self.assertEqual(created['status'], 201)
+        self.assertEqual([row['name'] for row in before['body']['results']], ['Existing'])
+        self.assertEqual(sorted(row['name'] for row in after['body']['results']), ['Batched', 'Existing'])
+
+
+class TombstoneTests(TestCase):
+    def tombstoned(self, model):
+        return sorted(Tombstone.objects.filter(model=tombstone_label(model)).values_list('object_id', flat=True))
+
+    def test_archived_orders_are_tombstoned_in_bulk(self):
+        ids = []
+        for i in range(3):
+            order = Order.objects.create(
+                order_number=f'ORD-{i}', customer_name='Customer', customer_email='c@example.com',
+                customer_phone='000', shipping_address='Address', total_amount='1.00', status='delivered',
+            )
+            ids.append(order.pk)
+        Order.objects.update(created_at=timezone.now() - timedelta(days=400))
+
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(archive_order_batch(timezone.now() - timedelta(days=365), 500), 3)
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(f'INSERT INTO "{Tombstone._meta.db_table}"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(self.tombstoned(Order), ids)
+        self.assertEqual(ArchivedOrder.objects.count(), 3)
+
+    def test_cascaded_and_single_deletes_are_tombstoned_once(self):
+        category = Category.objects.create(name='Category')
+        products = [Product.objects.create(name=f'Product {i}', category=category) for i in range(2)]
+        discount = ProductDiscount.objects.create(
+            product=products[0], discount_type='fixed', value='1.00',
+            start_date=timezone.now(), end_date=timezone.now() + timedelta(days=1),
+        )
+        delete_with_tombstones(Product.objects.filter(pk=products[0].pk))
+        self.assertEqual(self.tombstoned(Product), [products[0].pk])
+        self.assertEqual(self.tombstoned(ProductDiscount), [discount.pk])
+
+        category_id = category.pk
+        category.delete()
+        self.assertEqual(self.tombstoned(Product), sorted(product.pk for product in products))
+        self.assertEqual(self.tombstoned(Category), [category_id])
+
+
+class MigrateIfNeededTests(TransactionTestCase):
+    app = 'flaky_fantasy_backend_api'
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes(self.app))
+
+    def pending(self):
+        executor = MigrationExecutor(connection)
+        return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+    def test_migrates_only_when_something_is_pending(self):
+        out = StringIO()
+        with mock.patch('flaky_fantasy_backend_api.management.commands.migrate_if_needed.call_command') as migrate:
+            call_command('migrate_if_needed', stdout=out)
+        migrate.assert_not_called()
+        self.assertIn('No migrations to apply', out.getvalue())
+
+        MigrationExecutor(connection).migrate([(self.app, '0012_inventory_ledger')])
+        self.assertEqual([migration.name for migration, backwards in self.pending()], ['0013_product_recommendations'])
+        out = StringIO()
+        call_command('migrate_if_needed', stdout=out)
+        self.assertIn('Applying flaky_fantasy_backend_api.0013_product_recommendations', out.getvalue())
+        self.assertEqual(self.pending(), [])
+
+
+class WarmUpTests(TestCase):
+    def test_warm_up_without_database_leaves_no_connection_behind(self):
+        marks = []
+        rebuild = AutocompleteIndex.rebuild
+
+        def recorded_rebuild(index):
+            marks.append(('rebuild', len(queries)))
+            rebuild(index)
+
+        def recorded_close_all():
+            marks.append(('close_all', len(queries)))
+
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch.object(autocomplete, '_index', None), \
+                mock.patch.object(AutocompleteIndex, 'rebuild', autospec=True, side_effect=recorded_rebuild), \
+                mock.patch.object(connections, 'close_all', side_effect=recorded_close_all), \
+                mock.patch.object(warmup, 'open_connections') as open_connections:
+            timings = warmup.warm_up(database=False)
+        # The preloaded autocomplete build is the only DB work, and its connection is closed before any fork
+        self.assertEqual(marks, [('rebuild', 0), ('close_all', len(queries))])
+        open_connections.assert_not_called()
+        self.assertEqual(list(timings), ['imports', 'url_resolvers', 'serializers', 'autocomplete'])
+
+
+class OrderLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AdminUser.objects.create_user(username='ops', password='ops-password', is_staff=True)
+        cls.ada, cls.adaeze, cls.bob = [
+            Order.objects.create(
+                order_number=number, customer_name=name, customer_email=email, customer_phone=phone,
+                shipping_address='Address', total_amount=total,
+            )
+            for number, name, email, phone, total in (
+                ('ORD-1001', 'Ada Okafor', 'Ada@Example.com', '+234 (703) 555-0100', '10.00'),
+                ('ORD-1002', 'Adaeze Okafor', 'adaeze@example.org', '+234 703 555 0199', '20.00'),
+                ('98765432', 'Bob Smith', 'bob@example.net', '0800 000 0000', '5.00'),
+            )
+        ]
+        Order.objects.create(
+            order_number='ORD-1003', customer_name='Ada Okafor', customer_email='ada@example.com',
+            customer_phone='2347035550100', shipping_address='Address', total_amount='2.50',
+        )
+
+    def lookup(self, term, kind=None, exact=False):
+        return [order.order_number for order in lookup_orders(Order.objects.all(), term, kind, exact)]
+
+    def test_terms_are_classified_by_shape(self):
+        for term, kind in (
+            ('ada@example.com', 'email'), ('ada.ok', 'email'), ('+234 (703) 555-0100', 'phone'),
+            ('2347035550100', 'phone'), ('12345', 'number'), ('ORD-1001', 'number'), ('Ada Okafor', 'name'),
+        ):
+            with self.subTest(term=term):
+                self.assertEqual(classify(term), kind)
+
+    def test_prefix_and_exact_matches(self):
+        self.assertEqual(self.lookup('ADA@example.com'), ['ORD-1003', 'ORD-1001'])
+        self.assertEqual(self.lookup('ada', kind='email'), ['ORD-1003', 'ORD-1002', 'ORD-1001'])
+        self.assertEqual(self.lookup('ada', kind='email', exact=True), [])
+        # Too short to match by prefix
+        self.assertEqual(self.lookup('ad', kind='email'), [])
+        self.assertEqual(self.lookup('+234 703 555 01'), ['ORD-1003', 'ORD-1002', 'ORD-1001'])
+        self.assertEqual(self.lookup('#ord-100'), ['ORD-1003', 'ORD-1002', 'ORD-1001'])
+        self.assertEqual(self.lookup('#ord-1002', exact=True), ['ORD-1002'])
+        # A bare run of digits is also tried as a whole order number
+        self.assertEqual(self.lookup('98765432'), ['98765432'])
+
+    def test_names_fall_back_to_similarity(self):
+        self.assertEqual(self.lookup('okafor ada'), ['ORD-1003', 'ORD-1001', 'ORD-1002'])
+        self.assertEqual(self.lookup('Adaeze Okafr'), ['ORD-1002', 'ORD-1003', 'ORD-1001'])
+        self.assertEqual(self.lookup('Smyth Roberts'), [])
+
+    def test_search_and_customer_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/orders/', {'search': 'okafor ada'}, HTTP_HOST='localhost')
+        self.assertEqual(
+            [order['order_number'] for order in response.json()['results']], ['ORD-1003', 'ORD-1001', 'ORD-1002'],
+        )
+        response = client.get('/api/orders/', {'search': '0800', 'search_field': 'phone'}, HTTP_HOST='localhost')
+        self.assertEqual([order['order_number'] for order in response.json()['results']], ['98765432'])
+
+        response = client.get('/api/orders/customer/', {'phone': '234-703-555-0100'}, HTTP_HOST='localhost')
+        self.assertEqual([order['order_number'] for order in response.json()['results']], ['ORD-1003', 'ORD-1001'])
+        self.assertEqual(response.data['customer']['order_count'], 2)
+        self.assertEqual(response.data['customer']['total_spent'], Decimal('12.50'))
+        response = client.get('/api/orders/customer/', {'email': ' ADAEZE@example.org'}, HTTP_HOST='localhost')
+        self.assertEqual(response.data['customer']['order_count'], 1)
+        self.assertEqual(client.get('/api/orders/customer/', HTTP_HOST='localhost').status_code, 400)
+
+
+class OrderLookupMigrationTests(TransactionTestCase):
+    app = 'flaky_fantasy_backend_api'
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes(self.app))
+
+    def test_backfill_normalizes_existing_orders(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([(self.app, '0010_sync_tombstones')])
+        old_apps = executor.loader.project_state([(self.app, '0010_sync_tombstones')]).apps
+        old_apps.get_model(self.app, 'Order').objects.create(
+            order_number='#ord-7', customer_name='  Zoë  O\'Neil ', customer_email=' Zoe@Example.COM',
+            customer_phone='+44 (20) 7946-0000', shipping_address='Address', total_amount='1.00',
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([(self.app, '0011_order_lookup')])
+        new_apps = executor.loader.project_state([(self.app, '0011_order_lookup')]).apps
+        self.assertEqual(
+            list(new_apps.get_model(self.app, 'Order').objects.values_list(
+                'number_normalized', 'name_normalized', 'email_normalized', 'phone_normalized',
+            )),
+            [('ORD-7', 'zoe o neil', 'zoe@example.com', '442079460000')],
+        )
+
+
+class CartQuoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Category')
+        cls.hat = Product.objects.create(name='Hat', price='19.99', category=category, stock_quantity=5)
+        cls.scarf = Product.objects.create(name='Scarf', price='10.00', category=category, stock_quantity=0)
+        now = timezone.now()
+        window = {'start_date': now - timedelta(days=1), 'end_date': now + timedelta(days=1)}
+        ProductDiscount.objects.create(product=cls.hat, discount_type='percentage', value=15, **window)
+        ProductDiscount.objects.create(product=cls.scarf, discount_type='percentage', value=10, **window)
+        ProductDiscount.objects.create(product=cls.scarf, discount_type='fixed', value='2.50', **window)
+        DiscountCode.objects.create(code='SAVE10', discount_type='percentage', value=10,
+                                    max_uses=5, valid_until=now + timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def quote(self, cart):
+        return self.client.post('/api/cart/quote/', cart, content_type='application/json')
+
+    def test_quote_prices_cart_in_constant_queries(self):
+        cart = {'items': [
+            {'product': self.hat.pk, 'quantity': 1},
+            {'product': self.scarf.pk, 'quantity': 1},
+            {'product': 999999, 'quantity': 1},
+            {'product': self.hat.pk, 'quantity': 2},
+        ], 'code': 'SAVE10'}
+        with self.assertNumQueries(3):
+            response = self.quote(cart)
+        self.assertEqual(response.status_code, 200)
+        quote = response.json()
+        hat, scarf = quote['lines']
+        # 19.99 less 15% is 16.9915; the unit price rounds before the line total
+        self.assertEqual((hat['quantity'], hat['discounted_unit_price'], hat['line_total']), (3, '16.99', '50.97'))
+        self.assertEqual((scarf['discounted_unit_price'], scarf['available']), ('7.50', False))
+        self.assertEqual(quote['missing'], [999999])
+        self.assertEqual(quote['subtotal'], '58.47')
+        self.assertEqual(quote['product_discounts'], '11.50')
+        self.assertEqual(quote['code'], {'code': 'SAVE10', 'valid': True, 'reason': None, 'discount': '5.85'})
+        self.assertEqual(quote['total'], '52.62')
+        self.assertFalse(quote['available'])
+
+        # Same contents in another order: served from the cache
+        cart['items'].reverse()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.quote(cart).json(), quote)
+
+    def test_unusable_code_is_reported(self):
+        DiscountCode.objects.filter(code='SAVE10').update(used_count=5)
+        quote = self.quote({'items': [{'product': self.hat.pk, 'quantity': 1}], 'code': 'SAVE10'}).json()
+        self.assertEqual((quote['code']['reason'], quote['total']), ('used_up', '16.99'))
+
+
+class InventoryLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AdminUser.objects.create_user(username='stock', password='stock-password', is_staff=True)
+        category = Category.objects.create(name='Category')
+        cls.product = Product.objects.create(name='Loaf', category=category)
+
+    def movement(self, kind, quantity):
+        return StockMovement(product_id=self.product.pk, kind=kind, quantity=quantity)
+
+    def test_stock_quantity_follows_ledger(self):
+        record_movements([self.movement('restock', 10), self.movement('reservation', -3)])
+        with self.assertRaises(InsufficientStock):
+            record_movements([self.movement('sale', -8)])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.post(f'/api/products/{self.product.pk}/update_stock/', {'quantity': 4}, format='json')
+        # stock_quantity is read-only through the API and can't be saved directly
+        client.patch(f'/api/products/{self.product.pk}/', {'stock_quantity': 50}, format='json')
+        self.product.refresh_from_db()
+        self.product.stock_quantity = 50
+        with self.assertRaises(ValueError):
+            self.product.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.product.in_stock), (4, True))
+        set_stock(self.product, 6)
+        self.product.name = 'Sourdough'
+        self.product.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock_quantity), ('Sourdough', 6))
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('kind', 'quantity')),
+            [('restock', 10), ('reservation', -3), ('adjustment', -3), ('adjustment', 2)],
+        )
+        call_command('check_stock', stdout=StringIO())
+
+    def test_stock_changes_reach_receivers_after_commit(self):
+        received = []
+
+        def receiver(sender, levels, **kwargs):
+            received.append(levels)
+        stock_changed.connect(receiver)
+        self.addCleanup(stock_changed.disconnect, receiver)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_movements([self.movement('restock', 10)])
+            self.assertEqual(received, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            record_movements([self.movement('sale', -8)])
+        self.assertEqual(received, [{self.product.pk: (0, 10)}, {self.product.pk: (10, 2)}])
+        self.assertEqual(Notification.objects.filter(notification_type='low_stock', recipient=self.user).count(), 1)
+
+    def test_stock_as_of_uses_snapshot_and_tail(self):
+        record_movements([self.movement('restock', 10)])
+        StockMovement.objects.update(created_at=timezone.now() - timedelta(days=2))
+        record_movements([self.movement('sale', -4)])
+        self.assertEqual(take_snapshots(lag=timedelta(days=1)), 1)
+        record_movements([self.movement('restock', 5)])
+
+        self.assertEqual(stock_levels([self.product.pk])[self.product.pk][::2], (11, 2))
+        past = stock_levels([self.product.pk], at=timezone.now() - timedelta(days=1))[self.product.pk]
+        self.assertEqual(past[::2], (10, 0))
+        self.assertEqual(StockSnapshot.objects.get().quantity, 10)
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Rye Goods')
+        ProductLabel.objects.create(name='Organic')
+        cls.bread = Product.objects.create(name='Rye Bread', category=category, stock_quantity=3)
+        cls.loaf = Product.objects.create(name='Rye Loaf', category=category, stock_quantity=0, in_stock=False)
+        cls.roll = Product.objects.create(name='Rye Roll', category=category, stock_quantity=3)
+        Product.objects.create(name='Wheat Roll', category=category, stock_quantity=3)
+        order = Order.objects.create(
+            order_number='ORD-1', customer_name='Customer', customer_email='c@example.com',
+            customer_phone='000', shipping_address='Address', total_amount='10.00',
+        )
+        for product, quantity in ((cls.loaf, 9), (cls.roll, 2)):
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price_at_purchase='1.00')
+
+    def names(self, index, query):
+        return [product['name'] for product in index.suggest(query)['products']]
+
+    def test_prefix_matches_rank_in_stock_then_popular(self):
+        index = AutocompleteIndex()
+        index.rebuild()
+        self.assertEqual(self.names(index, 'ry'), ['Rye Roll', 'Rye Bread', 'Rye Loaf'])
+        self.assertEqual(self.names(index, 'ro ry'), ['Rye Roll'])
+        self.assertEqual(index.suggest('r', limit=1)['categories'], [{'id': self.bread.category_id, 'name': 'Rye Goods'}])
+        self.assertEqual(self.names(index, 'x'), [])
+
+    @override_settings(AUTOCOMPLETE_CHECK_SECONDS=0)
+    def test_catalog_changes_are_applied_incrementally(self):
+        index = AutocompleteIndex()
+        index.rebuild()
+        self.bread.name = 'Spelt Bread'
+        self.bread.save()
+        self.loaf.delete()
+        with mock.patch.object(index, 'rebuild') as rebuild:
+            index.ensure_current()
+        rebuild.assert_not_called()
+        self.assertEqual(self.names(index, 'ry'), ['Rye Roll'])
+        self.assertEqual(self.names(index, 'spe'), ['Spelt Bread'])
+
+        with mock.patch('flaky_fantasy_backend_api.autocomplete._index', index):
+            response = self.client.get('/api/autocomplete/', {'q': 'whe'}, HTTP_HOST='localhost')
+        wheat = Product.objects.get(name='Wheat Roll')
+        self.assertEqual(response.json()['products'], [{'id': wheat.pk, 'name': 'Wheat Roll', 'in_stock': True}])
+
+    @override_settings(AUTOCOMPLETE_REBUILD_SECONDS=60)
+    def test_due_rebuild_runs_in_the_background(self):
+        index = AutocompleteIndex()
+        index.rebuild()
+        index.built_at -= 120
+        rebuilt = threading.Event()
+        with mock.patch.object(index, 'rebuild', side_effect=lambda: rebuilt.wait(5)) as rebuild:
+            index.ensure_current()
+            # The request returns and keeps searching the current index meanwhile
+            self.assertEqual(self.names(index, 'whe'), ['Wheat Roll'])
+            self.assertFalse(index.refresh_lock.acquire(blocking=False))
+            rebuilt.set()
+            index.rebuild_thread.join(5)
+        rebuild.assert_called_once_with()
+        self.assertNotEqual(index.rebuild_thread.ident, threading.get_ident())
+        self.assertTrue(index.refresh_lock.acquire(blocking=False))
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Category')
+        cls.products = [Product.objects.create(name=f'Product {i}', category=category) for i in range(4)]
+
+    def order(self, *products):
+        order = Order.objects.create(
+            order_number=f'ORD-{Order.objects.count() + 1}', customer_name='Customer', customer_email='c@example.com',
+            customer_phone='000', shipping_address='Address', total_amount='1.00',
+        )
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price_at_purchase='1.00')
+        return order
+
+    def build(self, *args):
+        call_command('build_recommendations', '--lag', '0', *args, stdout=StringIO())
+        return (
+            set(ProductPairCount.objects.values_list('product_a', 'product_b', 'orders')),
+            set(ProductRecommendation.objects.values_list('product', 'related', 'orders', 'rank')),
+        )
+
+    def test_incremental_runs_match_a_full_rebuild(self):
+        a, b, c, d = self.products
+        self.order(a, b, b)
+        self.order(a, c)
+        self.build()
+        self.order(a, b, d)
+        self.order(c)
+        # An item added to an order counted by the last run pairs with what it already had
+        OrderItem.objects.create(order=self.order(b), product=c, quantity=1, price_at_purchase='1.00')
+        old = Order.objects.get(order_number='ORD-2')
+        OrderItem.objects.create(order=old, product=d, quantity=1, price_at_purchase='1.00')
+
+        incremental = self.build()
+        self.assertEqual(incremental, self.build('--full'))
+        self.assertIn((a.pk, b.pk, 2), incremental[0])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/products/{a.pk}/recommendations/', HTTP_HOST='localhost')
+        self.assertEqual(
+            [(row['id'], row['orders']) for row in response.json()['results']],
+            [(b.pk, 2), (d.pk, 2), (c.pk, 1)],
+        )
+
+
+class MediaCollectorTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.quarantine = os.path.join(self.root, '.quarantine')
+        media = override_settings(MEDIA_ROOT=self.root, MEDIA_QUARANTINE_ROOT=self.quarantine)
+        media.enable()
+        self.addCleanup(media.disable)
+        category = Category.objects.create(name='Category')
+        self.product = Product.objects.create(name='Loaf', category=category)
+
+    def write(self, name, age=7200):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'image')
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    def present(self, root):
+        names = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [name for name in dirnames if os.path.join(dirpath, name) != self.quarantine]
+            names += [os.path.relpath(os.path.join(dirpath, name), root) for name in filenames]
+        return sorted(names)
+
+    def collect(self, *args):
+        call_command('collect_media', *args, stdout=StringIO())
+
+    def test_orphans_are_quarantined_then_deleted(self):
+        kept = ['blobs/aa/aa11.png', 'products/legacy.png', 'thumbnails/100/blobs/aa/aa11.jpg', 'catalog/manifest.json']
+        orphans = ['blobs/bb/bb22.png', 'blobs/tmp/upload-crashed', 'thumbnails/100/blobs/bb/bb22.jpg']
+        for name in kept + orphans:
+            self.write(name)
+        self.write('blobs/cc/cc33.png', age=0)
+        for name in ('blobs/aa/aa11.png', 'products/legacy.png'):
+            ProductImage.objects.create(product=self.product, image=name)
+
+        self.collect('--dry-run')
+        self.assertEqual(len(self.present(self.root)), 8)
+        self.collect()
+        self.assertEqual(self.present(self.root), sorted(kept + ['blobs/cc/cc33.png']))
+        self.assertEqual(self.present(self.quarantine), sorted(orphans))
+
+        # Referenced again while quarantined: put back rather than deleted
+        ProductImage.objects.create(product=self.product, image='blobs/bb/bb22.png')
+        self.collect('--quarantine-seconds', '0')
+        self.assertIn('blobs/bb/bb22.png', self.present(self.root))
+        self.assertIn('thumbnails/100/blobs/bb/bb22.jpg', self.present(self.root))
+        self.assertEqual(self.present(self.quarantine), [])
+
+    def test_uploading_existing_content_restarts_grace_period(self):
+        storage = ContentAddressedStorage(location=self.root)
+        name = storage.save('first.png', ContentFile(b'image'))
+        os.utime(storage.path(name), (time.time() - 7200, time.time() - 7200))
+        # Same content again, its row not yet committed when the collector runs
+        self.assertEqual(storage.save('second.png', ContentFile(b'image')), name)
+        self.collect()
+        self.assertEqual(self.present(self.root), [name])
+
+    def test_file_touched_after_scan_is_not_quarantined(self):
+        self.write('blobs/bb/bb22.png')
+
+        def reuploaded_during_scan(*args, **kwargs):
+            for name, size in find_orphans(*args, **kwargs):
+                os.utime(os.path.join(self.root, name))
+                yield name, size
+
+        with mock.patch('flaky_fantasy_backend_api.media_gc.find_orphans', side_effect=reuploaded_during_scan):
+            self.collect()
+        self.assertEqual(self.present(self.root), ['blobs/bb/bb22.png'])
+        self.assertEqual(self.present(self.quarantine), [])
+
+
+class ContentAddressedMediaTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        media = override_settings(MEDIA_ROOT=self.root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.product = Product.objects.create(name='Loaf', category=Category.objects.create(name='Category'))
+
+    def blobs(self):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, name), self.root)
+            for dirpath, dirnames, filenames in os.walk(os.path.join(self.root, BLOB_DIR))
+            for name in filenames if os.path.basename(dirpath) != 'tmp'
+        )
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def test_duplicate_uploads_share_a_blob_that_delete_leaves(self):
+        first, second = [
+            ProductImage.objects.create(product=self.product, image=ContentFile(b'same image', name=name))
+            for name in ('front.PNG', 'copy-of-front.png')
+        ]
+        other = ProductImage.objects.create(product=self.product, image=ContentFile(b'other image', name='back.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.blobs(), sorted([first.image.name, other.image.name]))
+
+        # Still referenced by the second row; the media collector decides when a blob goes
+        first.image.delete(save=False)
+        first.delete()
+        self.assertEqual(self.blobs(), sorted([second.image.name, other.image.name]))
+
+    def test_rehash_media_repoints_rows_and_is_idempotent(self):
+        self.write('products/a.png', b'same image')
+        self.write('products/b.png', b'same image')
+        self.write('services/icons/c.png', b'icon')
+        for name in ('products/a.png', 'products/a.png', 'products/b.png', 'products/gone.png'):
+            ProductImage.objects.create(product=self.product, image=name)
+        service = Service.objects.create(name='Delivery', description='-', icon='services/icons/c.png')
+
+        out, err = StringIO(), StringIO()
+        call_command('rehash_media', '--remove-originals', stdout=out, stderr=err)
+        self.assertIn('Moved 3 files into blobs (1 duplicates', out.getvalue())
+        self.assertIn('products/gone.png', err.getvalue())
+        images = list(ProductImage.objects.order_by('id').values_list('image', flat=True))
+        self.assertEqual(len(set(images[:3])), 1)
+        self.assertEqual(images[3], 'products/gone.png')
+        service.refresh_from_db()
+        self.assertEqual(self.blobs(), sorted([images[0], service.icon.name]))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'products', 'a.png')))
+        with open(os.path.join(self.root, images[0]), 'rb') as f:
+            self.assertEqual(f.read(), b'same image')
+
+        out = StringIO()
+        call_command('rehash_media', stdout=out, stderr=StringIO())
+        self.assertIn('Moved 0 files into blobs (0 duplicates, 0.0 MiB saved), 1 missing', out.getvalue())
+        self.assertEqual(list(ProductImage.objects.order_by('id').values_list('image', flat=True)), images)
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        # Fresh counters for each test
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        self.state_path = os.path.join(state_dir, 'throttle')
+        state = override_settings(THROTTLE_STATE_PATH=self.state_path)
+        state.enable()
+        self.addCleanup(state.disable)
+
+    def rates(self, **rates):
+        patcher = mock.patch.dict(SimpleRateThrottle.THROTTLE_RATES, rates)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_allows_a_burst_then_refills(self):
+        buckets = SharedBuckets(self.state_path, 64)
+        self.addCleanup(buckets.close)
+        # 3 per minute: a burst of 3, then one every 20 seconds
+        self.assertEqual([buckets.hit('key', 3, 60, now=1000) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(buckets.hit('key', 3, 60, now=1000), 20)
+        self.assertAlmostEqual(buckets.hit('key', 3, 60, now=1015), 5)
+        self.assertEqual(buckets.hit('key', 3, 60, now=1020), 0)
+        self.assertAlmostEqual(buckets.hit('key', 3, 60, now=1020), 20)
+        self.assertEqual(buckets.hit('other', 3, 60, now=1020), 0)
+        # Idle for long: the bucket refills to the burst size and no further
+        self.assertEqual([buckets.hit('key', 3, 60, now=2000) for _ in range(3)], [0, 0, 0])
+        self.assertGreater(buckets.hit('key', 3, 60, now=2000), 0)
+
+    def test_login_is_limited_per_username_across_ips(self):
+        self.rates(login_username='2/min')
+
+        def login(username, ip):
+            return self.client.post(
+                '/api/auth/login/', {'username': username, 'password': 'wrong'}, REMOTE_ADDR='10.0.0.1',
+                HTTP_X_FORWARDED_FOR=ip, HTTP_HOST='localhost',
+            )
+
+        self.assertNotEqual(login('Alice', '203.0.113.1').status_code, 429)
+        self.assertNotEqual(login(' alice ', '203.0.113.2').status_code, 429)
+        response = login('ALICE', '203.0.113.3')
+        self.assertEqual(response.status_code, 429)
+        # Two a minute: the next attempt is allowed in 30 seconds
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertNotEqual(login('bob', '203.0.113.3').status_code, 429)
+
+    def test_route_throttle_uses_action_scope(self):
+        self.rates(export='1/min')
+        client = APIClient()
+        client.force_authenticate(AdminUser.objects.create_user(username='staff', password='pw', is_staff=True))
+        self.assertEqual(client.get('/api/orders/export_csv/', HTTP_HOST='localhost').status_code, 200)
+        response = client.get('/api/orders/export_csv/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        # The viewset's other actions have no route scope
+        self.assertEqual(client.get('/api/orders/', HTTP_HOST='localhost').status_code, 200)
+
+
+@override_settings(EVENTS_POLL_SECONDS=0.01, EVENTS_BUFFER_SIZE=3)
+class EventStreamTests(TransactionTestCase):
+    # The feed reads through sync_to_async and closes old connections, which
+    # TestCase's per-test transaction doesn't survive. Ids restart for each
+    # test, or the feed would wait out the gap left by the previous one.
+    reset_sequences = True
+
+    def setUp(self):
+        self.user = AdminUser.objects.create_user(username='staff', password='staff-password', is_staff=True)
+        self.token = str(AccessToken.for_user(self.user))
+        self.feed = events.ChangeFeed()
+        patcher = mock.patch.object(events, 'feed', self.feed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def notify(self, count):
+        return [
+            Notification.objects.create(recipient=self.user, notification_type='system', title=f'N{i}', message='-')
+            for i in range(count)
+        ]
+
+    async def listen(self, count):
+        # Another dashboard keeps the poller running until it has seen ``count`` new events
+        listener, _ = await self.feed.subscribe(self.user.pk)
+        created = await sync_to_async(self.notify)(count)
+        while self.feed.position[events.NOTIFICATION] != created[-1].pk:
+            await asyncio.sleep(0.01)
+        return listener, created
+
+    async def stop(self, listener):
+        self.feed.unsubscribe(listener)
+        await self.feed.task
+
+    async def connect(self, last_event_id):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': settings.EVENTS_PATH, 'query_string': b'', 'headers': [
+            (b'authorization', f'Bearer {self.token}'.encode()), (b'last-event-id', last_event_id.encode()),
+        ]}
+        await events.EventStreamApp()(scope, receive, send)
+        self.assertEqual(sent[0]['status'], 200)
+        return b''.join(message.get('body', b'') for message in sent[1:]).decode()
+
+    def test_late_commit_is_held_back(self):
+        start = events.latest_position()
+        first, late, last = self.notify(3)
+        # ``late`` has its id but hasn't committed yet
+        late_id = late.pk
+        late.delete()
+        fetched, more = events.fetch_events(start, 10)
+        self.assertEqual([event.source_id for event in fetched], [first.pk])
+        self.assertFalse(more)
+        Notification.objects.create(
+            pk=late_id, recipient=self.user, notification_type='system', title='Late', message='-',
+        )
+        fetched, _ = events.fetch_events(fetched[-1].position, 10)
+        self.assertEqual([event.source_id for event in fetched], [late_id, last.pk])
+
+        # A gap older than the settle window is a rollback, not a late commit
+        Notification.objects.filter(pk=late_id).delete()
+        settled = timezone.now() + timedelta(seconds=settings.EVENTS_SETTLE_SECONDS + 1)
+        fetched, _ = events.fetch_events(start, 10, now=settled)
+        self.assertEqual([event.source_id for event in fetched], [first.pk, last.pk])
+
+    @override_settings(EVENTS_SETTLE_SECONDS=30)
+    def test_rollback_holds_back_only_its_source_for_the_settle_window(self):
+        start = events.latest_position()
+        first, rolled_back, *later = self.notify(4)
+        rolled_back.delete()
+        order = Order.objects.create(
+            order_number='ORD-1', customer_name='Customer', customer_email='c@example.com',
+            customer_phone='+234 700 000 0000', shipping_address='Address', total_amount=10,
+        )
+
+        now = timezone.now()
+        fetched, _ = events.fetch_events(start, 10, now=now + timedelta(seconds=29))
+        self.assertEqual([(event.kind, event.source_id) for event in fetched], [
+            (events.NOTIFICATION, first.pk), (events.ORDER_CREATED, order.pk),
+        ])
+        fetched, _ = events.fetch_events(fetched[-1].position, 10, now=now + timedelta(seconds=31))
+        self.assertEqual([event.source_id for event in fetched], [row.pk for row in later])
+
+    async def test_resume_replays_events_after_last_event_id(self):
+        listener, created = await self.listen(3)
+        body = await self.connect(events.format_position(self.feed.buffer[0].position))
+        await self.stop(listener)
+        self.assertNotIn('event: reset', body)
+        self.assertEqual(body.count('event: notification'), len(created) - 1)
+        self.assertNotIn('"title": "N0"', body)
+        self.assertIn('"title": "N2"', body)
+
+    async def test_resume_past_evicted_events_is_told_to_reset(self):
+        listener, _ = await self.listen(5)
+        evicted = self.feed.evicted[events.NOTIFICATION]
+        since = list(self.feed.buffer[0].position)
+        since[events.NOTIFICATION] = evicted - 1
+        missed = await self.connect(events.format_position(since))
+        # Resuming from the last evicted event still replays the whole buffer
+        since[events.NOTIFICATION] = evicted
+        replayed = await self.connect(events.format_position(since))
+        await self.stop(listener)
+        self.assertIn('event: reset', missed)
+        self.assertNotIn('event: notification', missed)
+        self.assertEqual(replayed.count('event: notification'), settings.EVENTS_BUFFER_SIZE)
+
+
+@skipUnless(getattr(settings, 'DATABASE_REPLICAS', None), 'No replica database configured')
+class ReplicaRoutingTests(TransactionTestCase):
+    # TestCase would wrap each test in a transaction, which pins reads to the primary
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        caches['replica_pins'].clear()
+        self.replica = settings.DATABASE_REPLICAS[0]
+        Category.objects.using('default').create(name='On primary')
+        Category.objects.using(self.replica).create(name='On replica')
+
+    def tearDown(self):
+        db_router._down_until.clear()
+
+    def names(self, client, **extra):
+        response = client.get('/api/categories/', HTTP_HOST='localhost', **extra)
+        return {row['name'] for row in response.json()['results']}
+
+    def test_safe_reads_use_replica(self):
+        self.assertEqual(self.names(self.client), {'On replica'})
+
+    def test_reads_stick_to_primary_after_write(self):
+        response = self.client.post('/api/categories/', {'name': 'Just written'}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.names(self.client), {'On primary', 'Just written'})
+
+    def test_rejected_write_does_not_pin(self):
+        response = self.client.post('/api/categories/', {'name': ''}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.names(self.client), {'On replica'})
+
+    def test_anonymous_clients_are_pinned_by_forwarded_ip(self):
+        # Both clients reach us through the same proxy; neither keeps cookies
+        writer, other = APIClient(REMOTE_ADDR='10.0.0.1'), APIClient(REMOTE_ADDR='10.0.0.1')
+        response = writer.post(
+            '/api/categories/', {'name': 'Just written'}, HTTP_HOST='localhost', HTTP_X_FORWARDED_FOR='203.0.113.7',
+        )
+        self.assertEqual(response.status_code, 201)
+        writer.cookies.clear()
+        self.assertEqual(
+            self.names(writer, HTTP_X_FORWARDED_FOR='203.0.113.7'), {'On primary', 'Just written'},
+        )
+        self.assertEqual(self.names(other, HTTP_X_FORWARDED_FOR='198.51.100.2'), {'On replica'})
+
+    def test_cart_quote_reads_replica_without_pinning(self):
+        category = Category.objects.using(self.replica).get(name='On replica')
+        hat = Product.objects.using(self.replica).create(name='Hat', price='19.99', category=category)
+        response = self.client.post(
+            '/api/cart/quote/', {'items': [{'product': hat.pk, 'quantity': 1}]},
+            content_type='application/json', HTTP_HOST='localhost',
+        )
+        self.assertEqual(response.json()['total'], '19.99')
+        self.assertEqual(self.names(self.client), {'On replica'})
+
+    def test_read_only_batch_does_not_pin(self):
+        results = self.client.post('/api/batch/', {'requests': [
+            {'path': '/api/categories/'}, {'path': '/api/categories/'},
+        ]}, content_type='application/json', HTTP_HOST='localhost').json()['responses']
+        self.assertEqual(
+            [[row['name'] for row in result['body']['results']] for result in results], [['On replica']] * 2,
+        )
+        self.assertEqual(self.names(self.client), {'On replica'})
+
+    def test_batched_writes_pin_only_when_they_succeed(self):
+        def batch(*requests):
+            return self.client.post(
+                '/api/batch/', {'requests': list(requests)}, content_type='application/json', HTTP_HOST='localhost',
+            ).json()['responses']
+
+        rejected, = batch({'method': 'POST', 'path': '/api/categories/', 'body': {'name': ''}})
+        self.assertEqual(rejected['status'], 400)
+        self.assertEqual(self.names(self.client), {'On replica'})
+
+        # The write pins through the sub-request's middleware, so the read after it sees it
+        created, listed = batch(
+            {'method': 'POST', 'path': '/api/categories/', 'body': {'name': 'Batched'}}, {'path': '/api/categories/'},
+        )
+        self.assertEqual(created['status'], 201)
+        self.assertEqual({row['name'] for row in listed['body']['results']}, {'On primary', 'Batched'})
+        self.assertEqual(self.names(self.client), {'On primary', 'Batched'})
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        with mock.patch.object(connections[self.replica], 'ensure_connection', side_effect=OperationalError):
+            self.assertEqual(self.names(self.client), {'On primary'})
+        self.assertIn(self.replica, db_router._down_until)
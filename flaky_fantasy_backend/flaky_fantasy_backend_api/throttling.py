@@ -0,0 +1,199 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+# One slot per client key: 64-bit key hash and the GCRA "theoretical arrival
+# time". A slot whose time has passed is a full bucket and may be reused.
+SLOT = struct.Struct('=Qd')
+# Slots tried from the key's home slot before the closest-to-full one is evicted
+PROBES = 8
+
+
+def default_state_path():
+    # /dev/shm keeps the file in memory; every worker on the host maps the same one
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'flaky-fantasy-throttle')
+
+
+class SharedBuckets:
+    """
+    Token buckets in a memory-mapped file shared by every process on the host.
+    Each check hashes the key, locks that key's probe range with a byte-range
+    lock, and reads and writes a 16-byte slot; there is no server to call.
+    """
+
+    def __init__(self, path, slots):
+        self.slots = slots
+        size = SLOT.size * (slots + PROBES)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self.fd = fd
+        self.map = mmap.mmap(fd, size)
+        # fcntl locks only exclude other processes; threads take this first
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, period, now=None):
+        """
+        Take one token from ``key``'s bucket, which holds ``limit`` tokens and
+        refills them over ``period`` seconds. Returns 0 when allowed, otherwise
+        the seconds until a token is available.
+        """
+        now = time.time() if now is None else now
+        interval = period / limit
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        start = (key_hash % self.slots) * SLOT.size
+        span = SLOT.size * PROBES
+
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, span, start)
+            try:
+                offset, arrival = self._find_slot(key_hash, start, now)
+                arrival = max(arrival, now) + interval
+                wait = arrival - now - period
+                if wait > 0:
+                    return wait
+                SLOT.pack_into(self.map, offset, key_hash, arrival)
+                return 0
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, span, start)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def _find_slot(self, key_hash, start, now):
+        # Returns (offset, stored arrival time); a new key starts with a full bucket
+        free = None
+        oldest = None
+        for offset in range(start, start + SLOT.size * PROBES, SLOT.size):
+            slot_hash, arrival = SLOT.unpack_from(self.map, offset)
+            if slot_hash == key_hash:
+                return offset, arrival
+            if free is None and (slot_hash == 0 or arrival <= now):
+                free = offset
+            if oldest is None or arrival < oldest[1]:
+                oldest = (offset, arrival)
+        return (free if free is not None else oldest[0]), 0.0
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def shared_buckets():
+    global _buckets
+    with _buckets_lock:
+        if _buckets is None:
+            _buckets = SharedBuckets(
+                getattr(settings, 'THROTTLE_STATE_PATH', None) or default_state_path(),
+                getattr(settings, 'THROTTLE_SLOTS', 65536),
+            )
+    return _buckets
+
+
+@receiver(setting_changed)
+def reset_shared_buckets(setting, **kwargs):
+    # Tests point THROTTLE_STATE_PATH at a file of their own
+    global _buckets
+    if setting in ('THROTTLE_STATE_PATH', 'THROTTLE_SLOTS'):
+        with _buckets_lock:
+            if _buckets is not None:
+                _buckets.close()
+            _buckets = None
+
+
+class SharedRateThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle with its counters in shared_buckets() instead of the
+    cache, so every worker process enforces one limit per client. Rates come
+    from DEFAULT_THROTTLE_RATES as usual; DRF answers 429 with Retry-After.
+    """
+    retry_after = 0
+
+    def allow_request(self, request, view):
+        if self.rate is None or not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        self.retry_after = shared_buckets().hit(key, self.num_requests, self.duration)
+        return self.retry_after == 0
+
+    def wait(self):
+        return self.retry_after
+
+    def client_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user-{request.user.pk}'
+        return self.get_ident(request)
+
+
+class AnonThrottle(SharedRateThrottle):
+    # Per IP, for every request from a client that isn't signed in
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class AnonWriteThrottle(AnonThrottle):
+    # Tighter per-IP limit on anonymous writes
+    scope = 'anon_write'
+
+    def get_cache_key(self, request, view):
+        if request.method in SAFE_METHODS:
+            return None
+        return super().get_cache_key(request, view)
+
+
+class UserThrottle(SharedRateThrottle):
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.user.pk}
+
+
+class RouteThrottle(SharedRateThrottle):
+    """Per-route policy: views (or actions) set ``throttle_scope``, limited per user or IP."""
+
+    def __init__(self):
+        # The rate depends on the view, so it's looked up in allow_request
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.client_ident(request)}
+
+
+class LoginUsernameThrottle(SharedRateThrottle):
+    # Attempts against one account from any number of IPs
+    scope = 'login_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not isinstance(username, str) or not username:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': username.strip().lower()}
@@ -0,0 +1,62 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+THUMBNAIL_DIR = 'thumbnails'
+# Sizes the admin shows: the product changelist column and the image inline
+THUMBNAIL_SIZES = (50, 100)
+
+
+def thumbnail_name(field_file, size):
+    root, _ = os.path.splitext(field_file.name)
+    return f'{THUMBNAIL_DIR}/{size}/{root}.jpg'
+
+
+def thumbnail_url(field_file, size=100):
+    """
+    URL of the stored thumbnail of ``field_file``, or None if it hasn't been
+    made yet. Only looks the file up, so it is cheap enough for changelists.
+    """
+    if not field_file:
+        return None
+    # Thumbnails live in plain media storage; the source may be a shared blob
+    name = thumbnail_name(field_file, size)
+    return default_storage.url(name) if default_storage.exists(name) else None
+
+
+def make_thumbnails(field_file, sizes=THUMBNAIL_SIZES):
+    """
+    Store small JPEG renditions of ``field_file`` in each of ``sizes`` that
+    doesn't exist yet. Returns the number written; an unreadable source
+    writes none.
+    """
+    if not field_file:
+        return 0
+    missing = [size for size in sizes if not default_storage.exists(thumbnail_name(field_file, size))]
+    if not missing:
+        return 0
+    try:
+        with field_file.open('rb') as source, Image.open(source) as image:
+            image.load()
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            renditions = []
+            for size in missing:
+                thumb = image.copy()
+                thumb.thumbnail((size, size))
+                buffer = BytesIO()
+                thumb.save(buffer, 'JPEG', quality=80, optimize=True)
+                renditions.append((size, buffer.getvalue()))
+    except (OSError, ValueError):
+        return 0
+    for size, content in renditions:
+        default_storage.save(thumbnail_name(field_file, size), ContentFile(content))
+    return len(renditions)
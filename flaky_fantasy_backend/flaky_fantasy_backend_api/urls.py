@@ -5,9 +5,9 @@ from .views import (
     AdminLoginView, AdminProfileView,
     ProductViewSet, CategoryViewSet, ProductLabelViewSet,
     DiscountCodeViewSet, ProductDiscountViewSet,
-    OrderViewSet, OrderItemViewSet,
-    ServiceViewSet, ProductImageViewSet,
-    HealthView,
+    OrderViewSet, OrderItemViewSet, ArchivedOrderViewSet,
+    ServiceViewSet, ProductImageViewSet, StockMovementViewSet,
+    BatchView, CartQuoteView, AutocompleteView, HealthView,
 )
 
 router = DefaultRouter()
@@ -19,12 +19,17 @@ router.register(r'discount-codes', DiscountCodeViewSet)
 router.register(r'product-discounts', ProductDiscountViewSet)
 router.register(r'orders', OrderViewSet)
 router.register(r'order-items', OrderItemViewSet)
+router.register(r'archived-orders', ArchivedOrderViewSet)
 router.register(r'services', ServiceViewSet)
+router.register(r'stock-movements', StockMovementViewSet)
 
 urlpatterns = [
     path('auth/login/', AdminLoginView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/profile/', AdminProfileView.as_view()),
     path('health/', HealthView.as_view(), name='health'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('cart/quote/', CartQuoteView.as_view(), name='cart_quote'),
+    path('autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -3,24 +3,47 @@ from rest_framework.views import APIView
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from django.contrib.auth import authenticate
-from rest_framework import viewsets, filters, status, permissions
+from rest_framework import viewsets, filters, status, permissions, mixins
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db.models import Count, Max, Min, Prefetch, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .models import (
     AdminUser, Category, ProductLabel, Product, ProductImage,
-    DiscountCode, ProductDiscount, Order, OrderItem, Service, Notification
+    DiscountCode, ProductDiscount, Order, OrderItem, Service, Notification,
+    ArchivedOrder, StockMovement
 )
 from .serializers import (
     AdminUserSerializer, CategorySerializer, ProductLabelSerializer, ProductSerializer, ProductImageSerializer,
-    DiscountCodeSerializer, ProductDiscountSerializer, HealthSerializer,OrderSerializer, OrderItemSerializer, ServiceSerializer, NotificationSerializer
+    DiscountCodeSerializer, ProductDiscountSerializer, HealthSerializer,OrderSerializer, OrderItemSerializer, ServiceSerializer, NotificationSerializer,
+    OrderStatusHistorySerializer, BulkOrderStatusSerializer, ArchivedOrderSerializer, BatchSerializer,
+    CartQuoteRequestSerializer, StockMovementSerializer,
 )
+from .order_status import bulk_transition_orders, record_status_change
+from .conditional import ConditionalGetMixin
+from .sync import DeltaSyncMixin
+from .batch import run_batch
+from .normalize import normalize_email, normalize_phone
+from .order_lookup import OrderLookupFilter
+from .row_serializers import RowListMixin, RowSerializer
+from .throttling import AnonWriteThrottle, LoginUsernameThrottle
+from .inventory import InsufficientStock, record_movements, set_stock, stock_levels
+from .autocomplete import autocomplete_index
+from .recommendations import recommendations_for
+from .quotes import cached_quote, merge_lines
+from flaky_fantasy_backend.db_router import replica_reads_allowed
+from flaky_fantasy_backend.middleware import ReplicaRoutingMiddleware
 import csv
 from django.http import HttpResponse
 
 class AdminLoginView(TokenObtainPairView):
     permission_classes = [permissions.AllowAny]
+    # Throttled per IP and per username before the password hash runs
+    throttle_scope = 'login'
+    throttle_classes = [*APIView.throttle_classes, LoginUsernameThrottle]
     
     def post(self, request, *args, **kwargs):
         try:
@@ -78,8 +101,12 @@ class AdminProfileView(viewsets.generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductViewSet(DeltaSyncMixin, ConditionalGetMixin, RowListMixin, viewsets.ModelViewSet):
+    # Nested rows in id order, the same order RowListMixin's list pages use
+    queryset = Product.objects.select_related('category').prefetch_related(
+        Prefetch('images', queryset=ProductImage.objects.order_by('id')),
+        Prefetch('labels', queryset=ProductLabel.objects.order_by('id')),
+    )
     serializer_class = ProductSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'in_stock', 'labels']
@@ -95,11 +122,49 @@ class ProductViewSet(viewsets.ModelViewSet):
         product = self.get_object()
         quantity = request.data.get('quantity')
         if quantity is not None:
-            product.stock_quantity = quantity
-            product.save()
+            try:
+                quantity = int(quantity)
+            except (TypeError, ValueError):
+                return Response({'error': 'quantity must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            if quantity < 0:
+                return Response({'error': 'quantity cannot be negative'}, status=status.HTTP_400_BAD_REQUEST)
+            set_stock(product, quantity, request.user, note=str(request.data.get('note', ''))[:255])
             return Response({'status': 'stock updated'})
         return Response({'error': 'quantity not provided'}, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=True, methods=['get'])
+    def stock(self, request, pk=None):
+        # Ledger stock now or as of ?at=, next to the cached stock_quantity
+        if not request.user.is_authenticated:
+            return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+        
+        product = self.get_object()
+        at = None
+        if request.query_params.get('at'):
+            at = parse_datetime(request.query_params['at'])
+            if at is None:
+                return Response({'error': 'at must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+        quantity, snapshot_as_of, tail = stock_levels([product.pk], at)[product.pk]
+        return Response({
+            'product': product.pk,
+            'at': at or timezone.now(),
+            'quantity': quantity,
+            'stock_quantity': product.stock_quantity,
+            'snapshot_as_of': snapshot_as_of,
+            'movements_since_snapshot': tail,
+        })
+    
+    @action(detail=True, methods=['get'])
+    def recommendations(self, request, pk=None):
+        # Precomputed by build_recommendations; no get_object(), so one query
+        try:
+            product_id = int(pk)
+        except ValueError:
+            return Response({'error': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'product': product_id, 'results': recommendations_for(product_id)})
+    
     @action(detail=True, methods=['post'])
     def set_primary_image(self, request, pk=None):
         if not request.user.is_authenticated:
@@ -139,17 +204,44 @@ class ProductImageViewSet(viewsets.ModelViewSet):
         
         serializer.save(product=product)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class StockMovementViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                           viewsets.GenericViewSet):
+    # Append-only: movements are listed and recorded, never edited or deleted
+    queryset = StockMovement.objects.order_by('-id')
+    serializer_class = StockMovementSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['product', 'kind', 'order']
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def create(self, request, *args, **kwargs):
+        # A list body records the whole batch in one transaction
+        many = isinstance(request.data, list)
+        if many and len(request.data) > getattr(settings, 'STOCK_MOVEMENT_MAX_BATCH', 1000):
+            return Response({'error': 'Too many movements in one request'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(data=request.data, many=many)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data if many else [serializer.validated_data]
+        try:
+            created = record_movements([StockMovement(**item) for item in items], request.user)
+        except InsufficientStock as error:
+            return Response(
+                {'error': str(error), 'in_stock': {str(pk): units for pk, units in error.shortages.items()}},
+                status=status.HTTP_409_CONFLICT,
+            )
+        data = self.get_serializer(created, many=True).data
+        return Response(data if many else data[0], status=status.HTTP_201_CREATED)
+
+class CategoryViewSet(DeltaSyncMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
-class ProductLabelViewSet(viewsets.ModelViewSet):
+class ProductLabelViewSet(DeltaSyncMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = ProductLabel.objects.all()
     serializer_class = ProductLabelSerializer
     permission_classes = [permissions.AllowAny]
 
-class DiscountCodeViewSet(viewsets.ModelViewSet):
+class DiscountCodeViewSet(DeltaSyncMixin, viewsets.ModelViewSet):
     queryset = DiscountCode.objects.all()
     serializer_class = DiscountCodeSerializer
     permission_classes = [permissions.AllowAny]
@@ -164,7 +256,7 @@ class DiscountCodeViewSet(viewsets.ModelViewSet):
         discount.save()
         return Response({'status': 'discount toggled', 'is_active': discount.is_active})
 
-class ProductDiscountViewSet(viewsets.ModelViewSet):
+class ProductDiscountViewSet(DeltaSyncMixin, viewsets.ModelViewSet):
     queryset = ProductDiscount.objects.all()
     serializer_class = ProductDiscountSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -176,15 +268,68 @@ class ProductDiscountViewSet(viewsets.ModelViewSet):
         discount.save()
         return Response({'status': 'discount toggled', 'is_active': discount.is_active})
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderViewSet(DeltaSyncMixin, ConditionalGetMixin, RowListMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('id')),
+    )
     serializer_class = OrderSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['order_number', 'customer_name', 'customer_email']
+    # ?search= goes through the indexed lookup columns instead of ILIKE scans
+    filter_backends = [DjangoFilterBackend, OrderLookupFilter, filters.OrderingFilter]
+    filterset_fields = ['status']
     ordering_fields = ['created_at', 'total_amount', 'status']
     permission_classes = [permissions.IsAuthenticated]
+    # Set per action (export_csv) for RouteThrottle
+    throttle_scope = None
+    
+    def perform_update(self, serializer):
+        from_status = serializer.instance.status
+        order = serializer.save()
+        record_status_change(order, from_status, self.request.user)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_transition(self, request):
+        serializer = BulkOrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk_transition_orders(
+            serializer.validated_data['order_ids'],
+            serializer.validated_data['status'],
+            user=request.user,
+        )
+        updated = sum(1 for result in results if result['ok'])
+        return Response({
+            'updated': updated,
+            'failed': len(results) - updated,
+            'results': results,
+        })
+    
+    @action(detail=True, methods=['get'])
+    def status_history(self, request, pk=None):
+        order = self.get_object()
+        history = order.status_history.select_related('changed_by')
+        return Response(OrderStatusHistorySerializer(history, many=True).data)
     
     @action(detail=False, methods=['get'])
+    def customer(self, request):
+        # One customer's orders, newest first, keyed by email or phone
+        if request.query_params.get('email'):
+            orders = Order.objects.filter(email_normalized=normalize_email(request.query_params['email']))
+        elif normalize_phone(request.query_params.get('phone')):
+            orders = Order.objects.filter(phone_normalized=normalize_phone(request.query_params['phone']))
+        else:
+            return Response({'error': 'email or phone required'}, status=status.HTTP_400_BAD_REQUEST)
+        summary = orders.aggregate(
+            order_count=Count('id'),
+            total_spent=Sum('total_amount'),
+            first_order_at=Min('created_at'),
+            last_order_at=Max('created_at'),
+        )
+        reader = RowSerializer.for_serializer(self.get_serializer_class())
+        page = self.paginate_queryset(reader.values(orders.order_by('-created_at')))
+        response = self.get_paginated_response(reader.serialize(page, self.get_serializer_context()))
+        response.data['customer'] = summary
+        return response
+    
+    @action(detail=False, methods=['get'], throttle_scope='export')
     def export_csv(self, request):
         response = HttpResponse(content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="orders.csv"'
@@ -195,25 +340,31 @@ class OrderViewSet(viewsets.ModelViewSet):
             'Status', 'Total Amount', 'Created At'
         ])
         
-        orders = Order.objects.all()
-        for order in orders:
-            writer.writerow([
-                order.order_number,
-                order.customer_name,
-                order.customer_email,
-                order.status,
-                order.total_amount,
-                order.created_at.strftime("%Y-%m-%d %H:%M:%S")
-            ])
+        columns = ['order_number', 'customer_name', 'customer_email', 'status', 'total_amount', 'created_at']
+        querysets = [Order.objects.all()]
+        if request.query_params.get('include_archived') in ('true', '1'):
+            querysets.append(ArchivedOrder.objects.all())
+        for queryset in querysets:
+            for row in queryset.order_by().values_list(*columns).iterator(chunk_size=2000):
+                writer.writerow(row[:-1] + (row[-1].strftime("%Y-%m-%d %H:%M:%S"),))
         
         return response
 
+class ArchivedOrderViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ArchivedOrder.objects.prefetch_related('items__product').order_by('-created_at')
+    serializer_class = ArchivedOrderSerializer
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = ['status']
+    search_fields = ['=order_number', 'customer_email']
+    ordering_fields = ['created_at', 'archived_at', 'total_amount']
+    permission_classes = [permissions.IsAuthenticated]
+
 class OrderItemViewSet(viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(DeltaSyncMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
     permission_classes = [permissions.AllowAny]
@@ -264,6 +415,49 @@ class NotificationViewSet(viewsets.ModelViewSet):
         return Response({'status': 'alerts sent'})
   
 
+class BatchView(APIView):
+    # Sub-requests are checked against their own views' permissions and throttles
+    permission_classes = [permissions.AllowAny]
+    throttle_scope = 'batch'
+    
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Each sub-request is routed to a replica or the primary by its own method
+        return run_batch(request, serializer.validated_data['requests'])
+
+class CartQuoteView(APIView):
+    permission_classes = [permissions.AllowAny]
+    throttle_scope = 'quote'
+    # A quote writes nothing, so the anonymous write limit doesn't apply
+    throttle_classes = [cls for cls in APIView.throttle_classes if cls is not AnonWriteThrottle]
+
+    def post(self, request):
+        # Only reads: route like a GET and don't pin the client to the primary
+        request._request.replica_pin_exempt = True
+        serializer = CartQuoteRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = merge_lines(serializer.validated_data['items'])
+        token = replica_reads_allowed.set(ReplicaRoutingMiddleware.replica_eligible(request))
+        try:
+            return Response(cached_quote(lines, serializer.validated_data.get('code')))
+        finally:
+            replica_reads_allowed.reset(token)
+
+class AutocompleteView(APIView):
+    # Type-ahead from the in-process index; ?search= on products stays for full results
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 8))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        index = autocomplete_index()
+        index.ensure_current()
+        query = request.query_params.get('q', '')
+        return Response({'query': query, **index.suggest(query, limit)})
+
 class HealthView(APIView):
     def get(self, request):
         try:
@@ -0,0 +1,107 @@
+import importlib
+import logging
+import time
+
+from django.db import connections
+from django.db.utils import DatabaseError
+from django.urls import URLPattern, URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Imported lazily on the first request otherwise
+WARM_MODULES = [
+    'rest_framework.views',
+    'rest_framework.viewsets',
+    'rest_framework.renderers',
+    'rest_framework.parsers',
+    'rest_framework.negotiation',
+    'rest_framework.pagination',
+    'rest_framework.metadata',
+    'rest_framework_simplejwt.authentication',
+    'rest_framework_simplejwt.tokens',
+    'django_filters.rest_framework',
+    'PIL.Image',
+    'flaky_fantasy_backend_api.views',
+    'flaky_fantasy_backend_api.admin',
+]
+
+
+def import_modules():
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+
+
+def iter_callbacks(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_callbacks(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern.callback
+
+
+def prime_urls():
+    resolver = get_resolver()
+    # Builds the reverse and namespace dicts, which are otherwise built on first use
+    resolver.reverse_dict
+    resolver.namespace_dict
+    return resolver
+
+
+def prime_serializers(resolver):
+    """Build each API view's serializer fields once, filling Django's model _meta caches."""
+    seen = set()
+    for callback in iter_callbacks(resolver.url_patterns):
+        view_class = getattr(callback, 'cls', None)
+        serializer_class = getattr(view_class, 'serializer_class', None)
+        if serializer_class is None or serializer_class in seen:
+            continue
+        seen.add(serializer_class)
+        try:
+            serializer_class(context={}).fields
+        except Exception:
+            logger.exception('Could not warm %s', serializer_class.__name__)
+    return len(seen)
+
+
+def open_connections():
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Warm-up could not connect to database %r', alias)
+
+
+def build_autocomplete(keep_connections):
+    from .autocomplete import autocomplete_index
+
+    try:
+        # Built here rather than started in the background: threads don't survive a fork
+        autocomplete_index().rebuild()
+    except DatabaseError:
+        logger.warning('Warm-up could not build the autocomplete index')
+    finally:
+        if not keep_connections:
+            connections.close_all()
+
+
+def warm_up(database=True):
+    """
+    Do the one-off work a worker otherwise pays on its first requests.
+    Returns the seconds spent per phase. Leave ``database`` off in a process
+    that forks, so children don't inherit its connections.
+    """
+    timings = {}
+    phases = [
+        ('imports', import_modules),
+        ('url_resolvers', prime_urls),
+        ('serializers', lambda: prime_serializers(get_resolver())),
+        # Built before a fork is shared with every worker; its connection is closed again
+        ('autocomplete', lambda: build_autocomplete(database)),
+    ]
+    if database:
+        phases.append(('db_connections', open_connections))
+    for name, phase in phases:
+        start = time.perf_counter()
+        phase()
+        timings[name] = time.perf_counter() - start
+    return timings
@@ -0,0 +1,39 @@
+import os
+
+bind = '0.0.0.0:8000'
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+worker_tmp_dir = '/dev/shm'
+timeout = 120
+max_requests = 1000
+max_requests_jitter = 100
+
+# Import and warm the app once in the master; every worker, including ones
+# recycled by max_requests, forks from that state instead of starting cold
+preload_app = True
+
+
+def when_ready(server):
+    from flaky_fantasy_backend_api.warmup import warm_up
+
+    # No DB connections here: forked workers must not share the master's sockets
+    timings = warm_up(database=False)
+    server.log.info('Warm-up: %s', ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in timings.items()))
+
+
+def post_fork(server, worker):
+    from flaky_fantasy_backend_api.autocomplete import restart_rebuild_clock
+
+    # The preloaded autocomplete index's age is measured from this fork
+    restart_rebuild_clock()
+
+
+def post_worker_init(worker):
+    from django.db import connections
+    from flaky_fantasy_backend_api.warmup import open_connections
+
+    # ASGI requests run in their own threads and open their own connections;
+    # connecting here still checks the databases and initialises the driver,
+    # TLS and DNS before the worker takes traffic
+    open_connections()
+    connections.close_all()